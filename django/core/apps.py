@@ -6,4 +6,7 @@ class CoreConfig(AppConfig):
     verbose_name = "CoMSES CoRe App"
 
     def ready(self):
-        pass
+        # index changes to searchable models through the incremental indexing queue
+        from . import search_indexing
+
+        search_indexing.register_signal_handlers()
@@ -1,8 +1,18 @@
 import logging
 import re
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
 
 from django.contrib.auth.models import Permission
 from django.core.exceptions import PermissionDenied
+from guardian.backends import (
+    ObjectPermissionBackend,
+    check_object_support,
+    check_user_support,
+)
+from guardian.core import ObjectPermissionChecker
 from guardian.shortcuts import get_perms
 
 from core.queryset import (
@@ -44,7 +54,12 @@ def is_delete_action(perm: str):
     return "delete_" in perm
 
 
+@lru_cache(maxsize=None)
 def get_model(perm):
+    """
+    :return: the model class of the given "app_label.codename" permission, cached for the life of the process
+    since permissions and content types only change with migrations
+    """
     try:
         app_label, codename = perm.split(".")
     except ValueError:
@@ -87,11 +102,101 @@ def has_view_permission(perm, user, obj):
         if published:
             return True
         else:
-            perms = get_perms(user, obj)
+            perms = get_object_perms(user, obj)
             return bool(perms)
     return False
 
 
+class PermissionCache:
+    """
+    Request scoped cache of django-guardian object permissions, see permission_cache()
+
+    Keeps one guardian ObjectPermissionChecker per user so each object's permissions are fetched at most once.
+    Objects registered with add_objects (e.g., the objects on a page of results) have their permissions fetched
+    together in a single query the first time any of them is checked. Only valid while object permissions are not
+    assigned or removed during the request
+    """
+
+    def __init__(self):
+        self.checkers = {}
+        self.pending_objects = defaultdict(dict)
+        self.hits = 0
+        self.misses = 0
+
+    def get_checker(self, user):
+        """
+        :return: the ObjectPermissionChecker for the given user or None if guardian does not support the user,
+        e.g., anonymous users without a configured guardian anonymous user
+        """
+        key = user.pk if user.is_authenticated else None
+        if key not in self.checkers:
+            supported, identity = check_user_support(user)
+            self.checkers[key] = (
+                ObjectPermissionChecker(identity) if supported else None
+            )
+        return self.checkers[key]
+
+    def add_objects(self, objects):
+        for obj in objects:
+            self.pending_objects[type(obj)][obj.pk] = obj
+
+    def get_perms(self, user, obj):
+        checker = self.get_checker(user)
+        if checker is None:
+            return []
+        if checker.get_local_cache_key(obj) in checker._obj_perms_cache:
+            self.hits += 1
+        else:
+            self.misses += 1
+            pending = self.pending_objects[type(obj)]
+            if obj.pk in pending:
+                checker.prefetch_perms(list(pending.values()))
+        return checker.get_perms(obj)
+
+    def has_perm(self, user, perm, obj):
+        checker = self.get_checker(user)
+        if checker is None:
+            return False
+        # populates the checker's cache and counts the lookup
+        self.get_perms(user, obj)
+        return checker.has_perm(perm, obj)
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_permission_cache = ContextVar("permission_cache", default=None)
+
+
+def get_permission_cache():
+    """
+    :return: the active PermissionCache or None outside of permission_cache()
+    """
+    return _permission_cache.get()
+
+
+@contextmanager
+def permission_cache():
+    """
+    Cache object permission checks made within this context, see PermissionCacheMiddleware
+    """
+    token = _permission_cache.set(PermissionCache())
+    try:
+        yield _permission_cache.get()
+    finally:
+        _permission_cache.reset(token)
+
+
+def get_object_perms(user, obj):
+    """
+    :return: the guardian permission codenames the user has on the object, cached if a PermissionCache is active
+    """
+    cache = get_permission_cache()
+    if cache is None:
+        return get_perms(user, obj)
+    return cache.get_perms(user, obj)
+
+
 def has_submitter_permission(user, obj):
     return user == getattr(obj, OWNER_ATTRIBUTE_KEY, None)
 
@@ -142,3 +247,21 @@ class ComsesObjectPermissionBackend:
         else:
             # Unhandled permissions are handled by the next permissions backend
             return False
+
+
+class CachedObjectPermissionBackend(ObjectPermissionBackend):
+    """
+    django-guardian's ObjectPermissionBackend that reuses the active PermissionCache instead of building a new
+    ObjectPermissionChecker (and looking up the anonymous user) on every check
+    """
+
+    def has_perm(self, user_obj, perm, obj=None):
+        cache = get_permission_cache()
+        if cache is None or not check_object_support(obj):
+            return super().has_perm(user_obj, perm, obj)
+        if "." in perm:
+            app_label, _ = perm.split(".", 1)
+            if app_label != obj._meta.app_label:
+                # leave proxy models and mismatched app labels to guardian
+                return super().has_perm(user_obj, perm, obj)
+        return cache.has_perm(user_obj, perm, obj)
@@ -1,3 +1,5 @@
+import errno
+import fcntl
 import imghdr
 import logging
 import mimetypes
@@ -131,6 +133,109 @@ def clean_directory(path):
             os.remove(os.path.join(path, fs.name))
 
 
+def sync_directory(src, dst):
+    """
+    Mirrors the files in src into dst, copying only files that are new or whose size or modification
+    time differ and removing files in dst that no longer exist in src. Modification times are preserved
+    so subsequent syncs of an unchanged src are a stat-only no-op.
+    :return: the number of files copied or removed from dst
+    """
+    src = pathlib.Path(src)
+    dst = pathlib.Path(dst)
+    changes = 0
+    expected = set()
+    for src_path in src.rglob("*"):
+        if not src_path.is_file():
+            continue
+        relpath = src_path.relative_to(src)
+        expected.add(relpath)
+        dst_path = dst.joinpath(relpath)
+        src_stat = src_path.stat()
+        try:
+            dst_stat = dst_path.stat()
+            if (
+                dst_stat.st_size == src_stat.st_size
+                and dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+            ):
+                continue
+        except FileNotFoundError:
+            os.makedirs(dst_path.parent, exist_ok=True)
+        shutil.copy2(src_path, dst_path)
+        changes += 1
+    if dst.exists():
+        # walk bottom up so directories emptied by removals can be pruned as well
+        for dirpath, dirnames, filenames in os.walk(dst, topdown=False):
+            for filename in filenames:
+                dst_path = pathlib.Path(dirpath, filename)
+                if dst_path.relative_to(dst) not in expected:
+                    dst_path.unlink()
+                    changes += 1
+            if dirpath != str(dst) and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+    return changes
+
+
+# linux ioctl for cloning a file's extents (reflink) on copy-on-write filesystems like btrfs and xfs
+FICLONE = 0x40049409
+# errors meaning that a filesystem cannot link the file, e.g., across devices, any other error is raised
+UNSUPPORTED_LINK_ERRORS = {errno.EXDEV, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EPERM}
+# filesystems without reflink support also reject the ioctl itself
+UNSUPPORTED_REFLINK_ERRORS = UNSUPPORTED_LINK_ERRORS | {errno.EINVAL, errno.ENOTTY}
+
+
+def reflink(src, dst):
+    """create dst as a copy-on-write clone of src, raises OSError if the filesystem does not support it"""
+    with open(src, "rb") as src_file, open(dst, "xb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def clone_file(src, dst):
+    """
+    Cheaply duplicates src at dst: reflinks where supported, otherwise hardlinks, falling back to a full copy
+    across filesystems. Hardlinked files share their contents so they must never be modified in place, an existing
+    dst is unlinked rather than overwritten since it may be a hardlink to another release's file.
+    :return: the name of the method used
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    try:
+        reflink(src, dst)
+        return "reflink"
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_REFLINK_ERRORS:
+            raise
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_LINK_ERRORS:
+            raise
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def clone_directory(src, dst):
+    """
+    Clones every file in src into dst with clone_file
+    :return: the number of files cloned
+    """
+    src = pathlib.Path(src)
+    dst = pathlib.Path(dst)
+    cloned = 0
+    for src_path in src.rglob("*"):
+        if src_path.is_file():
+            clone_file(src_path, dst.joinpath(src_path.relative_to(src)))
+            cloned += 1
+    return cloned
+
+
 def get_canonical_image(title, path, user):
     _image_path = pathlib.Path(path)
     if Image.objects.filter(title=title).exists():
@@ -0,0 +1,99 @@
+import logging
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from guardian import shortcuts as sc
+from guardian.models import UserObjectPermission
+
+from core.queryset import (
+    get_db_user,
+    get_viewable_objects_for_user,
+    make_change_delete_view_perms,
+)
+from library.models import Codebase, CodebaseRelease
+
+logger = logging.getLogger(__name__)
+
+
+def get_viewable_objects_for_user_subqueries(user, queryset):
+    """
+    Reference implementation of get_viewable_objects_for_user that filters with guardian's get_objects_for_user
+    """
+    perms = make_change_delete_view_perms(queryset.model)
+    user = get_db_user(user)
+    has_object_permission_queryset = sc.get_objects_for_user(
+        user, perms=perms, any_perm=True, accept_global_perms=False, klass=queryset
+    )
+    return queryset & (
+        has_object_permission_queryset
+        | queryset.public()
+        | queryset.filter(submitter=user)
+    )
+
+
+class Command(BaseCommand):
+    help = """compare the latency of the EXISTS based accessibility filter with the previous guardian
+    get_objects_for_user filter on codebases and releases for a sample of users"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=10,
+            help="number of users with object permissions to sample, the anonymous user is always included",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="number of timed queries per user"
+        )
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="print the query plans of both filters for the last sampled user",
+        )
+
+    def get_users(self, limit):
+        user_ids = (
+            UserObjectPermission.objects.values_list("user_id", flat=True)
+            .order_by("user_id")
+            .distinct()[:limit]
+        )
+        return [AnonymousUser(), *User.objects.filter(id__in=list(user_ids))]
+
+    def time_query(self, queryset, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            pks = list(queryset.values_list("pk", flat=True))
+        return (time.perf_counter() - start) / repeat * 1000, pks
+
+    def handle(self, *args, **options):
+        users = self.get_users(options["users"])
+        repeat = options["repeat"]
+        self.stdout.write(
+            f"{Codebase.objects.count()} codebases, {CodebaseRelease.objects.count()} releases, "
+            f"{UserObjectPermission.objects.count()} user object permissions"
+        )
+        self.stdout.write("model\tuser\tfilter\trows\tms per query")
+        for model in (Codebase, CodebaseRelease):
+            for user in users:
+                results = {}
+                for name, viewable in (
+                    ("exists", get_viewable_objects_for_user),
+                    ("subqueries", get_viewable_objects_for_user_subqueries),
+                ):
+                    queryset = viewable(user, model.objects.all())
+                    if options["explain"] and user is users[-1]:
+                        self.stdout.write(f"{model.__name__} {name}:")
+                        self.stdout.write(queryset.explain(analyze=True))
+                    latency, pks = self.time_query(queryset, repeat)
+                    results[name] = set(pks)
+                    self.stdout.write(
+                        f"{model._meta.label}\t{user}\t{name}\t{len(pks)}\t{latency:.1f}"
+                    )
+                if results["exists"] != results["subqueries"]:
+                    logger.warning(
+                        "filters disagree for %s on %s: %s",
+                        user,
+                        model._meta.label,
+                        results["exists"] ^ results["subqueries"],
+                    )
@@ -0,0 +1,104 @@
+import logging
+import time
+from itertools import combinations
+
+from django.core.management.base import BaseCommand
+from wagtail.search.backends import get_search_backend
+from wagtail.search.query import Boost, Fuzzy, Or, Phrase
+
+from core.view_helpers import STOP_WORDS, build_search_query
+from library.models import Codebase
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_TEXT = """
+An agent-based model of wolf and sheep predation in which grass regrows and wolves and sheep wander randomly
+around the landscape while reproducing and eating in order to study the stability of predator prey ecosystems
+with land use change, farmer decision making, social networks, opinion dynamics, epidemic spread, market
+behavior, water management, irrigation, climate adaptation and the emergence of cooperation among households
+"""
+
+
+def build_search_query_all_pairs(input_text: str):
+    """
+    Reference implementation of build_search_query that adds a phrase clause for every pair of words
+    """
+    words = [word for word in input_text.split() if word.lower() not in STOP_WORDS]
+    fuzzy_full_query = Boost(Fuzzy(input_text), boost=20.0)
+    exact_match_query = Boost(Phrase(input_text), boost=15.0)
+    two_word_queries = []
+    for combo in combinations(words, 2):
+        two_word_phrase = " ".join(combo)
+        if all(word in input_text for word in combo):
+            two_word_queries.append(Boost(Phrase(two_word_phrase), boost=12.0))
+        else:
+            two_word_queries.append(Boost(Phrase(two_word_phrase), boost=3.0))
+    single_word_queries = [
+        Fuzzy(word) if len(word) > 3 else Phrase(word) for word in words
+    ]
+    return Or(
+        [fuzzy_full_query, exact_match_query] + two_word_queries + single_word_queries
+    )
+
+
+def count_clauses(query):
+    if isinstance(query, Or):
+        return sum(count_clauses(subquery) for subquery in query.subqueries)
+    if isinstance(query, Boost):
+        return count_clauses(query.subquery)
+    return 1
+
+
+class Command(BaseCommand):
+    help = """compare Elasticsearch latency of the bounded search query builder and the previous all pairs
+    builder for search inputs of increasing length"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lengths",
+            type=int,
+            nargs="+",
+            default=[2, 5, 10, 20, 40, 80],
+            help="number of words in the generated search inputs",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="number of timed searches per input"
+        )
+
+    def get_words(self):
+        """words of public codebase descriptions so searches resemble pasted abstracts"""
+        words = []
+        for description in Codebase.objects.public().values_list(
+            "description", flat=True
+        )[:50]:
+            words.extend(description.split())
+        return words or SAMPLE_TEXT.split()
+
+    def time_search(self, query, repeat):
+        backend = get_search_backend()
+        queryset = Codebase.objects.public()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            list(backend.search(query, queryset)[:10])
+        return (time.perf_counter() - start) / repeat * 1000
+
+    def handle(self, *args, **options):
+        words = self.get_words()
+        repeat = options["repeat"]
+        self.stdout.write("words\tbuilder\tclauses\tms per search")
+        for length in options["lengths"]:
+            input_text = " ".join(words[i % len(words)] for i in range(length))
+            for name, builder in (
+                ("bounded", build_search_query),
+                ("all pairs", build_search_query_all_pairs),
+            ):
+                query = builder(input_text)
+                try:
+                    latency = f"{self.time_search(query, repeat):.1f}"
+                except Exception as e:
+                    # e.g., too many clauses for the all pairs builder
+                    logger.debug("search failed", exc_info=e)
+                    latency = f"failed ({type(e).__name__})"
+                self.stdout.write(
+                    f"{length}\t{name}\t{count_clauses(query)}\t{latency}"
+                )
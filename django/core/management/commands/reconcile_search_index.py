@@ -0,0 +1,90 @@
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from wagtail.search.backends import get_search_backends
+from wagtail.search.index import get_indexed_models
+from wagtail.search.query import MATCH_ALL
+
+from core import search_indexing
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Catch drift between the database and the search index left by changes that bypassed the incremental indexing
+    queue, e.g., queryset.update() calls or lost queue runs.
+
+    Objects whose last_modified (or last_published_at for pages) is newer than the watermark left by the previous
+    run are enqueued for indexing. Models whose number of indexed documents is lower than the number of indexable
+    objects are enqueued in full. Orphaned documents (more indexed documents than objects) are only reported and
+    require a full update_index.
+    """
+
+    help = "Enqueue objects changed since the last run for search indexing and report index drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=24,
+            help="how far back to look for changes when there is no watermark from a previous run",
+        )
+        parser.add_argument(
+            "--skip-counts",
+            action="store_true",
+            default=False,
+            help="skip comparing the number of indexed documents with the database",
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        watermark = cache.get(search_indexing.WATERMARK_KEY)
+        if watermark is None:
+            watermark = started - timedelta(hours=options["hours"])
+        backends = list(get_search_backends())
+        for model in get_indexed_models():
+            indexed_objects = model.get_indexed_objects()
+            watermark_field = search_indexing.get_watermark_field(model)
+            if watermark_field:
+                changed = indexed_objects.filter(
+                    **{f"{watermark_field}__gte": watermark}
+                )
+                self.enqueue(model, changed, "changed")
+            if options["skip_counts"]:
+                continue
+            expected = indexed_objects.count()
+            for backend in backends:
+                indexed = backend.search(MATCH_ALL, model).count()
+                if indexed < expected:
+                    logger.warning(
+                        "%s: %s of %s objects indexed, enqueueing all",
+                        model._meta.label,
+                        indexed,
+                        expected,
+                    )
+                    self.enqueue(model, indexed_objects, "missing")
+                elif indexed > expected:
+                    logger.warning(
+                        "%s: %s documents indexed for %s objects, run update_index to remove orphans",
+                        model._meta.label,
+                        indexed,
+                        expected,
+                    )
+        # only advance the watermark once everything changed since the previous one has been enqueued
+        cache.set(search_indexing.WATERMARK_KEY, started, timeout=None)
+        self.stdout.write(
+            f"{search_indexing.get_pending_count()} objects pending search indexing"
+        )
+
+    def enqueue(self, model, queryset, reason):
+        pks = list(queryset.values_list("pk", flat=True))
+        for start in range(0, len(pks), 1000):
+            search_indexing.enqueue_objects(model, pks[start : start + 1000])
+        if pks:
+            self.stdout.write(
+                f"enqueued {len(pks)} {reason} {model._meta.label} objects"
+            )
@@ -0,0 +1,22 @@
+import logging
+
+from .backends import permission_cache
+
+logger = logging.getLogger(__name__)
+
+
+class PermissionCacheMiddleware:
+    """
+    Caches object permission checks for the duration of each request, see core.backends.PermissionCache
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with permission_cache() as cache:
+            response = self.get_response(request)
+        logger.debug(
+            "object permission cache for %s: %s", request.path, cache.get_stats()
+        )
+        return response
@@ -11,6 +11,7 @@ from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.decorators import action
 
+from .backends import get_permission_cache
 from .models import SpamModeration
 from .permissions import ViewRestrictedObjectPermissions, ModeratorPermissions
 
@@ -71,6 +72,14 @@ class CommonViewSetMixin:
                 )
         return self.namespace
 
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        cache = get_permission_cache()
+        if page is not None and cache is not None:
+            # fetch object permissions for the whole page at once if any of them are checked
+            cache.add_objects(page)
+        return page
+
     def get_template_names(self):
         namespace = self._get_namespace()
         file_ext = self.ext
@@ -473,6 +473,14 @@ class MemberProfile(index.Indexed, ClusterableModel):
         return None
 
     def get_social_account(self, provider_name):
+        if "socialaccount_set" in getattr(self.user, "_prefetched_objects_cache", {}):
+            # avoid a query per profile when social accounts were prefetched
+            accounts = [
+                account
+                for account in self.user.socialaccount_set.all()
+                if account.provider == provider_name
+            ]
+            return min(accounts, key=lambda account: account.pk, default=None)
         return self.user.socialaccount_set.filter(provider=provider_name).first()
 
     @property
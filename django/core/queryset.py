@@ -1,6 +1,9 @@
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import FieldDoesNotExist
-from guardian import shortcuts as sc
+from django.db.models import CharField, Exists, OuterRef, Q
+from django.db.models.functions import Cast
+from guardian.utils import get_group_obj_perms_model, get_user_obj_perms_model
 
 
 def make_change_delete_view_perms(model):
@@ -12,6 +15,42 @@ def make_change_delete_view_perms(model):
     ]
 
 
+def _object_permission_filter(perms_model, content_type):
+    if perms_model.objects.is_generic():
+        # generic object permissions store the object's content type and primary key (as text), filtering on both
+        # matches guardian's (content_type, object_pk) index
+        return {
+            "content_type": content_type,
+            "object_pk": Cast(OuterRef("pk"), output_field=CharField()),
+        }
+    return {"content_object": OuterRef("pk")}
+
+
+def has_any_object_permission(user, model, perms):
+    """
+    Returns an expression that is true for objects of the given model the user has any of the given
+    permissions on, either directly or through one of their groups. Equivalent to filtering with guardian's
+    get_objects_for_user(user, perms, any_perm=True, accept_global_perms=False) for a non-superuser but
+    correlated EXISTS subqueries let the database stop at the first matching permission row instead of
+    materializing every object the user has permissions on
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    codenames = [perm.split(".", 1)[-1] for perm in perms]
+    user_perms_model = get_user_obj_perms_model(model)
+    group_perms_model = get_group_obj_perms_model(model)
+    user_perms = user_perms_model.objects.filter(
+        user=user,
+        permission__codename__in=codenames,
+        **_object_permission_filter(user_perms_model, content_type),
+    )
+    group_perms = group_perms_model.objects.filter(
+        group__user=user,
+        permission__codename__in=codenames,
+        **_object_permission_filter(group_perms_model, content_type),
+    )
+    return Exists(user_perms) | Exists(group_perms)
+
+
 def get_viewable_objects_for_user(user, queryset):
     """A user can view an object in a list view if they have any permissions on the object
     (currently change, delete or view permission)"""
@@ -22,14 +61,13 @@ def get_viewable_objects_for_user(user, queryset):
     # (models without PUBLISHED_ATTRIBUTE_KEY are assumed to be live so are always included in list results)
     if hasattr(model, "HAS_PUBLISHED_KEY") or has_field(model, PUBLISHED_ATTRIBUTE_KEY):
         user = get_db_user(user)
+        if user.is_superuser:
+            return queryset
         is_public_queryset = queryset.public()
-        is_submitter_queryset = queryset.filter(submitter=user)
-        has_object_permission_queryset = sc.get_objects_for_user(
-            user, perms=perms, any_perm=True, accept_global_perms=False, klass=queryset
-        )
-        queryset &= (
-            has_object_permission_queryset | is_public_queryset | is_submitter_queryset
+        is_submitter_or_has_object_permission_queryset = queryset.filter(
+            has_any_object_permission(user, model, perms) | Q(submitter=user)
         )
+        queryset &= is_public_queryset | is_submitter_or_has_object_permission_queryset
 
     return queryset
 
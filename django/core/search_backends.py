@@ -0,0 +1,138 @@
+"""
+Elasticsearch 7 search backend whose results can compute facets in the same request that fetches a page of hits.
+
+Configure with WAGTAILSEARCH_BACKENDS = {"default": {"BACKEND": "core.search_backends", ...}}
+"""
+
+from collections import OrderedDict
+
+from wagtail.search.backends.base import FilterFieldError
+from wagtail.search.backends.elasticsearch7 import (
+    Elasticsearch7SearchBackend,
+    Elasticsearch7SearchResults,
+)
+
+# number of buckets returned per facet, matches the elasticsearch default used by wagtail's facet()
+FACET_SIZE = 10
+
+
+class FacetedSearchResults(Elasticsearch7SearchResults):
+    """
+    Search results that can fetch the total hit count, one page of hits and terms aggregations over filter
+    fields ("facets") in a single Elasticsearch request, see with_facets(). Without with_facets() these behave
+    exactly like wagtail's Elasticsearch 7 results
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._facet_fields = ()
+        self._page_limits = None
+        # shared between clones so that slicing reuses the response of the combined request
+        self._faceted_response = None
+
+    def _clone(self):
+        new = super()._clone()
+        new._facet_fields = self._facet_fields
+        new._page_limits = self._page_limits
+        new._faceted_response = self._faceted_response
+        return new
+
+    def with_facets(self, field_names, start=0, stop=None):
+        """
+        Returns a copy of these results that computes facets for the given filter fields along with the total
+        number of hits and the hits between start and stop. Counting, then slicing out that page (or a shorter
+        one starting at start, e.g., the last page) and faceting then take a single request
+        """
+        clone = self._clone()
+        clone._facet_fields = tuple(field_names)
+        if stop is not None:
+            clone._page_limits = (self.start + start, self.start + stop)
+        clone._faceted_response = {}
+        return clone
+
+    def _get_aggregations(self):
+        aggregations = {}
+        for field_name in self._facet_fields:
+            field = self.query_compiler._get_filterable_field(field_name)
+            if field is None:
+                raise FilterFieldError(
+                    f'Cannot facet search results with field "{field_name}". Please add '
+                    f"index.FilterField('{field_name}') to "
+                    f"{self.query_compiler.queryset.model.__name__}.search_fields.",
+                    field_name=field_name,
+                )
+            column_name = self.query_compiler.mapping.get_field_column_name(field)
+            aggregations[field_name] = {
+                "terms": {"field": column_name, "size": FACET_SIZE}
+            }
+        return aggregations
+
+    def _parse_aggregations(self, aggregations):
+        # boolean buckets have numeric keys, use their string form ("true" / "false") instead
+        return {
+            field_name: OrderedDict(
+                (bucket.get("key_as_string", bucket["key"]), bucket["doc_count"])
+                for bucket in aggregations[field_name]["buckets"]
+            )
+            for field_name in self._facet_fields
+        }
+
+    def _get_index_name(self):
+        return self.backend.get_index_for_model(self.query_compiler.queryset.model).name
+
+    def _do_faceted_search(self):
+        response = self._faceted_response
+        if "count" in response:
+            return response
+        body = self._get_es_body()
+        body["aggregations"] = self._get_aggregations()
+        body["track_total_hits"] = True
+        params = {
+            "index": self._get_index_name(),
+            "_source": False,
+            self.fields_param_name: "pk",
+        }
+        if self._page_limits:
+            start, stop = self._page_limits
+            params.update(from_=start, size=stop - start)
+        else:
+            params.update(size=0)
+        es_response = self._backend_do_search(body, **params)
+        response.update(
+            count=es_response["hits"]["total"]["value"],
+            results=list(self._get_results_from_hits(es_response["hits"]["hits"])),
+            facets=self._parse_aggregations(es_response["aggregations"]),
+        )
+        return response
+
+    def _is_prefetched_page(self):
+        if self._page_limits is None or self.stop is None:
+            return False
+        start, stop = self._page_limits
+        return self.start == start and self.stop <= stop
+
+    def _do_search(self):
+        if self._is_prefetched_page():
+            results = self._do_faceted_search()["results"]
+            return iter(results[: self.stop - self.start])
+        return super()._do_search()
+
+    def _do_count(self):
+        if self._faceted_response is not None and self.start == 0 and self.stop is None:
+            return self._do_faceted_search()["count"]
+        return super()._do_count()
+
+    def facets(self):
+        """
+        :return: a dict mapping each faceted field name to an ordered dict of its most common values and counts
+        """
+        if self._faceted_response is None:
+            return {}
+        return self._do_faceted_search()["facets"]
+
+
+class FacetedElasticsearch7SearchBackend(Elasticsearch7SearchBackend):
+    results_class = FacetedSearchResults
+
+
+SearchBackend = FacetedElasticsearch7SearchBackend
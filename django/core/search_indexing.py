@@ -0,0 +1,204 @@
+"""
+Incremental search indexing
+
+Saves and deletes of indexed models are recorded in a redis set once their transaction commits, which coalesces
+repeated changes to the same object, and a debounced huey task indexes the pending objects in bulk. Objects that
+are no longer returned by their model's get_indexed_objects() are removed from the index.
+
+Member profiles and contributors index fields of their user, so they are also enqueued when their user is saved
+or deleted. Changes that bypass model signals (e.g., queryset.update()) should be enqueued explicitly with
+enqueue_objects or will be picked up by the reconcile_search_index management command. A full update_index is only
+needed after mapping changes.
+"""
+
+import logging
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django_redis import get_redis_connection
+from wagtail.search.backends import get_search_backends
+from wagtail.search.index import get_indexed_models
+
+from .view_helpers import invalidate_search_results
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "search_index:pending"
+SCHEDULED_KEY = "search_index:scheduled"
+WATERMARK_KEY = "search_index:watermark"
+# fields used to find objects changed since the last reconciliation, pages record when they were last published
+WATERMARK_FIELDS = ("last_modified", "last_published_at")
+# indexed models whose search documents include fields of the user they reference with a user field
+USER_INDEXED_MODELS = ("core.MemberProfile", "library.Contributor")
+
+
+def get_object_key(model, pk):
+    return f"{model._meta.label_lower}:{pk}"
+
+
+def parse_object_key(key: str):
+    label, pk = key.rsplit(":", 1)
+    model = apps.get_model(label)
+    return model, model._meta.pk.to_python(pk)
+
+
+def enqueue_objects(model, pks):
+    """
+    Add objects to the set of objects pending indexing and schedule a run of the indexing task unless one is
+    already scheduled
+    """
+    keys = [get_object_key(model, pk) for pk in pks]
+    if not keys:
+        return
+    connection = get_redis_connection("default")
+    connection.sadd(PENDING_KEY, *keys)
+    delay = settings.SEARCH_INDEX_QUEUE_DELAY
+    # the flag outlives the scheduled run by a margin so a lost task cannot stall the queue for long
+    if connection.set(SCHEDULED_KEY, 1, nx=True, ex=delay + 60):
+        from .tasks import process_search_index_queue
+
+        process_search_index_queue.schedule(delay=delay)
+
+
+def enqueue_objects_on_commit(model, pks):
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(lambda: enqueue_objects(model, pks))
+
+
+def on_indexed_model_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        # skip fixture loading
+        return
+    # pass the pk now, deleted instances have it cleared once post_delete handlers have run
+    enqueue_objects_on_commit(type(instance), [instance.pk])
+
+
+def on_user_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        # logins do not change indexed user fields
+        return
+    for label in USER_INDEXED_MODELS:
+        model = apps.get_model(label)
+        enqueue_objects_on_commit(
+            model, model.objects.filter(user=instance).values_list("pk", flat=True)
+        )
+
+
+def register_signal_handlers():
+    post_save.connect(
+        on_user_change,
+        sender=settings.AUTH_USER_MODEL,
+        dispatch_uid="search_index_user_save",
+    )
+    # contributors are detached from deleted users before post_delete
+    pre_delete.connect(
+        on_user_change,
+        sender=settings.AUTH_USER_MODEL,
+        dispatch_uid="search_index_user_delete",
+    )
+    for model in get_indexed_models():
+        post_save.connect(
+            on_indexed_model_change,
+            sender=model,
+            dispatch_uid=f"search_index_save_{model._meta.label_lower}",
+        )
+        post_delete.connect(
+            on_indexed_model_change,
+            sender=model,
+            dispatch_uid=f"search_index_delete_{model._meta.label_lower}",
+        )
+
+
+def index_objects(model, pks):
+    """
+    Bulk index the objects of the given model that are still indexable and remove the rest from the index
+    """
+    pks = set(pks)
+    indexed_objects = defaultdict(list)
+    indexed_pks = set()
+    for obj in model.get_indexed_objects().filter(pk__in=pks):
+        indexed_pks.add(obj.pk)
+        # pages are indexed as their specific type
+        indexed_instance = obj.get_indexed_instance()
+        if indexed_instance is not None:
+            indexed_objects[type(indexed_instance)].append(indexed_instance)
+    removed_objects = [model(pk=pk) for pk in pks - indexed_pks]
+    for backend in get_search_backends():
+        for indexed_model, objects in indexed_objects.items():
+            backend.add_bulk(indexed_model, objects)
+        for obj in removed_objects:
+            backend.delete(obj)
+    for changed_model in {model, *indexed_objects}:
+        invalidate_search_results(changed_model)
+    return len(indexed_pks), len(removed_objects)
+
+
+def process_pending_objects(batch_size=None):
+    """
+    Index or remove up to batch_size pending objects. Objects are returned to the pending set if indexing fails
+    :return: the number of pending objects processed
+    """
+    if batch_size is None:
+        batch_size = settings.SEARCH_INDEX_BATCH_SIZE
+    connection = get_redis_connection("default")
+    keys = connection.spop(PENDING_KEY, batch_size)
+    if not keys:
+        return 0
+    pks_by_model = defaultdict(set)
+    for key in keys:
+        try:
+            model, pk = parse_object_key(key.decode())
+        except (LookupError, ValueError):
+            logger.warning("discarding invalid search index queue entry %s", key)
+            continue
+        pks_by_model[model].add(pk)
+    try:
+        for model, pks in pks_by_model.items():
+            indexed, removed = index_objects(model, pks)
+            logger.debug(
+                "indexed %s and removed %s %s objects",
+                indexed,
+                removed,
+                model._meta.label,
+            )
+    except Exception:
+        connection.sadd(PENDING_KEY, *keys)
+        raise
+    return len(keys)
+
+
+def process_queue():
+    """
+    Process pending objects in batches until the queue is empty
+    :return: the number of pending objects processed
+    """
+    connection = get_redis_connection("default")
+    # clear the flag first so that objects enqueued from here on schedule another run
+    connection.delete(SCHEDULED_KEY)
+    processed = 0
+    while True:
+        batch_processed = process_pending_objects()
+        if not batch_processed:
+            return processed
+        processed += batch_processed
+
+
+def get_pending_count():
+    return get_redis_connection("default").scard(PENDING_KEY)
+
+
+def get_watermark_field(model):
+    """
+    :return: the name of the field recording when objects of the given model last changed, if any
+    """
+    field_names = {field.name for field in model._meta.get_fields()}
+    for name in WATERMARK_FIELDS:
+        if name in field_names:
+            return name
+    return None
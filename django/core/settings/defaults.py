@@ -146,6 +146,7 @@ MIDDLEWARE = [
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.PermissionCacheMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     # allauth account middleware
     "allauth.account.middleware.AccountMiddleware",
@@ -160,7 +161,7 @@ MIDDLEWARE = [
 AUTHENTICATION_BACKENDS = (
     "allauth.account.auth_backends.AuthenticationBackend",
     "core.backends.ComsesObjectPermissionBackend",
-    "guardian.backends.ObjectPermissionBackend",
+    "core.backends.CachedObjectPermissionBackend",
 )
 
 #########################################################
@@ -225,10 +226,12 @@ warnings.simplefilter("ignore", category=ElasticsearchWarning)
 # configure elasticsearch 7 wagtail backend
 WAGTAILSEARCH_BACKENDS = {
     "default": {
-        "BACKEND": "wagtail.search.backends.elasticsearch7",
+        # wagtail's elasticsearch 7 backend with single request faceting
+        "BACKEND": "core.search_backends",
         "URLS": ["http://elasticsearch:9200"],
         "ATOMIC_REBUILD": True,
-        "AUTO_UPDATE": True,
+        # indexing is handled by the incremental indexing queue in core.search_indexing
+        "AUTO_UPDATE": False,
         "TIMEOUT": 30,
         "OPTIONS": {
             "max_retries": 2,
@@ -237,6 +240,24 @@ WAGTAILSEARCH_BACKENDS = {
     }
 }
 
+# seconds to wait before indexing queued changes so that bursts of saves are coalesced, and the number of
+# objects to bulk index at a time
+SEARCH_INDEX_QUEUE_DELAY = int(os.getenv("SEARCH_INDEX_QUEUE_DELAY", 10))
+SEARCH_INDEX_BATCH_SIZE = int(os.getenv("SEARCH_INDEX_BATCH_SIZE", 500))
+# seconds to cache search result counts and pages, cached results are also invalidated when the index changes
+SEARCH_RESULTS_CACHE_TIMEOUT = int(os.getenv("SEARCH_RESULTS_CACHE_TIMEOUT", 300))
+# seconds to cache the release detail page context of anonymous visitors, it is also invalidated on changes
+RELEASE_PAGE_CACHE_TIMEOUT = int(os.getenv("RELEASE_PAGE_CACHE_TIMEOUT", 3600))
+# seconds to cache the rendition urls of a codebase's featured image, they are also invalidated on image changes
+FEATURED_RENDITION_URLS_CACHE_TIMEOUT = int(
+    os.getenv("FEATURED_RENDITION_URLS_CACHE_TIMEOUT", 3600)
+)
+
+# seconds to wait before recording queued download requests so that bursts are written together, and the number
+# of download requests to insert at a time
+DOWNLOAD_EVENT_QUEUE_DELAY = int(os.getenv("DOWNLOAD_EVENT_QUEUE_DELAY", 5))
+DOWNLOAD_EVENT_BATCH_SIZE = int(os.getenv("DOWNLOAD_EVENT_BATCH_SIZE", 500))
+
 # make tags case insensitive
 TAGGIT_CASE_INSENSITIVE = True
 
@@ -314,6 +335,11 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 104857600
 FILE_UPLOAD_PERMISSIONS = 0o644
 FILE_UPLOAD_TEMP_DIR = os.path.join(SHARE_DIR, "uploads")
 
+# limits enforced while streaming uploaded zip / tar archives into a release's submission package
+ARCHIVE_EXTRACT_MAX_ENTRIES = int(os.getenv("ARCHIVE_EXTRACT_MAX_ENTRIES", 10000))
+ARCHIVE_EXTRACT_MAX_SIZE = int(os.getenv("ARCHIVE_EXTRACT_MAX_SIZE", 2 * 1024**3))
+ARCHIVE_EXTRACT_WORKERS = int(os.getenv("ARCHIVE_EXTRACT_WORKERS", 4))
+
 for d in (LOG_DIRECTORY, LIBRARY_ROOT, REPOSITORY_ROOT, FILE_UPLOAD_TEMP_DIR):
     try:
         if not os.path.isdir(d):
@@ -530,6 +556,15 @@ TEST_USERNAME = os.getenv("TEST_USERNAME", "__test_user__")
 DATACITE_API_USERNAME = os.getenv("DATACITE_API_USERNAME", "comses")
 DATACITE_DRY_RUN = os.getenv("DATACITE_DRY_RUN", "true")
 DATACITE_API_PASSWORD = read_secret("datacite_api_password")
+# optional base url for the DataCite REST API, overrides DATACITE_TEST_MODE (e.g., a local stub server)
+DATACITE_API_URL = os.getenv("DATACITE_API_URL", "")
+# DataCite allows 3000 requests per 5 minute window per client IP
+DATACITE_API_WORKERS = int(os.getenv("DATACITE_API_WORKERS", 8))
+DATACITE_API_RATE_LIMIT = float(os.getenv("DATACITE_API_RATE_LIMIT", 8))
+DATACITE_API_MAX_RETRIES = int(os.getenv("DATACITE_API_MAX_RETRIES", 3))
+DATACITE_API_RETRY_BACKOFF = float(os.getenv("DATACITE_API_RETRY_BACKOFF", 2))
+DATACITE_API_TIMEOUT = int(os.getenv("DATACITE_API_TIMEOUT", 30))
+DATACITE_SYNC_BATCH_SIZE = int(os.getenv("DATACITE_SYNC_BATCH_SIZE", 100))
 
 ROR_API_URL = "https://api.ror.org/v2/organizations"
 
@@ -0,0 +1,23 @@
+import logging
+
+from huey import crontab
+from huey.contrib.djhuey import db_periodic_task, db_task, lock_task
+
+from . import search_indexing, view_helpers
+
+logger = logging.getLogger(__name__)
+
+
+@db_task(retries=3, retry_delay=30)
+def process_search_index_queue():
+    # a run that is locked out is retried after retry_delay and finds whatever the running task left behind
+    with lock_task("process-search-index-queue"):
+        processed = search_indexing.process_queue()
+        logger.info("processed %s pending search index updates", processed)
+
+
+@db_periodic_task(crontab(minute="*/5"))
+def flush_search_hits():
+    with lock_task("flush-search-hits"):
+        hits = view_helpers.flush_search_hits()
+        logger.debug("recorded %s search query hits", hits)
@@ -3,9 +3,11 @@ import logging
 from allauth.socialaccount.models import SocialApp
 from django.urls import reverse
 from django.test import TestCase
+from guardian.shortcuts import assign_perm
 from rest_framework.status import HTTP_302_FOUND, HTTP_200_OK
 
-from .base import UserFactory
+from core.backends import get_permission_cache, permission_cache
+from .base import BaseModelTestCase, UserFactory
 
 logger = logging.getLogger(__name__)
 
@@ -99,3 +101,40 @@ class EmailAuthenticationBackendTestCase(TestCase):
         superuser = self.user_factory.create(is_superuser=True)
         self.check_response_200(superuser, password=self.wrong_password)
         self.check_authentication_failed(user, password=self.wrong_password)
+
+
+class PermissionCacheTestCase(BaseModelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_user = self.create_user(username="other")
+        self.events = [self.create_event(title=f"event {i}") for i in range(3)]
+        assign_perm("core.change_event", self.other_user, self.events[0])
+
+    def test_page_permissions_prefetched(self):
+        self.assertIsNone(get_permission_cache())
+        with permission_cache() as cache:
+            cache.add_objects(self.events)
+            self.assertTrue(
+                self.other_user.has_perm("core.change_event", self.events[0])
+            )
+            with self.assertNumQueries(0):
+                for event in self.events[1:]:
+                    self.assertFalse(
+                        self.other_user.has_perm("core.change_event", event)
+                    )
+            self.assertEqual(cache.get_stats(), {"hits": 2, "misses": 1})
+        self.assertIsNone(get_permission_cache())
+
+    def test_matches_uncached_checks(self):
+        uncached = [
+            self.other_user.has_perm(perm, event)
+            for perm in ("core.change_event", "core.delete_event")
+            for event in self.events
+        ]
+        with permission_cache():
+            cached = [
+                self.other_user.has_perm(perm, event)
+                for perm in ("core.change_event", "core.delete_event")
+                for event in self.events
+            ]
+        self.assertEqual(uncached, cached)
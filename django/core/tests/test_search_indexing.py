@@ -0,0 +1,93 @@
+from unittest import mock
+
+from django_redis import get_redis_connection
+
+from core import search_indexing
+from core.models import Job
+from library.models import Contributor
+from .base import BaseModelTestCase
+
+
+class SearchIndexingQueueTest(BaseModelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.connection = get_redis_connection("default")
+        self.clear_queue()
+
+    def tearDown(self):
+        self.clear_queue()
+
+    def clear_queue(self):
+        self.connection.delete(
+            search_indexing.PENDING_KEY, search_indexing.SCHEDULED_KEY
+        )
+
+    def pending_keys(self):
+        return {
+            key.decode()
+            for key in self.connection.smembers(search_indexing.PENDING_KEY)
+        }
+
+    @mock.patch("core.tasks.process_search_index_queue.schedule")
+    def test_changes_are_coalesced(self, schedule):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = self.create_job(title="Queued Job")
+            job.title = "Renamed Job"
+            job.save()
+        # nothing is enqueued until the transaction commits
+        with self.captureOnCommitCallbacks(execute=False):
+            event = self.create_event()
+        self.assertIn(f"core.job:{job.pk}", self.pending_keys())
+        self.assertNotIn(f"core.event:{event.pk}", self.pending_keys())
+        self.assertEqual(schedule.call_count, 1)
+
+    @mock.patch("core.tasks.process_search_index_queue.schedule")
+    def test_user_changes_enqueue_member_profile_and_contributors(self, schedule):
+        user = self.create_user(username="renamed_user")
+        contributor = Contributor.objects.create(user=user, given_name="Renamed")
+        self.clear_queue()
+        with self.captureOnCommitCallbacks(execute=True):
+            user.last_login = user.date_joined
+            user.save(update_fields=["last_login"])
+        self.assertFalse(self.pending_keys())
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        self.assertTrue(
+            {
+                f"core.memberprofile:{user.member_profile.pk}",
+                f"library.contributor:{contributor.pk}",
+            }
+            <= self.pending_keys()
+        )
+
+    @mock.patch("core.tasks.process_search_index_queue.schedule")
+    def test_process_queue(self, schedule):
+        job = self.create_job(title="Indexed Job")
+        deleted_job = self.create_job(title="Deleted Job")
+        deleted_job_id = deleted_job.pk
+        search_indexing.enqueue_objects(Job, [job.pk, deleted_job_id])
+        deleted_job.delete()
+        backend = mock.Mock()
+        with mock.patch.object(
+            search_indexing, "get_search_backends", return_value=[backend]
+        ):
+            self.assertEqual(search_indexing.process_queue(), 2)
+        backend.add_bulk.assert_called_once_with(Job, [job])
+        backend.delete.assert_called_once()
+        self.assertEqual(backend.delete.call_args.args[0].pk, deleted_job_id)
+        self.assertFalse(self.pending_keys())
+        self.assertFalse(self.connection.exists(search_indexing.SCHEDULED_KEY))
+
+    @mock.patch("core.tasks.process_search_index_queue.schedule")
+    def test_failed_batches_are_requeued(self, schedule):
+        job = self.create_job()
+        search_indexing.enqueue_objects(Job, [job.pk])
+        backend = mock.Mock()
+        backend.add_bulk.side_effect = ConnectionError
+        with mock.patch.object(
+            search_indexing, "get_search_backends", return_value=[backend]
+        ):
+            with self.assertRaises(ConnectionError):
+                search_indexing.process_queue()
+        self.assertEqual(self.pending_keys(), {f"core.job:{job.pk}"})
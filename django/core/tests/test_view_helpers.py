@@ -0,0 +1,86 @@
+from django.http import QueryDict
+from django.test import TestCase
+from django_redis import get_redis_connection
+from wagtail.contrib.search_promotions.models import Query
+from wagtail.search.query import Or, PlainText
+
+from core.models import Job
+from core.view_helpers import (
+    SEARCH_HITS_KEY,
+    SEARCH_QUERY_MAX_WORDS,
+    build_search_query,
+    get_search_word_pairs,
+    flush_search_hits,
+    get_search_results_cache_key,
+    invalidate_search_results,
+    record_search_hit,
+)
+
+
+class BuildSearchQueryTest(TestCase):
+    def test_clauses_grow_linearly(self):
+        query = build_search_query("wolf sheep predation in the NetLogo grass model")
+        # full text fuzzy and phrase, 4 adjacent pairs without stop words and 6 words
+        self.assertEqual(len(query.subqueries), 2 + 4 + 6)
+        self.assertEqual(
+            get_search_word_pairs("wolf sheep predation in the NetLogo grass model"),
+            [
+                ("wolf", "sheep"),
+                ("sheep", "predation"),
+                ("NetLogo", "grass"),
+                ("grass", "model"),
+            ],
+        )
+
+    def test_repeated_words(self):
+        query = build_search_query("sheep Sheep sheep")
+        self.assertEqual(len(query.subqueries), 2 + 1)
+
+    def test_long_input_fallback(self):
+        words = [f"word{i}" for i in range(SEARCH_QUERY_MAX_WORDS * 10)]
+        query = build_search_query(" ".join(words))
+        self.assertIsInstance(query, Or)
+        self.assertEqual(len(query.subqueries), 2)
+        self.assertIsInstance(query.subqueries[1], PlainText)
+
+
+class SearchResultsCacheTest(TestCase):
+    def test_equivalent_searches_share_cache_key(self):
+        key = get_search_results_cache_key(
+            Job, QueryDict("query=Wolf%20%20Sheep&tags=abm&tags=NetLogo&page=2")
+        )
+        self.assertEqual(
+            key,
+            get_search_results_cache_key(
+                Job, QueryDict("tags=netlogo&tags=ABM&query=wolf%20sheep")
+            ),
+        )
+        self.assertNotEqual(
+            key,
+            get_search_results_cache_key(
+                Job, QueryDict("query=wolf%20sheep&tags=abm&ordering=-date_created")
+            ),
+        )
+
+    def test_invalidation(self):
+        query_params = QueryDict("query=predation")
+        key = get_search_results_cache_key(Job, query_params)
+        invalidate_search_results(Job)
+        self.assertNotEqual(key, get_search_results_cache_key(Job, query_params))
+
+
+class SearchHitsTest(TestCase):
+    def setUp(self):
+        self.connection = get_redis_connection("default")
+        self.connection.delete(SEARCH_HITS_KEY, f"{SEARCH_HITS_KEY}:flushing")
+
+    def test_flush_search_hits(self):
+        for _ in range(3):
+            record_search_hit("Wolf sheep")
+        record_search_hit("agent based")
+        self.assertEqual(flush_search_hits(), 4)
+        record_search_hit("wolf sheep")
+        self.assertEqual(flush_search_hits(), 1)
+        self.assertEqual(flush_search_hits(), 0)
+        self.assertEqual(Query.get("wolf sheep").hits, 4)
+        self.assertEqual(Query.get("agent based").hits, 1)
@@ -1,20 +1,28 @@
+import hashlib
+import json
 import logging
+import time
 from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import FieldError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
 from rest_framework.response import Response
 from wagtail.search.backends import get_search_backend
-from wagtail.contrib.search_promotions.models import Query
+from wagtail.contrib.search_promotions.models import Query, QueryDailyHits
 from wagtail.search.query import (
     MATCH_ALL,
     Phrase,
+    PlainText,
     Boost,
     Or,
     Fuzzy,
     SearchQuery,
 )
 
-from itertools import combinations
-
 from .models import ComsesGroups
 
 logger = logging.getLogger(__name__)
@@ -49,27 +57,69 @@ STOP_WORDS = {
 }
 
 
-def build_search_query(input_text: str) -> SearchQuery:
-    words = [word for word in input_text.split() if word.lower() not in STOP_WORDS]
+# inputs with more words than this (e.g., a pasted abstract) are searched with a single multi field match
+# instead of separate clauses per word and word pair
+SEARCH_QUERY_MAX_WORDS = 12
 
-    # Highest priority: Fuzzy match of the entire input text
-    fuzzy_full_query = Boost(Fuzzy(input_text), boost=20.0)
 
-    # Second priority: Exact match using Phrase
+def get_search_words(input_text: str):
+    """
+    Returns the distinct words of the input text that are not stop words, in order of appearance
+    """
+    words = []
+    seen = set()
+    for word in input_text.split():
+        normalized_word = word.lower()
+        if normalized_word not in STOP_WORDS and normalized_word not in seen:
+            seen.add(normalized_word)
+            words.append(word)
+    return words
+
+
+def get_search_word_pairs(input_text: str):
+    """
+    Returns the distinct pairs of adjacent words of the input text that contain no stop words, in order of
+    appearance, at most SEARCH_QUERY_MAX_WORDS of them
+    """
+    pairs = []
+    seen = set()
+    tokens = input_text.split()
+    for first, second in zip(tokens, tokens[1:]):
+        normalized_pair = (first.lower(), second.lower())
+        if (
+            STOP_WORDS.intersection(normalized_pair)
+            or normalized_pair[0] == normalized_pair[1]
+            or normalized_pair in seen
+        ):
+            continue
+        seen.add(normalized_pair)
+        pairs.append((first, second))
+    return pairs[:SEARCH_QUERY_MAX_WORDS]
+
+
+def build_search_query(input_text: str) -> SearchQuery:
+    """
+    Builds a search query whose number of clauses grows linearly with the number of words in the input text,
+    bounded by SEARCH_QUERY_MAX_WORDS. Longer inputs fall back to a single match across all search fields
+    """
+    words = get_search_words(input_text)
+
+    # exact match of the entire input text using Phrase
     exact_match_query = Boost(Phrase(input_text), boost=15.0)
 
-    # Generate all 2-word combinations
-    two_word_combos = list(combinations(words, 2))
+    if len(words) > SEARCH_QUERY_MAX_WORDS:
+        # rank documents by how many of the words they contain, fuzzy matching this many words is too costly
+        return Or([exact_match_query, PlainText(" ".join(words), operator="or")])
 
-    # Create queries for 2-word combinations
-    two_word_queries = []
-    for combo in two_word_combos:
-        two_word_phrase = " ".join(combo)
-        # Boost 2-word phrases higher if both words are in the original text
-        if all(word in input_text for word in combo):
-            two_word_queries.append(Boost(Phrase(two_word_phrase), boost=12.0))
-        else:
-            two_word_queries.append(Boost(Phrase(two_word_phrase), boost=3.0))
+    # Highest priority: Fuzzy match of the entire input text
+    fuzzy_full_query = Boost(Fuzzy(input_text), boost=20.0)
+
+    # pairs of words that are adjacent in the input text, matching all pairs of words would be quadratic in the
+    # number of words and mostly match pairs that never appear next to each other
+    two_word_queries = [
+        Boost(Phrase(f"{first} {second}"), boost=12.0)
+        for first, second in get_search_word_pairs(input_text)
+    ]
 
     # Make the search fuzzy using Fuzzy for individual words if word length > 3, otherwise use Phrase
     single_word_queries = [
@@ -87,6 +137,142 @@ def build_search_query(input_text: str) -> SearchQuery:
     return combined_query
 
 
+SEARCH_HITS_KEY = "search_hits:pending"
+
+
+def record_search_hit(query: str):
+    """buffer a search query hit in redis, see flush_search_hits"""
+    get_redis_connection("default").hincrby(SEARCH_HITS_KEY, query, 1)
+
+
+def flush_search_hits():
+    """
+    Write buffered search query hits to wagtail's daily query hit counts in bulk
+    :return: the number of hits written
+    """
+    connection = get_redis_connection("default")
+    flushing_key = f"{SEARCH_HITS_KEY}:flushing"
+    # hits left over by a failed flush are written first, new hits accumulate in a fresh hash
+    if not connection.exists(flushing_key):
+        if not connection.exists(SEARCH_HITS_KEY):
+            return 0
+        connection.rename(SEARCH_HITS_KEY, flushing_key)
+    hits_by_query = defaultdict(int)
+    for query_string, hits in connection.hgetall(flushing_key).items():
+        hits_by_query[Query.get(query_string.decode()).pk] += int(hits)
+    date = timezone.now().date()
+    with transaction.atomic():
+        existing_query_ids = set(
+            QueryDailyHits.objects.filter(
+                query_id__in=hits_by_query, date=date
+            ).values_list("query_id", flat=True)
+        )
+        QueryDailyHits.objects.bulk_create(
+            [
+                QueryDailyHits(query_id=query_id, date=date, hits=hits)
+                for query_id, hits in hits_by_query.items()
+                if query_id not in existing_query_ids
+            ]
+        )
+        for query_id in existing_query_ids:
+            QueryDailyHits.objects.filter(query_id=query_id, date=date).update(
+                hits=F("hits") + hits_by_query[query_id]
+            )
+    connection.delete(flushing_key)
+    return sum(hits_by_query.values())
+
+
+def get_search_results_version_key(model):
+    return f"search_results:{model._meta.label_lower}:version"
+
+
+def invalidate_search_results(model):
+    """invalidate all cached search results for the given model"""
+    cache.set(get_search_results_version_key(model), time.time_ns(), None)
+
+
+def get_search_results_cache_key(model, query_params):
+    """
+    Returns a cache key for search results of the given model from query params normalized so that equivalent
+    searches share cached results. The page is not part of the key, results are cached per slice
+    """
+    if hasattr(query_params, "lists"):
+        query_params = query_params.lists()
+    else:
+        query_params = query_params.items()
+    params = {}
+    for key, values in query_params:
+        if key in ("page", "page_size"):
+            continue
+        if isinstance(values, str):
+            values = [values]
+        if key == "query":
+            # search analyzers are case insensitive
+            values = [" ".join(value.lower().split()) for value in values]
+        elif key == "tags":
+            values = [value.strip().lower() for value in values]
+        params[key] = sorted(value for value in values if value)
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    version = cache.get(get_search_results_version_key(model), 0)
+    return f"search_results:{model._meta.label_lower}:{version}:{digest}"
+
+
+class CachedSearchResults:
+    """
+    Caches the total count and the ids of each requested slice of wagtail search results so that repeated
+    searches, e.g., paging back and forth through the library, skip Elasticsearch. Objects are always loaded from
+    the database through the searched queryset
+    """
+
+    def __init__(self, results, queryset, cache_key, timeout=None):
+        self.results = results
+        self.queryset = queryset
+        self.model = queryset.model
+        self.cache_key = cache_key
+        if timeout is None:
+            timeout = settings.SEARCH_RESULTS_CACHE_TIMEOUT
+        self.timeout = timeout
+
+    def count(self):
+        key = f"{self.cache_key}:count"
+        count = cache.get(key)
+        if count is None:
+            count = self.results.count()
+            cache.set(key, count, self.timeout)
+        return count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            return self.results[key]
+        slice_key = f"{self.cache_key}:{key.start}:{key.stop}"
+        pks = cache.get(slice_key)
+        if pks is None:
+            objects = list(self.results[key])
+            cache.set(slice_key, [obj.pk for obj in objects], self.timeout)
+            return objects
+        objects = {obj.pk: obj for obj in self.queryset.filter(pk__in=pks)}
+        return [objects[pk] for pk in pks if pk in objects]
+
+    def facet(self, field_name):
+        return self.results.facet(field_name)
+
+    def facets(self):
+        key = f"{self.cache_key}:facets"
+        facets = cache.get(key)
+        if facets is None:
+            facets = self.results.facets()
+            cache.set(key, facets, self.timeout)
+        return facets
+
+
 def get_search_queryset(
     query_params,
     queryset,
@@ -94,7 +280,19 @@ def get_search_queryset(
     fields=None,
     tags=None,
     criteria=None,
+    cache_results=False,
+    facet_fields=None,
+    page_limits=None,
 ):
+    """
+    Search the given queryset with the query in query_params. If cache_results is True, the count and pages of
+    results are cached for SEARCH_RESULTS_CACHE_TIMEOUT seconds or until invalidate_search_results is called for
+    the model. Only cache results of querysets that do not depend on the requesting user, the cache key is derived
+    from query_params alone.
+
+    If facet_fields are given, results.facets() returns the most common values of those filter fields. Facets and
+    the total count are fetched in the same request as the page of results between page_limits (start, stop)
+    """
     search_backend = get_search_backend()
 
     if not fields:
@@ -125,8 +323,12 @@ def get_search_queryset(
         criteria.update(tags__name__in=[t.lower() for t in tags])
         operator = 'and'
     """
+    cache_key = None
+    if cache_results:
+        cache_key = get_search_results_cache_key(queryset.model, query_params)
+
     if query:
-        Query.get(query).add_hit()
+        record_search_hit(query)
 
         # this can be used to create split query and filters from search field input text:
         # `some search terms peer_reviewed:True` -> query="some search terms" and filters=["peer_reviewed": True]
@@ -171,7 +373,13 @@ def get_search_queryset(
         order_by_relevance=order_by_relevance,
     )
 
+    if facet_fields:
+        start, stop = page_limits or (0, None)
+        results = results.with_facets(facet_fields, start, stop)
+
     results.model = queryset.model
+    if cache_key:
+        return CachedSearchResults(results, queryset, cache_key)
     return results
 
 
@@ -3,17 +3,52 @@ import csv
 import logging
 from django.core.management.base import BaseCommand
 
-from library.models import Codebase
+from library.models import Codebase, CodebaseRelease
 from library.doi import DataCiteApi, get_welcome_message
 
 logger = logging.getLogger(__name__)
 
 
-def sync_all_doi_metadata(interactive=True, dry_run=True):
+def get_items_with_dois(codebases):
+    """
+    yields every codebase with a DOI followed by its peer reviewed releases with DOIs
+    """
+    for codebase in codebases:
+        yield codebase
+        for release in codebase.releases.with_doi():
+            if release.peer_reviewed and release.doi:
+                yield release
+            else:
+                logger.debug("Skipping unreviewed / no DOI release %s", release.pk)
+
+
+def get_stale_items_with_dois():
+    """
+    yields codebases and peer reviewed releases with DOIs whose stored metadata hash differs from their latest
+    successful DataCite registration
+    """
+    yield from Codebase.objects.with_stale_datacite_metadata().order_by("pk").iterator()
+    yield from (
+        CodebaseRelease.objects.reviewed()
+        .with_stale_datacite_metadata()
+        .order_by("pk")
+        .iterator()
+    )
+
+
+def update_interactively(datacite_api, items):
+    for item in items:
+        logger.debug("Processing %s", item)
+        input("Press Enter to continue or CTRL+C to quit...")
+        log, ok = datacite_api.update_doi_metadata(item)
+        yield item, log, ok
+
+
+def sync_all_doi_metadata(interactive=True, dry_run=True, check_all=False):
     print(get_welcome_message(dry_run))
 
     datacite_api = DataCiteApi(dry_run=dry_run)
-    all_codebases_with_dois = Codebase.objects.with_doi()
+    all_codebases_with_dois = Codebase.objects.with_doi().order_by("pk")
     total_number_of_codebases_with_dois = all_codebases_with_dois.count()
     invalid_codebases = []
     invalid_releases = []
@@ -23,40 +58,23 @@ def sync_all_doi_metadata(interactive=True, dry_run=True):
         total_number_of_codebases_with_dois,
     )
 
-    for i, codebase in enumerate(all_codebases_with_dois):
-        logger.debug(
-            "Processing codebase %s - %s/%s",
-            codebase.pk,
-            i + 1,
-            total_number_of_codebases_with_dois,
-        )
-        if interactive:
-            input("Press Enter to continue or CTRL+C to quit...")
-
-        # first ensure parent codebase metadata is properly synced
-        log, ok = datacite_api.update_doi_metadata(codebase)
-        if not ok:
-            logger.error("Failed to update metadata for codebase {codebase.pk}")
-            invalid_codebases.append((codebase, log))
-
-        # next check all parent codebase release metadata
-        for j, release in enumerate(codebase.releases.with_doi()):
-            logger.debug(
-                "Processing release #%s (%s/%s)",
-                release.pk,
-                j + 1,
-                codebase.releases.count(),
-            )
-            if interactive:
-                input("Press Enter to continue or CTRL+C to quit...")
-
-            if release.peer_reviewed and release.doi:
-                log, ok = datacite_api.update_doi_metadata(release)
-                if not ok:
-                    logger.error("Failed to update metadata for release %s", release.pk)
-                    invalid_releases.append((release, log))
-            else:
-                logger.debug("Skipping unreviewed / no DOI release %s", release.pk)
+    if check_all:
+        items = get_items_with_dois(all_codebases_with_dois.iterator())
+    else:
+        items = get_stale_items_with_dois()
+    if interactive:
+        results = update_interactively(datacite_api, items)
+    else:
+        results = datacite_api.sync_doi_metadata(items)
+
+    for item, log, ok in results:
+        if ok:
+            continue
+        logger.error("Failed to update metadata for %s", item)
+        if isinstance(item, Codebase):
+            invalid_codebases.append((item, log))
+        else:
+            invalid_releases.append((item, log))
 
     if invalid_codebases:
         with open("doi_sync_metadata_invalid_codebases.csv", "w") as f:
@@ -116,8 +134,15 @@ class Command(BaseCommand):
             action=argparse.BooleanOptionalAction,
             help="Output what would have happened.",
         )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="check_all",
+            help="Rebuild and check the metadata of every codebase and release with a DOI instead of only those "
+            "whose stored metadata hash differs from their latest registration.",
+        )
 
     def handle(self, *args, **options):
         interactive = options["interactive"]
         dry_run = options["dry_run"]
-        sync_all_doi_metadata(interactive, dry_run)
+        sync_all_doi_metadata(interactive, dry_run, options["check_all"])
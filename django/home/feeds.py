@@ -20,10 +20,15 @@ import logging
 import re
 import requests
 import sys
+import time
 
 
 DEFAULT_HOMEPAGE_FEED_MAX_ITEMS = settings.DEFAULT_HOMEPAGE_FEED_MAX_ITEMS
 DEFAULT_CACHE_TIMEOUT = 3600  # 1 hour cache timeout
+# how long stale feed items are served while they are refreshed in the background
+STALE_CACHE_TIMEOUT = 60 * 60 * 24
+# interval of the refresh_homepage_feeds periodic task, feeds about to go stale within it are refreshed
+FEED_REFRESH_INTERVAL = 600
 
 logger = logging.getLogger(__name__)
 
@@ -230,27 +235,72 @@ class AbstractFeed(ABC):
         """Convert raw source data into a FeedItem."""
         raise NotImplementedError("Subclasses must implement this method.")
 
+    @classmethod
+    def get_version_key(cls):
+        return f"feed_version_{cls.__name__}"
+
     @property
     def cache_key(self):
         if self._cache_key is None:
             logger.debug("using default cache key for %s", self.__class__.__name__)
             self._cache_key = f"cache_{self.__class__.__name__}"
-        return f"{self._cache_key}_{self.max_number_of_items}"
+        version = cache.get(self.get_version_key(), 0)
+        return f"{self._cache_key}_{version}_{self.max_number_of_items}"
 
-    def get_feed_items(self):
-        # check for cached data first (skip in dev mode)
-        source_feed_data = None if (settings.DEBUG and not self.rate_limited) else cache.get(self.cache_key)
-        if not source_feed_data:
-            source_feed_data = self._get_feed_source_data()
-            if not source_feed_data:
-                # feed source may be down, do not cache
-                logger.warning("No feed data found [%s]", self.cache_key)
-                return []
-            if not (settings.DEBUG and not self.rate_limited):
-                cache.set(self.cache_key, source_feed_data, self.cache_timeout)
+    @property
+    def use_cache(self):
+        # skip the cache in dev mode unless the feed source is rate limited
+        return not settings.DEBUG or self.rate_limited
 
+    def is_stale(self, cached_feed, margin=0):
+        return time.time() - cached_feed["refreshed_at"] >= self.cache_timeout - margin
+
+    def build_feed_items(self):
+        """Fetch source data and convert it into a list of render-ready feed item dicts"""
+        source_feed_data = self._get_feed_source_data()
+        if not source_feed_data:
+            return []
         return [asdict(self.to_feed_item(item)) for item in source_feed_data]
 
+    def refresh(self):
+        """
+        Rebuild and cache the feed items. Empty results are not cached so that items cached before the feed source
+        went down keep being served until they expire
+        """
+        feed_items = self.build_feed_items()
+        if not feed_items:
+            logger.warning("No feed data found [%s]", self.cache_key)
+            return []
+        cached_feed = {"items": feed_items, "refreshed_at": time.time()}
+        cache.set(self.cache_key, cached_feed, self.cache_timeout + STALE_CACHE_TIMEOUT)
+        return feed_items
+
+    def schedule_refresh(self):
+        # at most one pending refresh per feed variant
+        if cache.add(f"{self.cache_key}_refreshing", 1, FEED_REFRESH_INTERVAL):
+            from .tasks import refresh_feed
+
+            refresh_feed(self.__class__.__name__, self.max_number_of_items)
+
+    @classmethod
+    def invalidate(cls):
+        """Discard the cached items of every variant of this feed and rebuild the default one in the background"""
+        cache.set(cls.get_version_key(), time.time_ns(), None)
+        cls().schedule_refresh()
+
+    def get_feed_items(self):
+        """
+        Returns cached feed items, stale items are returned while a background task refreshes them
+        """
+        if not self.use_cache:
+            return self.build_feed_items()
+        cached_feed = cache.get(self.cache_key)
+        if cached_feed is None:
+            return self.refresh()
+        if self.is_stale(cached_feed):
+            self.schedule_refresh()
+        return cached_feed["items"]
+
 
 class ReviewedModelFeed(AbstractFeed):
     def _get_feed_source_data(self):
@@ -377,6 +427,40 @@ class YouTubeFeed(AbstractFeed):
         )
 
 
+HOMEPAGE_FEEDS = {
+    feed_class.__name__: feed_class
+    for feed_class in (
+        ReviewedModelFeed,
+        EventFeed,
+        ForumFeed,
+        ForumCategoryFeed,
+        JobFeed,
+        YouTubeFeed,
+    )
+}
+
+
+def refresh_stale_feeds(margin=FEED_REFRESH_INTERVAL):
+    """
+    Refresh the default variant of every homepage feed that is missing from the cache or would go stale within
+    margin seconds so that visitors are rarely served stale items
+    :return: the number of feeds refreshed
+    """
+    refreshed = 0
+    for feed_class in HOMEPAGE_FEEDS.values():
+        feed = feed_class()
+        cached_feed = cache.get(feed.cache_key)
+        if cached_feed is not None and not feed.is_stale(cached_feed, margin):
+            continue
+        try:
+            feed.refresh()
+            refreshed += 1
+        except Exception:
+            # keep refreshing the other feeds if a feed source is unavailable
+            logger.exception("unable to refresh feed %s", feed_class.__name__)
+    return refreshed
+
+
 class BaseFeedView(View):
 
     feed_class = None
@@ -0,0 +1,112 @@
+import logging
+import random
+import timeit
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from home.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+def convert_release_metrics_to_timeseries_pandas(metrics, start_year, category=None):
+    """
+    Reference pandas implementation of Metrics.convert_release_metrics_to_timeseries
+    """
+    df = pd.DataFrame.from_records(metrics)
+    df.replace([None], "None", inplace=True)
+    if category is None:
+        category = df.columns[0]
+    if start_year < df["year"].min():
+        # add an empty record for the start year
+        start_year_df = pd.DataFrame(
+            [["other", start_year, 0]], columns=[category, "year", "count"]
+        )
+        df = pd.concat([start_year_df, df])
+    # set up a pivot table with year columns and row categories (e.g., os, platform, lang)
+    categories_by_year = df.pivot_table(
+        values="count",
+        index=category,
+        columns="year",
+        aggfunc="first",
+        fill_value=0,
+    )
+    full_date_range = pd.date_range(
+        str(df["year"].min()), str(df["year"].max()), freq="YS"
+    )
+    # reindex the columns to include all years in the range
+    categories_by_year = categories_by_year.reindex(
+        columns=full_date_range.year, fill_value=0
+    )
+    included_categories_mask = (
+        categories_by_year.max(axis=1) >= Metrics.MINIMUM_CATEGORY_COUNT
+    )
+    other_categories_mask = (
+        categories_by_year.max(axis=1) < Metrics.MINIMUM_CATEGORY_COUNT
+    )
+    result_df = categories_by_year.loc[included_categories_mask].copy()
+    result_df.loc["other"] = categories_by_year.loc[other_categories_mask].sum(axis=0)
+    category_list = result_df.index.drop_duplicates().tolist()
+    return [
+        {"name": category, "data": result_df.loc[category].tolist()}
+        for category in category_list
+    ]
+
+
+class Command(BaseCommand):
+    help = """compare the numpy metrics timeseries builder against the previous pandas implementation"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--categories",
+            type=int,
+            default=40,
+            help="number of distinct categories (e.g., programming languages) to generate",
+        )
+        parser.add_argument(
+            "--years", type=int, default=20, help="number of years to generate"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=200, help="number of timed runs per builder"
+        )
+
+    def generate_metrics(self, categories, years, start_year=2005):
+        rng = random.Random(categories * years)
+        metrics = []
+        for year in range(start_year, start_year + years):
+            for i in range(categories):
+                # sparse data, not every category has releases every year
+                if rng.random() < 0.7:
+                    metrics.append(
+                        {
+                            "language": f"lang-{i}",
+                            "year": year,
+                            "count": rng.randint(0, 60),
+                        }
+                    )
+        metrics.append({"language": None, "year": start_year + 1, "count": 12})
+        return metrics
+
+    def handle(self, *args, **options):
+        metrics = self.generate_metrics(options["categories"], options["years"])
+        start_year = 2000
+        m = Metrics()
+        expected = convert_release_metrics_to_timeseries_pandas(metrics, start_year)
+        actual = m.convert_release_metrics_to_timeseries(metrics, start_year)
+        if actual != expected:
+            raise ValueError("numpy and pandas timeseries builders disagree")
+        repeat = options["repeat"]
+        pandas_time = timeit.timeit(
+            lambda: convert_release_metrics_to_timeseries_pandas(metrics, start_year),
+            number=repeat,
+        )
+        numpy_time = timeit.timeit(
+            lambda: m.convert_release_metrics_to_timeseries(metrics, start_year),
+            number=repeat,
+        )
+        self.stdout.write(
+            f"{len(metrics)} records, {repeat} runs\n"
+            f"pandas: {pandas_time / repeat * 1000:.3f} ms per run\n"
+            f"numpy: {numpy_time / repeat * 1000:.3f} ms per run ({pandas_time / numpy_time:.1f}x)"
+        )
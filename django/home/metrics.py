@@ -1,12 +1,15 @@
 import logging
-import pandas as pd
+import numpy as np
 from collections import defaultdict
-from django.db import connection
+from django.db import connection, transaction
 from django.core.cache import cache
-from django.db.models import Count, F
+from django.db.models import Count, F, Max
+from django.utils import timezone
+from django_redis import get_redis_connection
 
 from core.models import MemberProfile, ComsesGroups
 from library.models import CodebaseRelease, CodebaseReleaseDownload, Codebase
+from .models import MetricsAggregate
 
 
 logger = logging.getLogger(__name__)
@@ -16,6 +19,8 @@ class Metrics:
     REDIS_METRICS_KEY = "all_comses_metrics"
     DEFAULT_METRICS_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # 1 week
     MINIMUM_CATEGORY_COUNT = 10  # the threshold at which we group all other nominal values into an "other" category
+    # redis set of publication years that lost a codebase or release, see record_changed_year
+    CHANGED_YEARS_KEY = "metrics_changed_years"
 
     def get_all_data(self, force=False):
         data = cache.get(Metrics.REDIS_METRICS_KEY)
@@ -23,16 +28,173 @@ class Metrics:
             return self.cache_all()
         return data
 
-    def cache_all(self):
+    def cache_all(self, full=False):
         """
-        recompute and cache metrics data in redis
+        update the persisted per-year aggregates and cache the metrics data built from them in redis
         """
+        self.update_aggregates(full=full)
         all_data = self.generate_metrics_data()
         cache.set(
             Metrics.REDIS_METRICS_KEY, all_data, Metrics.DEFAULT_METRICS_CACHE_TIMEOUT
         )
         return all_data
 
+    def count_by_year(self, queryset, date_field, years=None, category_field=None):
+        """
+        Returns a values queryset of yearly counts (with keys year, count and optionally category) of the
+        given queryset, restricted to the given years
+        """
+        if years is not None:
+            queryset = queryset.filter(**{f"{date_field}__year__in": years})
+        values = {"year": F(f"{date_field}__year")}
+        if category_field is not None:
+            values["category"] = F(category_field)
+        return queryset.values(**values).annotate(count=Count("year")).order_by()
+
+    def get_aggregate_querysets(self, years=None):
+        """
+        Returns a dict of metric name -> values queryset of the yearly counts persisted as MetricsAggregates
+        """
+        public_releases = CodebaseRelease.objects.public()
+        return {
+            "totalMembers": self.count_by_year(
+                MemberProfile.objects.public(), "user__date_joined", years
+            ),
+            "fullMembers": self.count_by_year(
+                ComsesGroups.FULL_MEMBER.users(), "date_joined", years
+            ),
+            "totalModels": self.count_by_year(
+                Codebase.objects.public(), "first_published_at", years
+            ),
+            "reviewedModels": self.count_by_year(
+                Codebase.objects.public(peer_reviewed=True), "first_published_at", years
+            ),
+            "totalDownloads": self.count_by_year(
+                CodebaseReleaseDownload.objects.all(), "date_created", years
+            ),
+            "totalReleases": self.count_by_year(
+                public_releases, "first_published_at", years
+            ),
+            "reviewedReleases": self.count_by_year(
+                CodebaseRelease.objects.public(peer_reviewed=True),
+                "first_published_at",
+                years,
+            ),
+            "releasesByOs": self.count_by_year(
+                public_releases, "first_published_at", years, category_field="os"
+            ),
+            "releasesByPlatform": self.count_by_year(
+                public_releases,
+                "first_published_at",
+                years,
+                category_field="platform_tags__name",
+            ),
+            "releasesByLanguage": self.count_by_year(
+                public_releases,
+                "first_published_at",
+                years,
+                category_field="programming_languages__name",
+            ),
+        }
+
+    @classmethod
+    def record_changed_year(cls, year):
+        """
+        Record a publication year that lost a codebase or release (unpublished, deleted or moved to another year)
+        once the current transaction commits, so that the next incremental update recomputes it
+        """
+        transaction.on_commit(
+            lambda: get_redis_connection("default").sadd(cls.CHANGED_YEARS_KEY, year)
+        )
+
+    def get_recorded_years(self):
+        return {
+            int(year)
+            for year in get_redis_connection("default").smembers(
+                Metrics.CHANGED_YEARS_KEY
+            )
+        }
+
+    def clear_recorded_years(self, years):
+        get_redis_connection("default").srem(Metrics.CHANGED_YEARS_KEY, *years)
+
+    def get_changed_years(self, since, recorded_years=()):
+        """
+        Returns the years whose aggregates may have changed since the given datetime: the current year (new
+        members, models and downloads), the recorded years that lost a codebase or release and the publication
+        years of codebases and releases modified since. Changes that cannot be detected this way (e.g.,
+        deactivated accounts) are picked up by a full update.
+        """
+        years = {timezone.now().year, *recorded_years}
+        for model in (Codebase, CodebaseRelease):
+            years.update(
+                model.objects.filter(
+                    last_modified__gte=since, first_published_at__isnull=False
+                )
+                .values_list("first_published_at__year", flat=True)
+                .distinct()
+            )
+        return sorted(years)
+
+    @transaction.atomic
+    def update_aggregates(self, full=False):
+        """
+        Recomputes the persisted yearly aggregates for the years changed since the last update, or for all
+        years if full is True or nothing has been aggregated yet
+        """
+        last_updated = MetricsAggregate.objects.aggregate(
+            last_updated=Max("last_updated")
+        )["last_updated"]
+        recorded_years = self.get_recorded_years()
+        years = None
+        if not full and last_updated is not None:
+            years = self.get_changed_years(last_updated, recorded_years)
+        logger.debug("updating metrics aggregates for years: %s", years or "all")
+        # changes made while the aggregates are being computed are picked up by the next update
+        started = timezone.now()
+        for metric, queryset in self.get_aggregate_querysets(years).items():
+            stale_aggregates = MetricsAggregate.objects.filter(metric=metric)
+            if years is not None:
+                stale_aggregates = stale_aggregates.filter(year__in=years)
+            stale_aggregates.delete()
+            MetricsAggregate.objects.bulk_create(
+                MetricsAggregate(
+                    metric=metric,
+                    category=row.get("category", ""),
+                    year=row["year"],
+                    count=row["count"],
+                    last_updated=started,
+                )
+                for row in queryset
+                if row["year"] is not None
+            )
+        # touch the remaining rows so the next update only looks at changes made after this one
+        MetricsAggregate.objects.update(last_updated=started)
+        if recorded_years:
+            transaction.on_commit(lambda: self.clear_recorded_years(recorded_years))
+
+    def get_aggregates(self):
+        """
+        Returns a dict of metric name -> list of persisted yearly counts ordered by year
+        """
+        aggregates = defaultdict(list)
+        for metric, category, year, count in MetricsAggregate.objects.order_by(
+            "year", "category"
+        ).values_list("metric", "category", "year", "count"):
+            aggregates[metric].append(
+                {"category": category, "year": year, "count": count}
+            )
+        return aggregates
+
+    def to_totals(self, aggregates):
+        return [{"year": a["year"], "total": a["count"]} for a in aggregates]
+
+    def to_category_metrics(self, aggregates, category):
+        return [
+            {category: a["category"], "year": a["year"], "count": a["count"]}
+            for a in aggregates
+        ]
+
     def generate_metrics_data(self):
         """
         Returns all metrics data in a format amenable to HighCharts / frontend
@@ -72,9 +234,14 @@ class Metrics:
             ]},
         }
         """
-        member_metrics, members_start_year = self.get_members_by_year_timeseries()
-        model_metrics, model_start_year = self.get_model_metrics_timeseries()
-        release_metrics, release_start_year = self.get_release_metrics_timeseries()
+        aggregates = self.get_aggregates()
+        member_metrics, members_start_year = self.get_members_by_year_timeseries(
+            aggregates
+        )
+        model_metrics, model_start_year = self.get_model_metrics_timeseries(aggregates)
+        release_metrics, release_start_year = self.get_release_metrics_timeseries(
+            aggregates
+        )
         institution_metrics = self.get_member_affiliation_data()
         min_start_year = min(members_start_year, model_start_year, release_start_year)
         return dict(
@@ -85,7 +252,7 @@ class Metrics:
             **release_metrics,
         )
 
-    def get_members_by_year_timeseries(self):
+    def get_members_by_year_timeseries(self, aggregates):
         """
         totalMembers: {
             "title": "Total Members",
@@ -97,18 +264,8 @@ class Metrics:
             }]
         },
         """
-        total_counts = list(
-            MemberProfile.objects.public()
-            .values(year=F("user__date_joined__year"))
-            .annotate(total=Count("year"))
-            .order_by("year")
-        )
-        full_member_counts = list(
-            ComsesGroups.FULL_MEMBER.users()
-            .values(year=F("date_joined__year"))
-            .annotate(total=Count("year"))
-            .order_by("year")
-        )
+        total_counts = self.to_totals(aggregates["totalMembers"])
+        full_member_counts = self.to_totals(aggregates["fullMembers"])
         min_start_year = min(total_counts[0]["year"], full_member_counts[0]["year"])
         member_metrics = {
             "totalMembers": {
@@ -136,7 +293,7 @@ class Metrics:
         }
         return member_metrics, min_start_year
 
-    def get_model_metrics_timeseries(self):
+    def get_model_metrics_timeseries(self, aggregates):
         """
         model_by_os: {
                 "title": "Models by OS",
@@ -151,24 +308,9 @@ class Metrics:
                 ]
             },
         """
-        total_models_by_year = list(
-            Codebase.objects.public()
-            .values(year=F("first_published_at__year"))
-            .annotate(total=Count("year"))
-            .order_by("year")
-        )
-        reviewed_models_by_year = list(
-            Codebase.objects.public(peer_reviewed=True)
-            .values(year=F("first_published_at__year"))
-            .annotate(total=Count("year"))
-            .order_by("year")
-        )
-
-        release_downloads = list(
-            CodebaseReleaseDownload.objects.values(year=F("date_created__year"))
-            .annotate(total=Count("year"))
-            .order_by("year")
-        )
+        total_models_by_year = self.to_totals(aggregates["totalModels"])
+        reviewed_models_by_year = self.to_totals(aggregates["reviewedModels"])
+        release_downloads = self.to_totals(aggregates["totalDownloads"])
         min_start_year = total_models_by_year[0]["year"]
         model_metrics = {
             "totalModels": {
@@ -208,28 +350,19 @@ class Metrics:
                     }
                 ],
             },
-            "releasesByOs": self.get_release_os_timeseries(min_start_year),
-            "releasesByPlatform": self.get_release_platform_timeseries(min_start_year),
+            "releasesByOs": self.get_release_os_timeseries(aggregates, min_start_year),
+            "releasesByPlatform": self.get_release_platform_timeseries(
+                aggregates, min_start_year
+            ),
             "releasesByLanguage": self.get_release_programming_language_timeseries(
-                min_start_year
+                aggregates, min_start_year
             ),
         }
         return model_metrics, min_start_year
 
-    def get_release_metrics_timeseries(self):
-
-        total_releases_by_year = list(
-            CodebaseRelease.objects.public()
-            .values(year=F("first_published_at__year"))
-            .annotate(total=Count("year"))
-            .order_by("year")
-        )
-        reviewed_releases_by_year = list(
-            CodebaseRelease.objects.public(peer_reviewed=True)
-            .values(year=F("first_published_at__year"))
-            .annotate(total=Count("year"))
-            .order_by("year")
-        )
+    def get_release_metrics_timeseries(self, aggregates):
+        total_releases_by_year = self.to_totals(aggregates["totalReleases"])
+        reviewed_releases_by_year = self.to_totals(aggregates["reviewedReleases"])
 
         min_start_year = total_releases_by_year[0]["year"]
 
@@ -295,7 +428,7 @@ class Metrics:
 
         return institution_data
 
-    def get_release_os_timeseries(self, start_year):
+    def get_release_os_timeseries(self, aggregates, start_year):
         """
         Generate timeseries data for each possible release OS option
 
@@ -314,11 +447,8 @@ class Metrics:
             ]
         },
         """
-        os_metrics = list(
-            CodebaseRelease.objects.public()
-            .values(operating_systems=F("os"), year=F("first_published_at__year"))
-            .annotate(count=Count("year"))
-            .order_by("year")
+        os_metrics = self.to_category_metrics(
+            aggregates["releasesByOs"], "operating_systems"
         )
 
         return {
@@ -330,14 +460,9 @@ class Metrics:
             ),
         }
 
-    def get_release_platform_timeseries(self, start_year):
-        platform_metrics = list(
-            CodebaseRelease.objects.public()
-            .values(
-                platform=F("platform_tags__name"), year=F("first_published_at__year")
-            )
-            .annotate(count=Count("year"))
-            .order_by("year")
+    def get_release_platform_timeseries(self, aggregates, start_year):
+        platform_metrics = self.to_category_metrics(
+            aggregates["releasesByPlatform"], "platform"
         )
         return {
             "title": "Models by Platform",
@@ -348,15 +473,9 @@ class Metrics:
             ),
         }
 
-    def get_release_programming_language_timeseries(self, start_year):
-        programming_language_metrics = list(
-            CodebaseRelease.objects.public()
-            .values(
-                programming_language_names=F("programming_languages__name"),
-                year=F("first_published_at__year"),
-            )
-            .annotate(count=Count("year"))
-            .order_by("year")
+    def get_release_programming_language_timeseries(self, aggregates, start_year):
+        programming_language_metrics = self.to_category_metrics(
+            aggregates["releasesByLanguage"], "programming_language_names"
         )
 
         # FIXME: temporary fix to combine netlogo and logo
@@ -431,51 +550,44 @@ class Metrics:
         Windows        1   Nan->0   15   22   15     ..
         macOS
         """
-        df = pd.DataFrame.from_records(metrics)
-        df.replace([None], "None", inplace=True)
+        if not metrics:
+            return []
         if category is None:
-            category = df.columns[0]
-        if start_year < df["year"].min():
-            # add an empty record for the start year
-            start_year_df = pd.DataFrame(
-                [["other", start_year, 0]], columns=[category, "year", "count"]
-            )
-            df = pd.concat([start_year_df, df])
-        # set up a pivot table with year columns and row categories (e.g., os, platform, lang)
-        categories_by_year = df.pivot_table(
-            values="count",
-            index=category,
-            columns="year",
-            aggfunc="first",
-            fill_value=0,
+            category = next(iter(metrics[0]))
+        names = ["None" if m[category] is None else m[category] for m in metrics]
+        years = [m["year"] for m in metrics]
+        first_year = min(years)
+        if start_year < first_year:
+            # add an empty 'other' row so the series starts at start_year
+            first_year = start_year
+            names.append("other")
+            years.append(start_year)
+        # rows of the year x category matrix are the sorted category names, columns are consecutive years
+        categories = sorted(set(names))
+        category_index = {name: i for i, name in enumerate(categories)}
+        categories_by_year = np.zeros(
+            (len(categories), max(years) - first_year + 1), dtype=np.int64
         )
-        full_date_range = pd.date_range(
-            str(df["year"].min()), str(df["year"].max()), freq="YS"
-        )
-        # reindex the columns to include all years in the range
-        categories_by_year = categories_by_year.reindex(
-            columns=full_date_range.year, fill_value=0
-        )
-
-        # Extract rows whose max values are less than 10,
-        # and integrate into an 'other' row
+        assigned = np.zeros(categories_by_year.shape, dtype=bool)
+        for name, year, metric in zip(names, years, metrics):
+            cell = (category_index[name], year - first_year)
+            # keep the first count for duplicate category / year pairs
+            if not assigned[cell]:
+                categories_by_year[cell] = metric["count"]
+                assigned[cell] = True
+
+        # fold categories whose max values are less than MINIMUM_CATEGORY_COUNT into an 'other' row
         included_categories_mask = (
             categories_by_year.max(axis=1) >= Metrics.MINIMUM_CATEGORY_COUNT
         )
-        other_categories_mask = (
-            categories_by_year.max(axis=1) < Metrics.MINIMUM_CATEGORY_COUNT
-        )
-        # build a new dataframe with the included categories and an 'other' row
-        result_df = categories_by_year.loc[included_categories_mask]
-        # this generates a SettingWithCopyWarning
-        # See the caveats in the documentation: https://pandas.pydata.org/pandas-docs/stable/user_guide/indexing.html#returning-a-view-versus-a-copy"
-        result_df.loc["other"] = categories_by_year.loc[other_categories_mask].sum(
-            axis=0
-        )
-
-        # Convert result data frame into a list of Metrics Series objects
-        category_list = result_df.index.drop_duplicates().tolist()
-        return [
-            {"name": category, "data": result_df.loc[category].tolist()}
-            for category in category_list
+        other_row = categories_by_year[~included_categories_mask].sum(axis=0).tolist()
+        series = [
+            {"name": name, "data": other_row if name == "other" else row.tolist()}
+            for name, row, included in zip(
+                categories, categories_by_year, included_categories_mask
+            )
+            if included
         ]
+        if not any(s["name"] == "other" for s in series):
+            series.append({"name": "other", "data": other_row})
+        return series
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.22 on 2026-10-18 06:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0021_remove_landingpage_community_statement_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MetricsAggregate",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "metric",
+                    models.CharField(help_text="Metrics chart key", max_length=64),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        blank=True,
+                        help_text="Category the count is broken down by (e.g., operating system), blank for plain yearly totals",
+                        max_length=255,
+                        null=True,
+                    ),
+                ),
+                ("year", models.PositiveIntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "last_updated",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["metric", "year"], name="home_metric_metric_47c488_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1116,3 +1116,29 @@ class NewsPageRelatedLink(Orderable):
         FieldPanel("name"),
         FieldPanel("url"),
     ]
+
+
+class MetricsAggregate(models.Model):
+    """
+    Persisted per-year counts backing the metrics dashboard (see home.metrics.Metrics). Rows are recomputed
+    only for the years touched since the last update.
+    """
+
+    metric = models.CharField(max_length=64, help_text=_("Metrics chart key"))
+    category = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        help_text=_(
+            "Category the count is broken down by (e.g., operating system), blank for plain yearly totals"
+        ),
+    )
+    year = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    last_updated = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"[{self.metric}] {self.category} {self.year}: {self.count}"
+
+    class Meta:
+        indexes = [models.Index(fields=["metric", "year"])]
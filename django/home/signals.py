@@ -4,12 +4,22 @@ import shortuuid
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from wagtail.models import Site as WagtailSite
 
 from core.discourse import create_discourse_user
-from core.models import MemberProfile, EXCLUDED_USERNAMES
+from core.models import Event, Job, MemberProfile, EXCLUDED_USERNAMES
+from library.models import (
+    Codebase,
+    CodebaseRelease,
+    PeerReviewEvent,
+    PeerReviewEventLog,
+)
+
+from .feeds import EventFeed, JobFeed, ReviewedModelFeed
+from .metrics import Metrics
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +69,36 @@ def on_user_save(sender, instance: User, created, **kwargs):
                 member_profile.save()
 
 
+@receiver(pre_save, sender=Codebase, dispatch_uid="codebase_metrics_year")
+@receiver(pre_save, sender=CodebaseRelease, dispatch_uid="release_metrics_year")
+def on_publication_year_change(sender, instance, raw=False, **kwargs):
+    """
+    Record the previous publication year of an unpublished codebase or release, or of one moved to another year,
+    since incremental metrics updates only find the current publication years of modified rows
+    """
+    if raw or instance._state.adding:
+        return
+    previous = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("first_published_at", flat=True)
+        .first()
+    )
+    if previous is None:
+        return
+    if (
+        instance.first_published_at is None
+        or instance.first_published_at.year != previous.year
+    ):
+        Metrics.record_changed_year(previous.year)
+
+
+@receiver(post_delete, sender=Codebase, dispatch_uid="codebase_metrics_delete")
+@receiver(post_delete, sender=CodebaseRelease, dispatch_uid="release_metrics_delete")
+def on_published_delete(sender, instance, **kwargs):
+    if instance.first_published_at is not None:
+        Metrics.record_changed_year(instance.first_published_at.year)
+
+
 @receiver(post_save, sender=WagtailSite, dispatch_uid="wagtail_site_sync")
 def sync_wagtail_django_sites(sender, instance: WagtailSite, created: bool, **kwargs):
     """
@@ -70,3 +110,26 @@ def sync_wagtail_django_sites(sender, instance: WagtailSite, created: bool, **kw
         site.name = instance.site_name
         site.domain = instance.hostname
         site.save()
+
+
+@receiver(post_save, sender=Event, dispatch_uid="event_feed_save")
+@receiver(post_delete, sender=Event, dispatch_uid="event_feed_delete")
+def on_event_change(sender, instance: Event, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(EventFeed.invalidate)
+
+
+@receiver(post_save, sender=Job, dispatch_uid="job_feed_save")
+@receiver(post_delete, sender=Job, dispatch_uid="job_feed_delete")
+def on_job_change(sender, instance: Job, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(JobFeed.invalidate)
+
+
+@receiver(post_save, sender=PeerReviewEventLog, dispatch_uid="reviewed_model_feed")
+def on_peer_review_event(sender, instance: PeerReviewEventLog, created, **kwargs):
+    """
+    Certified releases are listed in the reviewed model feed
+    """
+    if created and instance.action == PeerReviewEvent.RELEASE_CERTIFIED.name:
+        transaction.on_commit(ReviewedModelFeed.invalidate)
@@ -0,0 +1,20 @@
+import logging
+
+from huey import crontab
+from huey.contrib.djhuey import db_periodic_task, db_task, lock_task
+
+from . import feeds
+
+logger = logging.getLogger(__name__)
+
+
+@db_task(retries=1, retry_delay=60)
+def refresh_feed(feed_name: str, max_items: int = None):
+    feeds.HOMEPAGE_FEEDS[feed_name](max_items=max_items).refresh()
+
+
+@db_periodic_task(crontab(minute="*/10"))
+def refresh_homepage_feeds():
+    with lock_task("refresh-homepage-feeds"):
+        refreshed = feeds.refresh_stale_feeds()
+        logger.debug("refreshed %s homepage feeds", refreshed)
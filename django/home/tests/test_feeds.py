@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
+from unittest import mock
 
+from django.core.cache import cache
 from django.test import override_settings
 
 from core.models import Event, Job
@@ -90,6 +92,25 @@ class LandingPageFeedsTestCase(BaseModelTestCase):
     def test_job_feed(self):
         self._verify_feed_structure(JobFeed(), Job.objects.count())
 
+    def test_feed_items_cached(self):
+        feed = EventFeed()
+        cache.delete(feed.cache_key)
+        feed_items = feed.get_feed_items()
+        with self.assertNumQueries(0):
+            self.assertEqual(feed.get_feed_items(), feed_items)
+
+        # stale items are served while a refresh is scheduled
+        cached_feed = cache.get(feed.cache_key)
+        cached_feed["refreshed_at"] -= feed.cache_timeout
+        cache.set(feed.cache_key, cached_feed)
+        with mock.patch.object(EventFeed, "schedule_refresh") as schedule_refresh:
+            self.assertEqual(feed.get_feed_items(), feed_items)
+            schedule_refresh.assert_called_once()
+
+            cache_key = feed.cache_key
+            EventFeed.invalidate()
+            self.assertNotEqual(feed.cache_key, cache_key)
+
     # FIXME: skipped until there is a mock YT api response
     # def test_youtube_feed(self):
     #     self._verify_feed_structure(YouTubeFeed())
@@ -1,6 +1,17 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.db.models import Max
 from django.test import TestCase
+from django.utils import timezone
+from django_redis import get_redis_connection
 
+from core.models import ComsesGroups
+from core.tests.base import UserFactory
 from home.metrics import Metrics
+from home.models import MetricsAggregate
+from library.models import Codebase, CodebaseRelease
+from library.tests.base import CodebaseFactory
 
 
 class MetricsTestCase(TestCase):
@@ -54,3 +65,102 @@ class MetricsTestCase(TestCase):
                 chart_data["name"] in OS_NAMES, f"Invalid OS name {chart_data['name']}"
             )
             self.assertEqual(len(chart_data["data"]), 7, "Should be 7 years of data")
+
+    def test_small_categories_are_folded_into_other(self):
+        m = Metrics()
+        highcharts_timeseries = m.convert_release_metrics_to_timeseries(
+            self.os_metrics, start_year=2014
+        )
+        self.assertEqual(
+            [chart_data["name"] for chart_data in highcharts_timeseries],
+            ["macos", "platform_independent", "windows", "other"],
+        )
+        other = highcharts_timeseries[-1]
+        # linux + other + blank os
+        self.assertEqual(other["data"], [8, 6, 0, 5, 13])
+
+    def test_os_timeseries(self):
+        m = Metrics()
+        os_timeseries = [
+            {"name": "macos", "data": [8, 19, 0, 21, 18]},
+            {"name": "platform_independent", "data": [55, 60, 0, 37, 56]},
+            {"name": "windows", "data": [32, 28, 0, 67, 54]},
+            {"name": "other", "data": [8, 6, 0, 5, 13]},
+        ]
+        # series start at the earlier of start_year and the first year with data
+        for start_year, leading_zeros in ((2012, [0, 0]), (2014, []), (2016, [])):
+            self.assertEqual(
+                m.convert_release_metrics_to_timeseries(self.os_metrics, start_year),
+                [
+                    {"name": s["name"], "data": leading_zeros + s["data"]}
+                    for s in os_timeseries
+                ],
+            )
+
+
+class MetricsAggregateTestCase(TestCase):
+    def setUp(self):
+        ComsesGroups.initialize()
+        self.submitter = UserFactory().create()
+        self.codebase_factory = CodebaseFactory(submitter=self.submitter)
+        get_redis_connection("default").delete(Metrics.CHANGED_YEARS_KEY)
+
+    def get_count(self, metric, year):
+        aggregate = MetricsAggregate.objects.filter(metric=metric, year=year).first()
+        return aggregate.count if aggregate else 0
+
+    def test_incremental_update_only_touches_changed_years(self):
+        release = self.codebase_factory.create_published_release()
+        codebase = release.codebase
+        current_year = timezone.now().year
+        m = Metrics()
+        m.update_aggregates(full=True)
+        self.assertEqual(self.get_count("totalModels", current_year), 1)
+
+        # a stale aggregate for a year nothing changed in
+        MetricsAggregate.objects.create(metric="totalModels", year=2001, count=5)
+        # move the codebase to a year that has no aggregates yet
+        Codebase.objects.filter(pk=codebase.pk).update(
+            first_published_at=datetime(2010, 6, 1, tzinfo=dt_timezone.utc),
+            last_modified=timezone.now(),
+        )
+        last_updated = MetricsAggregate.objects.aggregate(Max("last_updated"))[
+            "last_updated__max"
+        ]
+        self.assertEqual(m.get_changed_years(last_updated), [2010, current_year])
+        m.update_aggregates()
+        # the publication year of the modified codebase and the current year are recomputed
+        self.assertEqual(self.get_count("totalModels", 2010), 1)
+        self.assertEqual(self.get_count("totalModels", current_year), 0)
+        # other years are left as they were
+        self.assertEqual(self.get_count("totalModels", 2001), 5)
+
+        m.update_aggregates(full=True)
+        self.assertEqual(self.get_count("totalModels", 2001), 0)
+        self.assertEqual(self.get_count("totalModels", 2010), 1)
+
+    def test_incremental_update_recomputes_years_of_unpublished_releases(self):
+        release = self.codebase_factory.create_published_release()
+        published = datetime(2005, 6, 1, tzinfo=dt_timezone.utc)
+        Codebase.objects.filter(pk=release.codebase_id).update(
+            first_published_at=published
+        )
+        CodebaseRelease.objects.filter(pk=release.pk).update(
+            first_published_at=published
+        )
+        m = Metrics()
+        m.update_aggregates(full=True)
+        self.assertEqual(self.get_count("totalReleases", 2005), 1)
+        self.assertEqual(self.get_count("totalModels", 2005), 1)
+
+        release.refresh_from_db()
+        with mock.patch(
+            "core.search_indexing.enqueue_objects"
+        ), self.captureOnCommitCallbacks(execute=True):
+            release.unpublish()
+        self.assertEqual(m.get_recorded_years(), {2005})
+        with self.captureOnCommitCallbacks(execute=True):
+            m.update_aggregates()
+        self.assertEqual(self.get_count("totalReleases", 2005), 0)
+        self.assertEqual(self.get_count("totalModels", 2005), 0)
+        self.assertEqual(m.get_recorded_years(), set())
@@ -1,9 +1,15 @@
 import csv
+import json
 import logging
 import re
 import requests
+import ssl
+import threading
+import time
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 from django.conf import settings
 
@@ -15,8 +21,9 @@ from .models import (
     DataCiteRegistrationLog,
 )
 
-from datacite import DataCiteRESTClient, schema45
+from datacite import schema45
 from datacite.errors import (
+    HttpError,
     DataCiteError,
     DataCiteNoContentError,
     DataCiteBadRequestError,
@@ -27,6 +34,9 @@ from datacite.errors import (
     DataCitePreconditionError,
     DataCiteServerError,
 )
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from requests.exceptions import RequestException
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +50,24 @@ DOI_PATTERN = re.compile(f"{DATACITE_PREFIX}/[-._;()/:a-zA-Z0-9]+")
 
 MAX_DATACITE_API_WORKERS = 25
 
+# transient DataCite responses worth retrying, besides 5xx server errors. DataCiteError.factory maps every status
+# code it does not know (e.g., 422 Unprocessable Entity) to a DataCiteServerError so check the actual status code
+RETRYABLE_DATACITE_STATUS_CODES = {429}
+
+
+def is_retryable_datacite_error(error):
+    """
+    Returns true for connection problems and 5xx or rate limiting responses from DataCite, permanent failures like
+    validation errors are not worth retrying
+    """
+    if isinstance(error, HttpError):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        return False
+    return status_code >= 500 or status_code in RETRYABLE_DATACITE_STATUS_CODES
+
+
 VERIFICATION_MESSAGE = r"""
                 _  __       _                         
                (_)/ _|     (_)                        
@@ -105,6 +133,107 @@ def is_valid_doi(doi: str) -> bool:
     return False
 
 
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces out calls to wait() so that at most `rate` calls per second proceed
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DataCiteSessionClient:
+    """
+    Client for the parts of the DataCite REST API used here (mint, update and get DOI metadata) that sends every
+    request over one requests.Session with a connection pool sized for the worker threads, so connections to the
+    DataCite API are kept alive and reused instead of opening a new connection for every call. Errors are raised
+    as the datacite package's DataCiteErrors and HttpErrors, like DataCiteRESTClient.
+    """
+
+    HEADERS = {"content-type": "application/vnd.api+json"}
+
+    def __init__(
+        self,
+        username,
+        password,
+        prefix,
+        test_mode=False,
+        url=None,
+        timeout=None,
+        pool_size=MAX_DATACITE_API_WORKERS,
+    ):
+        self.prefix = prefix
+        self.timeout = timeout
+        if url:
+            self.api_url = url if url.endswith("/") else f"{url}/"
+        elif test_mode:
+            self.api_url = "https://api.test.datacite.org/"
+        else:
+            self.api_url = "https://api.datacite.org/"
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(username, password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, path, data=None, expected_status=200):
+        """
+        Sends a JSON:API request to the DataCite REST API and returns the "data" member of the response
+        """
+        try:
+            response = self.session.request(
+                method,
+                self.api_url + path,
+                data=None if data is None else json.dumps({"data": data}),
+                headers=self.HEADERS,
+                timeout=self.timeout,
+            )
+        except (RequestException, ssl.SSLError) as e:
+            raise HttpError(e)
+        if response.status_code != expected_status:
+            error = DataCiteError.factory(response.status_code, response.text)
+            error.status_code = response.status_code
+            raise error
+        return response.json()["data"]
+
+    def public_doi(self, metadata, url, doi=None):
+        """mint (or register the given) findable DOI, returns the DOI"""
+        attributes = {
+            **metadata,
+            "prefix": self.prefix,
+            "event": "publish",
+            "url": url,
+        }
+        if doi is not None:
+            attributes["doi"] = doi
+        return self.request("POST", "dois", {"attributes": attributes}, 201)["id"]
+
+    def put_doi(self, doi, data):
+        """update the given DOI, returns its attributes"""
+        return self.request("PUT", f"dois/{doi}", data)["attributes"]
+
+    def get_metadata(self, doi):
+        return self.request("GET", f"dois/{doi}")["attributes"]
+
+
 class DataCiteApi:
     """
     Wrapper around the datacite package:
@@ -114,7 +243,7 @@ class DataCiteApi:
     and checking metadata consistency.
 
     Attributes:
-        datacite_client (DataCiteRESTClient): The DataCite REST API client.
+        datacite_client (DataCiteSessionClient): The DataCite REST API client.
         dry_run (bool): Flag indicating whether the operations should be performed in dry run mode.
     """
 
@@ -145,11 +274,19 @@ class DataCiteApi:
         Raises:
             Exception: If failed to access the DataCite API.
         """
-        self.datacite_client = DataCiteRESTClient(
+        self.max_workers = min(settings.DATACITE_API_WORKERS, MAX_DATACITE_API_WORKERS)
+        self.max_retries = settings.DATACITE_API_MAX_RETRIES
+        self.retry_backoff = settings.DATACITE_API_RETRY_BACKOFF
+        self.rate_limiter = RateLimiter(settings.DATACITE_API_RATE_LIMIT)
+        self.api_url = settings.DATACITE_API_URL
+        self.datacite_client = DataCiteSessionClient(
             username=settings.DATACITE_API_USERNAME,
             password=settings.DATACITE_API_PASSWORD,
             prefix=settings.DATACITE_PREFIX,
-            test_mode=settings.DATACITE_TEST_MODE,
+            test_mode=settings.DATACITE_TEST_MODE and not self.api_url,
+            url=self.api_url or None,
+            timeout=settings.DATACITE_API_TIMEOUT,
+            pool_size=self.max_workers,
         )
 
         self.dry_run = dry_run
@@ -174,12 +311,45 @@ class DataCiteApi:
 
     @property
     def _datacite_heartbeat_url(self):
+        if self.api_url:
+            return f"{self.api_url.rstrip('/')}/heartbeat"
         return (
             "https://api.datacite.org/heartbeat"
             if IS_PRODUCTION and not self.dry_run
             else "https://api.test.datacite.org/heartbeat"
         )
 
+    def _call_datacite(self, func, *args, retries=None, **kwargs):
+        """
+        Calls the given DataCite client method under the shared rate limit, retrying server errors, rate limiting
+        responses and connection problems with exponential backoff
+        """
+        if retries is None:
+            retries = self.max_retries
+        for attempt in range(retries + 1):
+            self.rate_limiter.wait()
+            try:
+                return func(*args, **kwargs)
+            except (DataCiteError, HttpError) as e:
+                if attempt >= retries or not is_retryable_datacite_error(e):
+                    raise
+                delay = self.retry_backoff * 2**attempt
+                logger.warning(
+                    "DataCite request failed (%s), retrying in %s seconds", e, delay
+                )
+                time.sleep(delay)
+
+    @classmethod
+    def _get_error_status(cls, error):
+        """
+        Returns the status code DataCite responded with for the given error, falling back to the status code of
+        the error type for errors raised without a response
+        """
+        return (
+            getattr(error, "status_code", None)
+            or cls.DATACITE_ERRORS_TO_STATUS_CODE[type(error)]
+        )
+
     def _validate_metadata(self, datacite_metadata: DataCiteSchema):
         metadata_dict = datacite_metadata.to_dict()
         try:
@@ -216,15 +386,19 @@ class DataCiteApi:
             datacite_metadata, metadata_dict = self._validate_metadata(
                 datacite_metadata
             )
-            doi = self.datacite_client.public_doi(
-                metadata_dict, url=codebase_or_release.permanent_url
+            # never retry minting, a failed POST may still have registered a new DOI with DataCite
+            doi = self._call_datacite(
+                self.datacite_client.public_doi,
+                metadata_dict,
+                url=codebase_or_release.permanent_url,
+                retries=0,
             )
             codebase_or_release.doi = doi
             codebase_or_release.save()
-        except DataCiteError as e:
+        except (DataCiteError, HttpError) as e:
             logger.error(e)
             message = str(e)
-            http_status = self.DATACITE_ERRORS_TO_STATUS_CODE[type(e)]
+            http_status = self._get_error_status(e)
 
         # refresh DataCiteMetadata to include new DOI in hash
         del codebase_or_release.datacite
@@ -234,6 +408,7 @@ class DataCiteApi:
             "http_status": http_status,
             "message": message,
             "metadata_hash": datacite_metadata.hash(),
+            "inputs_hash": codebase_or_release.get_datacite_metadata_hash(),
         }
         if isinstance(codebase_or_release, Codebase):
             log_record_dict.update(
@@ -248,17 +423,17 @@ class DataCiteApi:
     @classmethod
     def is_metadata_stale(cls, codebase_or_release: Codebase | CodebaseRelease):
         """
-        Returns true if the metadata for the given codebase or release (based on the metadata hash) is out of date with
-        its latest log entry
+        Returns true if the metadata inputs for the given codebase or release (based on the inputs hash) are out of
+        date with its latest log entry, the same check sync_doi_metadata makes for each batch
         """
         try:
             newest_log_entry = DataCiteRegistrationLog.objects.latest_entry(
                 codebase_or_release
             )
-            # always force refresh cached datacite property in case it was computed earlier
-            if hasattr(codebase_or_release, "datacite"):
-                del codebase_or_release.datacite
-            return newest_log_entry.metadata_hash != codebase_or_release.datacite.hash()
+            return (
+                newest_log_entry.inputs_hash
+                != codebase_or_release.get_datacite_metadata_hash()
+            )
 
         except DataCiteRegistrationLog.DoesNotExist:
             # no logs for this item, metadata is stale
@@ -273,7 +448,6 @@ class DataCiteApi:
         if not self.is_metadata_stale(codebase_or_release):
             logger.info("No need to update DOI metadata for %s", codebase_or_release)
             return DataCiteRegistrationLog(), True
-        doi = codebase_or_release.doi
         if self.dry_run:
             logger.debug("DRY RUN")
             logger.debug(
@@ -286,22 +460,43 @@ class DataCiteApi:
         datacite_metadata, metadata_dict = self._validate_metadata(
             codebase_or_release.datacite
         )
-        http_status = 200
-        message = f"Successfully updated metadata for {doi}."
-        updated_metadata_dict = {"attributes": {**metadata_dict}}
+        doi = codebase_or_release.doi
+        http_status, message = self._put_doi_metadata(doi, metadata_dict)
+        log = self._save_log_record(
+            **self._get_update_log_record_dict(
+                codebase_or_release,
+                http_status=http_status,
+                message=message,
+                metadata_hash=datacite_metadata.hash(),
+                inputs_hash=codebase_or_release.get_datacite_metadata_hash(),
+            )
+        )
+        return log, http_status == 200
+
+    def _put_doi_metadata(self, doi, metadata_dict):
+        """
+        Sends updated metadata for the given DOI to DataCite, safe to call from worker threads as it does not touch
+        the database
+
+        Returns:
+            tuple: the (http_status, message) for the update
+        """
         try:
-            self.datacite_client.put_doi(doi, updated_metadata_dict)
+            self._call_datacite(
+                self.datacite_client.put_doi, doi, {"attributes": {**metadata_dict}}
+            )
             logger.debug("Successfully updated metadata for DOI: %s", doi)
-        except DataCiteError as e:
+            return 200, f"Successfully updated metadata for {doi}."
+        except (DataCiteError, HttpError) as e:
             logger.error(e)
-            message = f"Unable to update metadata for {doi}: {e}"
-            http_status = self.DATACITE_ERRORS_TO_STATUS_CODE[type(e)]
-        log_record_dict = {
-            "doi": doi,
-            "http_status": http_status,
-            "message": message,
-            "metadata_hash": datacite_metadata.hash(),
-        }
+            return (
+                self._get_error_status(e),
+                f"Unable to update metadata for {doi}: {e}",
+            )
+
+    @staticmethod
+    def _get_update_log_record_dict(codebase_or_release, **kwargs):
+        log_record_dict = {"doi": codebase_or_release.doi, **kwargs}
         # FIXME: figure out how to better tie parameters to the requested action
         if isinstance(codebase_or_release, Codebase):
             log_record_dict.update(
@@ -313,8 +508,119 @@ class DataCiteApi:
                 release=codebase_or_release,
                 action=DataCiteAction.UPDATE_RELEASE_METADATA,
             )
-        log = self._save_log_record(**log_record_dict)
-        return log, http_status == 200
+        return log_record_dict
+
+    @staticmethod
+    def get_latest_inputs_hashes(items):
+        """
+        Returns a dict mapping (model class, pk) to the inputs hash of the latest successful registration log entry
+        for each of the given codebases and releases, using one query per model instead of one per item
+        """
+        codebase_ids = [item.pk for item in items if isinstance(item, Codebase)]
+        release_ids = [item.pk for item in items if isinstance(item, CodebaseRelease)]
+        latest_hashes = {}
+        for model, field, ids in (
+            (Codebase, "codebase_id", codebase_ids),
+            (CodebaseRelease, "release_id", release_ids),
+        ):
+            if not ids:
+                continue
+            entries = (
+                DataCiteRegistrationLog.objects.filter(
+                    http_status=200, **{f"{field}__in": ids}
+                )
+                .order_by(field, "-timestamp")
+                .distinct(field)
+                .values_list(field, "inputs_hash")
+            )
+            latest_hashes.update(
+                ((model, pk), inputs_hash) for pk, inputs_hash in entries
+            )
+        return latest_hashes
+
+    def sync_doi_metadata(self, items, batch_size=None):
+        """
+        Batched, concurrent equivalent of calling update_doi_metadata on each of the given codebases and releases.
+
+        Items are processed in batches: staleness is checked against the latest registration logs of the whole batch
+        at once and metadata is generated and validated on the calling thread, then only the DataCite PUT requests
+        are fanned out to a bounded pool of worker threads sharing a rate limit and connection pool. The resulting
+        DataCiteRegistrationLog rows for each batch are written with a single bulk insert.
+
+        Yields:
+            tuple: (codebase_or_release, DataCiteRegistrationLog, bool) for each item, the boolean indicates if the
+            metadata is in sync with DataCite
+        """
+        batch_size = batch_size or settings.DATACITE_SYNC_BATCH_SIZE
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch in chunked(items, batch_size):
+                yield from self._sync_doi_metadata_batch(batch, executor)
+
+    @staticmethod
+    def _get_datacite_metadata_hash(item, codebase_hashes):
+        """
+        Returns the current inputs hash of a codebase or release, hashing each codebase and its releases once per
+        batch through codebase_hashes, a dict of codebase id -> Codebase.get_datacite_metadata_hashes()
+        """
+        codebase = item if isinstance(item, Codebase) else item.codebase
+        if codebase.pk not in codebase_hashes:
+            codebase_hashes[codebase.pk] = codebase.get_datacite_metadata_hashes()
+        codebase_hash, release_hashes = codebase_hashes[codebase.pk]
+        if isinstance(item, Codebase):
+            return codebase_hash
+        return release_hashes.get(item.pk, "")
+
+    def _sync_doi_metadata_batch(self, batch, executor):
+        latest_hashes = self.get_latest_inputs_hashes(batch)
+        codebase_hashes = {}
+        pending = []
+        rehashed = defaultdict(list)
+        for item in batch:
+            # refresh the denormalized hash in case related objects changed since this item was last saved
+            inputs_hash = self._get_datacite_metadata_hash(item, codebase_hashes)
+            if inputs_hash != item.datacite_metadata_hash:
+                item.datacite_metadata_hash = inputs_hash
+                rehashed[type(item)].append(item)
+            if latest_hashes.get((type(item), item.pk)) == inputs_hash:
+                logger.info("No need to update DOI metadata for %s", item)
+                yield item, DataCiteRegistrationLog(), True
+                continue
+            if self.dry_run:
+                logger.debug("DRY RUN - updating DOI metadata for %s", item)
+                yield item, DataCiteRegistrationLog(), True
+                continue
+            # only build the DataCite metadata of items that need to be sent
+            item.__dict__.pop("datacite", None)
+            try:
+                datacite_metadata, metadata_dict = self._validate_metadata(
+                    item.datacite
+                )
+            except DataCiteError as e:
+                yield item, DataCiteRegistrationLog(doi=item.doi, message=str(e)), False
+                continue
+            future = executor.submit(self._put_doi_metadata, item.doi, metadata_dict)
+            pending.append((item, datacite_metadata.hash(), inputs_hash, future))
+
+        logs = []
+        results = []
+        for item, metadata_hash, inputs_hash, future in pending:
+            http_status, message = future.result()
+            log = DataCiteRegistrationLog(
+                **self._get_update_log_record_dict(
+                    item,
+                    http_status=http_status,
+                    message=message,
+                    metadata_hash=metadata_hash,
+                    inputs_hash=inputs_hash,
+                )
+            )
+            logs.append(log)
+            results.append((item, log, http_status == 200))
+        DataCiteRegistrationLog.objects.bulk_create(logs)
+        if not self.dry_run:
+            for model, items in rehashed.items():
+                model.objects.bulk_update(items, ["datacite_metadata_hash"])
+        yield from results
 
     @staticmethod
     def _is_deep_inclusive(elem1, elem2):
@@ -481,6 +787,7 @@ class DataCiteApi:
         http_status,
         message,
         metadata_hash,
+        inputs_hash="",
         release=None,
         codebase=None,
     ):
@@ -501,6 +808,7 @@ class DataCiteApi:
                 http_status=http_status,
                 message=message,
                 metadata_hash=metadata_hash,
+                inputs_hash=inputs_hash,
             )
         return None
 
@@ -525,6 +833,8 @@ class DataCiteApi:
         )
 
         invalid_releases = []
+        # codebases and sibling releases whose metadata needs to reference newly minted DOIs
+        stale_items = {}
         for i, release in enumerate(peer_reviewed_releases_without_dois):
             logger.debug(
                 "Processing release %s/%s - %s",
@@ -569,64 +879,40 @@ class DataCiteApi:
                 )
                 continue
 
-            logger.debug(
-                "Updating metadata for parent codebase of release %s", release.pk
-            )
             """
-            Update parent Codebase metadata for new release DOI
+            Queue parent Codebase and sibling release metadata updates for the new release DOI
             """
             codebase.refresh_from_db()
             release.refresh_from_db()
-            update_codebase_doi_log, ok = self.update_doi_metadata(codebase)
+            stale_items.setdefault((Codebase, codebase.pk), (codebase, release))
+            for sibling in (release.get_previous_release(), release.get_next_release()):
+                if sibling and sibling.doi:
+                    stale_items.setdefault(
+                        (CodebaseRelease, sibling.pk), (sibling, release)
+                    )
+
+        """
+        Update parent codebase and sibling metadata for all newly minted release DOIs in one batched sync
+        """
+        logger.debug(
+            "Updating metadata for %s parent codebases and siblings", len(stale_items)
+        )
+        # releases minted in this run may be siblings of each other, refresh them to pick up their new DOIs
+        for item, _ in stale_items.values():
+            item.refresh_from_db()
+        for item, log, ok in self.sync_doi_metadata(
+            item for item, _ in stale_items.values()
+        ):
             if not ok:
-                logger.error("Failed to update metadata for codebase %s", codebase.pk)
+                logger.error("Failed to update metadata for %s", item)
                 invalid_releases.append(
                     (
-                        release,
-                        update_codebase_doi_log,
-                        "Failed to update codebase metadata",
+                        stale_items[(type(item), item.pk)][1],
+                        log.http_status,
+                        f"Unable to update {item._meta.verbose_name} id {item.pk} metadata {log.message}",
                     )
                 )
 
-            """
-            Update sibling metadata for new release DOI
-            """
-            logger.debug("Updating metadata for siblings of release %s", release.pk)
-
-            previous_release = release.get_previous_release()
-            next_release = release.get_next_release()
-
-            if previous_release and previous_release.doi:
-                update_previous_release_doi_log, ok = self.update_doi_metadata(
-                    previous_release
-                )
-                if not ok:
-                    logger.error(
-                        "Failed to update metadata for previous_release %s",
-                        previous_release.pk,
-                    )
-                    invalid_releases.append(
-                        (
-                            release,
-                            update_previous_release_doi_log.http_status,
-                            f"Unable to update previous release id {previous_release.pk} metadata {update_previous_release_doi_log.message}",
-                        )
-                    )
-
-            if next_release and next_release.doi:
-                update_next_release_doi_log, ok = self.update_doi_metadata(next_release)
-                if not ok:
-                    logger.error(
-                        "Failed to update metadata for next_release %s", next_release.pk
-                    )
-                    invalid_releases.append(
-                        (
-                            release,
-                            mint_codebase_doi_log.http_status,
-                            f"Unable to update next release id {next_release.pk} metadata {update_next_release_doi_log.message}",
-                        )
-                    )
-
         logger.info(
             "Minted %s DOIs for peer reviewed releases without DOIs.",
             total_peer_reviewed_releases_without_dois,
@@ -0,0 +1,421 @@
+"""
+Download events and counters
+
+Validated download requests are appended to a redis stream and a debounced huey task inserts them as
+CodebaseReleaseDownload rows with bulk_create, applying any requested member profile updates along the way, so
+request_download never waits on database writes. The stream is read through a consumer group: events stay pending
+until their batch is committed and are retried by the next run if it fails. Downloads store the id of the stream
+entry they were recorded from, so an entry delivered again (e.g., a run stopped between committing a batch and
+acknowledging it) is skipped rather than recorded twice. Entries that cannot be recorded (malformed or rejected by
+the database) are moved to a dead letter stream so they cannot block the consumer group.
+
+Codebases and releases store their number of downloads in download_total columns so rendering a count never scans
+the downloads table. Recorded downloads are buffered as per-release increments in a redis hash that
+flush_download_counts periodically applies to both columns in bulk. reconcile_download_counts recomputes the
+columns from the CodebaseReleaseDownload rows to repair drift, e.g., after a lost buffer, and discards the
+buffered increments while recording and flushing are locked out.
+"""
+
+import json
+import logging
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, InterfaceError, OperationalError, transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django_redis import get_redis_connection
+from huey.contrib.djhuey import lock_task
+from redis.exceptions import ResponseError
+
+from core.models import MemberProfile
+from core.validators import validate_affiliations
+from .models import Codebase, CodebaseRelease, CodebaseReleaseDownload
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_COUNTS_KEY = "download_counts:pending"
+DOWNLOAD_COUNTS_FLUSHING_KEY = f"{DOWNLOAD_COUNTS_KEY}:flushing"
+# huey locks held by the tasks that record downloads and flush the buffered increments
+PROCESS_DOWNLOAD_EVENTS_LOCK = "process-download-events"
+FLUSH_DOWNLOAD_COUNTS_LOCK = "flush-download-counts"
+DOWNLOAD_EVENTS_KEY = "download_events"
+DOWNLOAD_EVENTS_GROUP = "recorders"
+DOWNLOAD_EVENTS_CONSUMER = "huey"
+DOWNLOAD_EVENTS_SCHEDULED_KEY = "download_events:scheduled"
+DOWNLOAD_EVENTS_DEAD_LETTER_KEY = "download_events:dead"
+# fields every download event must have, see DownloadRequestSerializer.enqueue
+DOWNLOAD_EVENT_REQUIRED_FIELDS = ("release_id", "reason", "industry")
+# approximate cap on unprocessed events kept in the stream should the consumer stop
+DOWNLOAD_EVENTS_MAX_LENGTH = 1_000_000
+
+
+def enqueue_download_event(event: dict):
+    """
+    Append a download event to the stream and schedule a run of the recording task unless one is already
+    scheduled. Events are dicts of CodebaseReleaseDownload field values keyed by attribute name (e.g., release_id)
+    plus an optional save_to_profile flag
+    """
+    connection = get_redis_connection("default")
+    connection.xadd(
+        DOWNLOAD_EVENTS_KEY,
+        {"event": json.dumps(event)},
+        maxlen=DOWNLOAD_EVENTS_MAX_LENGTH,
+        approximate=True,
+    )
+    delay = settings.DOWNLOAD_EVENT_QUEUE_DELAY
+    # the flag outlives the scheduled run by a margin so a lost task cannot stall the queue for long
+    if connection.set(DOWNLOAD_EVENTS_SCHEDULED_KEY, 1, nx=True, ex=delay + 60):
+        from .tasks import process_download_events
+
+        process_download_events.schedule(delay=delay)
+
+
+def dead_letter(connection, entry_id, fields):
+    """move a download event stream entry that cannot be recorded to the dead letter stream for inspection"""
+    logger.warning("dead lettering download event %s: %s", entry_id, fields)
+    connection.xadd(
+        DOWNLOAD_EVENTS_DEAD_LETTER_KEY,
+        {"entry_id": entry_id, **fields},
+        maxlen=DOWNLOAD_EVENTS_MAX_LENGTH,
+        approximate=True,
+    )
+
+
+def _parse_event(entry_id, fields):
+    """
+    :return: the download event of a stream entry with its entry id as event_id
+    :raises ValueError: if the entry is not a valid download event
+    """
+    try:
+        event = json.loads(fields[b"event"])
+    except KeyError:
+        raise ValueError("missing event field")
+    if not isinstance(event, dict) or not all(
+        event.get(field) for field in DOWNLOAD_EVENT_REQUIRED_FIELDS
+    ):
+        raise ValueError("missing required download event fields")
+    if not isinstance(event["release_id"], int):
+        raise ValueError("invalid release id")
+    event["event_id"] = entry_id.decode()
+    return event
+
+
+def _parse_events(connection, entries):
+    events = []
+    for entry_id, fields in entries:
+        try:
+            events.append(_parse_event(entry_id, fields))
+        except ValueError:
+            dead_letter(connection, entry_id, fields)
+    return events
+
+
+def add_affiliation(affiliations, affiliation):
+    """
+    :return: the affiliations with the given affiliation appended unless it is empty or one with the same name
+    already exists
+    """
+    if affiliation and not any(
+        existing["name"] == affiliation["name"] for existing in affiliations
+    ):
+        return [*affiliations, affiliation]
+    return list(affiliations)
+
+
+def update_member_profiles(events):
+    """
+    Apply the industry and affiliation of download events that asked to save them to the downloader's profile.
+    DownloadRequestSerializer.enqueue validates these updates, updates that are invalid by the time they are
+    applied are logged and skipped
+    """
+    events = [e for e in events if e.get("save_to_profile") and e.get("user_id")]
+    if not events:
+        return
+    member_profiles = {
+        member_profile.user_id: member_profile
+        for member_profile in MemberProfile.objects.filter(
+            user_id__in={e["user_id"] for e in events}
+        )
+    }
+    changed = {}
+    for event in events:
+        member_profile = member_profiles.get(event["user_id"])
+        if member_profile is None:
+            continue
+        member_profile.industry = event["industry"]
+        member_profile.affiliations = add_affiliation(
+            member_profile.affiliations, event.get("affiliation")
+        )
+        changed[member_profile.pk] = member_profile
+    for member_profile in changed.values():
+        try:
+            validate_affiliations(member_profile.affiliations)
+        except ValidationError:
+            logger.warning(
+                "skipping invalid profile update from download requests for %s",
+                member_profile,
+            )
+            continue
+        member_profile.save(update_fields=["industry", "affiliations"])
+
+
+def record_download_events(events):
+    """
+    Insert CodebaseReleaseDownloads for the given download events in bulk, skipping events for releases that no
+    longer exist and events already recorded, and buffer the matching download count increments
+    :return: the number of downloads recorded
+    """
+    recorded_event_ids = set(
+        CodebaseReleaseDownload.objects.filter(
+            event_id__in=[e["event_id"] for e in events if e.get("event_id")]
+        ).values_list("event_id", flat=True)
+    )
+    events = [e for e in events if e.get("event_id") not in recorded_event_ids]
+    release_ids = set(
+        CodebaseRelease.objects.filter(
+            id__in={e["release_id"] for e in events}
+        ).values_list("id", flat=True)
+    )
+    user_ids = set(
+        User.objects.filter(
+            id__in={e["user_id"] for e in events if e.get("user_id")}
+        ).values_list("id", flat=True)
+    )
+    events = [e for e in events if e["release_id"] in release_ids]
+    downloads = [
+        CodebaseReleaseDownload(
+            release_id=e["release_id"],
+            user_id=e.get("user_id") if e.get("user_id") in user_ids else None,
+            ip_address=e.get("ip_address"),
+            referrer=e.get("referrer", ""),
+            reason=e["reason"],
+            industry=e["industry"],
+            affiliation=e.get("affiliation"),
+            event_id=e.get("event_id"),
+        )
+        for e in events
+    ]
+    with transaction.atomic():
+        # the only consumer runs under a lock, conflicts are skipped in case another recorded the same events
+        CodebaseReleaseDownload.objects.bulk_create(downloads, ignore_conflicts=True)
+        update_member_profiles([e for e in events if e.get("user_id") in user_ids])
+        record_downloads_on_commit(Counter(e["release_id"] for e in events))
+    return len(downloads)
+
+
+def record_entries(connection, entries):
+    """
+    Record the download events of a batch of stream entries. If the batch fails, its events are recorded one at a
+    time and events that still fail are dead lettered, unless the database is unavailable
+    :return: the number of downloads recorded
+    """
+    events_by_entry_id = {
+        event["event_id"]: event for event in _parse_events(connection, entries)
+    }
+    try:
+        return record_download_events(list(events_by_entry_id.values()))
+    except (OperationalError, InterfaceError):
+        raise
+    except (DatabaseError, KeyError, TypeError, ValueError):
+        logger.exception("unable to record download events in bulk")
+    recorded = 0
+    for entry_id, fields in entries:
+        event = events_by_entry_id.get(entry_id.decode())
+        if event is None:
+            continue
+        try:
+            recorded += record_download_events([event])
+        except (OperationalError, InterfaceError):
+            raise
+        except (DatabaseError, KeyError, TypeError, ValueError):
+            dead_letter(connection, entry_id, fields)
+    return recorded
+
+
+def _ensure_consumer_group(connection):
+    try:
+        connection.xgroup_create(
+            DOWNLOAD_EVENTS_KEY, DOWNLOAD_EVENTS_GROUP, id="0", mkstream=True
+        )
+    except ResponseError as e:
+        # BUSYGROUP, the group already exists
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def process_download_events(batch_size=None):
+    """
+    Record queued download events in batches until the stream is drained. Events left pending by a failed run
+    are recorded first, including any batch that was committed but not acknowledged (see the module docstring)
+    :return: the number of downloads recorded
+    """
+    if batch_size is None:
+        batch_size = settings.DOWNLOAD_EVENT_BATCH_SIZE
+    connection = get_redis_connection("default")
+    # clear the flag first so that events enqueued from here on schedule another run
+    connection.delete(DOWNLOAD_EVENTS_SCHEDULED_KEY)
+    _ensure_consumer_group(connection)
+    recorded = 0
+    # "0" reads this consumer's pending events, ">" reads new ones
+    for start_id in ("0", ">"):
+        while True:
+            response = connection.xreadgroup(
+                DOWNLOAD_EVENTS_GROUP,
+                DOWNLOAD_EVENTS_CONSUMER,
+                {DOWNLOAD_EVENTS_KEY: start_id},
+                count=batch_size,
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                break
+            recorded += record_entries(connection, entries)
+            entry_ids = [entry_id for entry_id, _ in entries]
+            connection.xack(DOWNLOAD_EVENTS_KEY, DOWNLOAD_EVENTS_GROUP, *entry_ids)
+            connection.xdel(DOWNLOAD_EVENTS_KEY, *entry_ids)
+    return recorded
+
+
+def get_pending_download_event_count():
+    return get_redis_connection("default").xlen(DOWNLOAD_EVENTS_KEY)
+
+
+def record_download(release_id: int, count=1):
+    """buffer download count increments for a release in redis, see flush_download_counts"""
+    get_redis_connection("default").hincrby(DOWNLOAD_COUNTS_KEY, release_id, count)
+
+
+def record_downloads_on_commit(counts: dict):
+    """buffer download count increments for several releases once the current transaction commits"""
+
+    def record():
+        pipeline = get_redis_connection("default").pipeline()
+        for release_id, count in counts.items():
+            pipeline.hincrby(DOWNLOAD_COUNTS_KEY, release_id, count)
+        pipeline.execute()
+
+    if counts:
+        transaction.on_commit(record)
+
+
+def get_increment(increments):
+    """
+    :return: an expression evaluating to the increment of each row's primary key in the increments dict
+    """
+    return Case(
+        *[When(pk=pk, then=Value(count)) for pk, count in increments.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def flush_download_counts():
+    """
+    Apply buffered download count increments to release and codebase download totals with one UPDATE each
+    :return: the number of downloads applied
+    """
+    connection = get_redis_connection("default")
+    flushing_key = DOWNLOAD_COUNTS_FLUSHING_KEY
+    # increments left over by a failed flush are applied first, new increments accumulate in a fresh hash
+    if not connection.exists(flushing_key):
+        if not connection.exists(DOWNLOAD_COUNTS_KEY):
+            return 0
+        connection.rename(DOWNLOAD_COUNTS_KEY, flushing_key)
+    release_increments = {
+        int(release_id): int(count)
+        for release_id, count in connection.hgetall(flushing_key).items()
+    }
+    codebase_increments = defaultdict(int)
+    for release_id, codebase_id in CodebaseRelease.objects.filter(
+        id__in=release_increments
+    ).values_list("id", "codebase_id"):
+        codebase_increments[codebase_id] += release_increments[release_id]
+    with transaction.atomic():
+        CodebaseRelease.objects.filter(id__in=release_increments).update(
+            download_total=F("download_total") + get_increment(release_increments)
+        )
+        Codebase.objects.filter(id__in=codebase_increments).update(
+            download_total=F("download_total") + get_increment(codebase_increments)
+        )
+    connection.delete(flushing_key)
+    return sum(codebase_increments.values())
+
+
+def get_release_download_count_subquery():
+    return Coalesce(
+        Subquery(
+            CodebaseReleaseDownload.objects.filter(release=OuterRef("pk"))
+            .order_by()
+            .values("release")
+            .annotate(count=Count("*"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def get_codebase_download_count_subquery():
+    return Coalesce(
+        Subquery(
+            CodebaseRelease.objects.filter(codebase=OuterRef("pk"))
+            .order_by()
+            .values("codebase")
+            .annotate(total=Sum("download_total"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def _reconcile(queryset, actual_count, batch_size):
+    mismatched = [
+        queryset.model(id=pk, download_total=count)
+        for pk, count in queryset.annotate(actual_download_total=actual_count)
+        .exclude(download_total=F("actual_download_total"))
+        .values_list("id", "actual_download_total")
+    ]
+    queryset.model.objects.bulk_update(
+        mismatched, ["download_total"], batch_size=batch_size
+    )
+    return len(mismatched)
+
+
+def reconcile_download_counts(batch_size=1000):
+    """
+    Recompute release and codebase download totals from the downloads table and discard the buffered increments,
+    which are already counted in the rows, once the corrected totals are committed. Download events are neither
+    recorded nor flushed meanwhile, so no increment is counted twice or lost. Raises huey's TaskLockedException if
+    either task is running
+    :return: the number of releases and codebases whose totals were corrected
+    """
+    with lock_task(PROCESS_DOWNLOAD_EVENTS_LOCK), lock_task(
+        FLUSH_DOWNLOAD_COUNTS_LOCK
+    ), transaction.atomic():
+        # the buffer is kept if the totals are rolled back
+        transaction.on_commit(
+            lambda: get_redis_connection("default").delete(
+                DOWNLOAD_COUNTS_KEY, DOWNLOAD_COUNTS_FLUSHING_KEY
+            )
+        )
+        releases = _reconcile(
+            CodebaseRelease.objects.all(),
+            get_release_download_count_subquery(),
+            batch_size,
+        )
+        # codebase totals are the sums of the (now correct) release totals
+        codebases = _reconcile(
+            Codebase.objects.all(), get_codebase_download_count_subquery(), batch_size
+        )
+    return releases, codebases
@@ -0,0 +1,126 @@
+"""
+Featured image rendition urls
+
+Rendering a rendition of a featured image for the first time decodes, resizes and encodes the image, which is too
+slow for metadata builders and pages that only need a url. Renditions of every featured image are generated by a
+huey task when an image is uploaded and the rendition urls of a codebase's featured image are kept in the cache,
+so get_featured_rendition_urls only reads the cache or the renditions table and never processes an image. Missing
+renditions are scheduled for generation instead. Cached urls expire and are invalidated whenever a CodebaseImage
+is saved or deleted, see library.signals.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from wagtail.images.models import Filter
+
+from .models import CodebaseImage
+
+logger = logging.getLogger(__name__)
+
+# renditions of the featured image used by release pages and metadata
+FEATURED_IMAGE_SPECS = ("width-400", "max-900x600")
+GALLERY_IMAGE_SPEC = "max-900x600"
+METADATA_IMAGE_SPEC = "max-900x600"
+
+
+def get_rendition_urls_cache_key(codebase_id):
+    return f"featured_image_renditions:{codebase_id}"
+
+
+def get_generation_scheduled_key(codebase_id):
+    return f"featured_image_renditions:{codebase_id}:scheduled"
+
+
+def get_featured_image(codebase_id):
+    """same as Codebase.get_featured_image in a single query"""
+    return CodebaseImage.objects.filter(codebase_id=codebase_id).order_by("pk").first()
+
+
+def find_featured_rendition_urls(codebase_id):
+    """
+    :return: a dict mapping the specs of FEATURED_IMAGE_SPECS to the urls of the existing renditions of the
+    codebase's featured image and whether any of them are missing
+    """
+    image = get_featured_image(codebase_id)
+    if image is None:
+        return {}, False
+    renditions = image.find_existing_renditions(
+        *[Filter(spec=spec) for spec in FEATURED_IMAGE_SPECS]
+    )
+    urls = {filter.spec: rendition.url for filter, rendition in renditions.items()}
+    return urls, len(urls) < len(FEATURED_IMAGE_SPECS)
+
+
+def get_featured_rendition_urls(codebase_id):
+    """
+    :return: a dict mapping rendition specs to the urls of the codebase's featured image renditions, empty if the
+    codebase has no featured image. Never generates renditions, missing ones are scheduled for generation
+    """
+    cache_key = get_rendition_urls_cache_key(codebase_id)
+    urls = cache.get(cache_key)
+    if urls is None:
+        urls, missing = find_featured_rendition_urls(codebase_id)
+        if missing:
+            schedule_featured_renditions(codebase_id)
+        else:
+            cache.set(cache_key, urls, settings.FEATURED_RENDITION_URLS_CACHE_TIMEOUT)
+    return urls
+
+
+def get_featured_rendition_url(codebase_id, spec=METADATA_IMAGE_SPEC):
+    return get_featured_rendition_urls(codebase_id).get(spec)
+
+
+def invalidate_featured_rendition_urls(codebase_id):
+    cache.delete(get_rendition_urls_cache_key(codebase_id))
+
+
+def invalidate_featured_rendition_urls_on_commit(codebase_id):
+    transaction.on_commit(lambda: invalidate_featured_rendition_urls(codebase_id))
+
+
+def generate_featured_renditions(codebase_id):
+    """
+    Generate the FEATURED_IMAGE_SPECS renditions of every featured image of a codebase and cache the urls of the
+    featured image's renditions. The huey task also rebuilds the codebase's release metadata afterwards so that
+    it includes the new rendition urls
+    :return: the cached urls
+    """
+    cache.delete(get_generation_scheduled_key(codebase_id))
+    for image in CodebaseImage.objects.filter(codebase_id=codebase_id):
+        try:
+            image.get_renditions(*FEATURED_IMAGE_SPECS)
+        except Exception:
+            logger.exception(
+                "Unable to generate renditions of featured image %s", image
+            )
+    urls, missing = find_featured_rendition_urls(codebase_id)
+    cache.set(
+        get_rendition_urls_cache_key(codebase_id),
+        urls,
+        settings.FEATURED_RENDITION_URLS_CACHE_TIMEOUT,
+    )
+    if missing:
+        logger.warning("missing featured image renditions for codebase %s", codebase_id)
+    return urls
+
+
+def schedule_featured_renditions(codebase_id):
+    """
+    Generate featured image renditions in a huey task once the current transaction commits, unless a run is
+    already scheduled
+    """
+    transaction.on_commit(lambda: enqueue_featured_renditions(codebase_id))
+
+
+def enqueue_featured_renditions(codebase_id):
+    # only flag the run once committed so that a rolled back request does not block generation, the flag expires
+    # so that a lost task or a broken image cannot stop generation for long
+    if not cache.add(get_generation_scheduled_key(codebase_id), True, 600):
+        return
+    from .tasks import generate_featured_renditions as generate
+
+    generate(codebase_id)
@@ -1,22 +1,33 @@
+import filecmp
+import hashlib
+import json
 import logging
 import mimetypes
 import os
 import re
 import shutil
+import struct
+import sys
 import tarfile
+import threading
+import uuid
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from functools import total_ordering
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 from tempfile import TemporaryDirectory
 from typing import Optional
 
 import bagit
 import rarfile
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import File
+from django.db.models import Q
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
 from core import fs
@@ -46,6 +57,13 @@ class FileCategoryDirectories(Enum):
     results = 6
 
 
+class ArchiveBuildStatus(Enum):
+    pending = "pending"
+    building = "building"
+    complete = "complete"
+    failed = "failed"
+
+
 @total_ordering
 class MessageLevels(Enum):
     debug = 0
@@ -344,6 +362,282 @@ class CodebaseReleaseAipStorage(CodebaseReleaseStorage):
         shutil.copytree(sip_storage.location, self.location)
 
 
+# file formats that are already compressed and would only waste cpu being deflated again
+PRECOMPRESSED_EXTENSIONS = frozenset(
+    (
+        ".7z",
+        ".avi",
+        ".bz2",
+        ".docx",
+        ".gif",
+        ".gz",
+        ".jar",
+        ".jpeg",
+        ".jpg",
+        ".mkv",
+        ".mov",
+        ".mp3",
+        ".mp4",
+        ".odp",
+        ".ods",
+        ".odt",
+        ".png",
+        ".pptx",
+        ".rar",
+        ".tgz",
+        ".webm",
+        ".webp",
+        ".xlsx",
+        ".xz",
+        ".zip",
+        ".zst",
+    )
+)
+
+_ZIP_LOCAL_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+_ZIP_LOCAL_FILE_HEADER_SIGNATURE = b"PK\003\004"
+_ZIP_ENCRYPTED_FLAG = 0x01
+_ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+# ReleaseArchiveBuilder.copy_raw_entry relies on zipfile internals (ZipFile.start_dir, NameToInfo, _didModify and
+# ZipInfo.FileHeader) that are not public API. Raw copies are only made on python versions up to the last one they
+# were verified against, newer versions copy unchanged entries through ZipFile.open instead
+_ZIP_RAW_COPY_MAX_VERSION = (3, 12)
+
+
+def hash_path(path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ReleaseArchiveBuilder:
+    """
+    Incrementally builds a zip archive from the files in a directory.
+
+    The size, modification time and sha256 digest of every archived file are recorded in a JSON index
+    stored next to the archive. When the archive is rebuilt, entries whose content is unchanged are
+    copied verbatim (still compressed) from the previous archive, new or modified files in an already
+    compressed format are stored without compression, and only the remaining files are deflated. If no
+    file in the source directory changed the existing archive is left untouched.
+
+    known_digests can be used to seed sha256 digests (e.g., from a bagit manifest) so unchanged files
+    never need to be read. They are only trusted for files that have not been modified after
+    known_digests_as_of (a timestamp in nanoseconds).
+    """
+
+    INDEX_VERSION = 1
+
+    def __init__(self, src_dir, dest, known_digests=None, known_digests_as_of=0):
+        self.src_dir = Path(src_dir)
+        self.dest = Path(dest)
+        self.known_digests = known_digests or {}
+        self.known_digests_as_of = known_digests_as_of
+        self.reused = 0
+        self.written = 0
+
+    @property
+    def index_path(self):
+        return self.dest.with_suffix(".index.json")
+
+    def load_index(self) -> dict:
+        if not self.dest.exists() or not self.index_path.exists():
+            return {}
+        try:
+            with self.index_path.open(encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("ignoring unreadable archive index %s", self.index_path)
+            return {}
+        if index.get("version") != self.INDEX_VERSION:
+            return {}
+        return index.get("entries", {})
+
+    def save_index(self, entries: dict):
+        with self.index_path.open(mode="w", encoding="utf-8") as f:
+            json.dump({"version": self.INDEX_VERSION, "entries": entries}, f)
+
+    def scan(self) -> dict:
+        """returns a dict of archive names to os.stat_result for all files in the source directory"""
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.src_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = Path(dirpath, filename)
+                files[str(path.relative_to(self.src_dir))] = path.stat()
+        return files
+
+    @staticmethod
+    def is_unchanged(stat, entry) -> bool:
+        return (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        )
+
+    def get_digest(self, arcname, stat, previous_entry) -> str:
+        if self.is_unchanged(stat, previous_entry):
+            return previous_entry["sha256"]
+        known_digest = self.known_digests.get(arcname)
+        if known_digest and stat.st_mtime_ns <= self.known_digests_as_of:
+            return known_digest
+        return hash_path(self.src_dir.joinpath(arcname))
+
+    @staticmethod
+    def get_compress_type(arcname):
+        if Path(arcname).suffix.lower() in PRECOMPRESSED_EXTENSIONS:
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
+    @staticmethod
+    def can_copy_raw(zinfo: zipfile.ZipInfo) -> bool:
+        return (
+            not zinfo.flag_bits & _ZIP_ENCRYPTED_FLAG
+            and zinfo.file_size < zipfile.ZIP64_LIMIT
+            and zinfo.compress_size < zipfile.ZIP64_LIMIT
+        )
+
+    @staticmethod
+    def supports_raw_copy(archive: zipfile.ZipFile) -> bool:
+        return (
+            sys.version_info[:2] <= _ZIP_RAW_COPY_MAX_VERSION
+            and hasattr(zipfile.ZipInfo, "FileHeader")
+            and all(
+                hasattr(archive, attribute)
+                for attribute in ("fp", "start_dir", "NameToInfo", "_didModify")
+            )
+        )
+
+    @staticmethod
+    def copy_zinfo(zinfo: zipfile.ZipInfo) -> zipfile.ZipInfo:
+        new_zinfo = zipfile.ZipInfo(zinfo.filename, date_time=zinfo.date_time)
+        new_zinfo.compress_type = zinfo.compress_type
+        new_zinfo.create_system = zinfo.create_system
+        new_zinfo.external_attr = zinfo.external_attr
+        return new_zinfo
+
+    @classmethod
+    def copy_entry(
+        cls,
+        src_archive: zipfile.ZipFile,
+        archive: zipfile.ZipFile,
+        zinfo: zipfile.ZipInfo,
+    ):
+        """
+        Copies a member of another zipfile into archive through the public zipfile API, decompressing and
+        recompressing its content
+        """
+        with src_archive.open(zinfo) as src, archive.open(
+            cls.copy_zinfo(zinfo), mode="w"
+        ) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    @classmethod
+    def copy_raw_entry(cls, src_fp, archive: zipfile.ZipFile, zinfo: zipfile.ZipInfo):
+        """
+        Copies the compressed bytes of a member of another zipfile into archive without decompressing them.
+        zipfile has no public API for this so we write the local file header ourselves and register the new
+        member the same way ZipFile.open(mode="w") does once a member has been written. Only call this when
+        supports_raw_copy(archive) is True
+        """
+        src_fp.seek(zinfo.header_offset)
+        header = _ZIP_LOCAL_FILE_HEADER.unpack(src_fp.read(_ZIP_LOCAL_FILE_HEADER.size))
+        if header[0] != _ZIP_LOCAL_FILE_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local file header for {zinfo.filename}")
+        # skip the filename and extra fields
+        src_fp.seek(header[10] + header[11], os.SEEK_CUR)
+
+        new_zinfo = cls.copy_zinfo(zinfo)
+        # crc and sizes are known up front so they go in the local header instead of a data descriptor
+        new_zinfo.flag_bits = zinfo.flag_bits & ~_ZIP_DATA_DESCRIPTOR_FLAG
+        new_zinfo.CRC = zinfo.CRC
+        new_zinfo.compress_size = zinfo.compress_size
+        new_zinfo.file_size = zinfo.file_size
+
+        fp = archive.fp
+        fp.seek(archive.start_dir)
+        new_zinfo.header_offset = fp.tell()
+        fp.write(new_zinfo.FileHeader(zip64=False))
+        remaining = zinfo.compress_size
+        while remaining > 0:
+            chunk = src_fp.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated data for {zinfo.filename}")
+            fp.write(chunk)
+            remaining -= len(chunk)
+        archive.start_dir = fp.tell()
+        archive.filelist.append(new_zinfo)
+        archive.NameToInfo[new_zinfo.filename] = new_zinfo
+        archive._didModify = True
+
+    def build(self) -> bool:
+        """
+        Returns True if the archive was (re)written, False if it was already up to date
+        """
+        previous_entries = self.load_index()
+        files = self.scan()
+        if previous_entries and previous_entries.keys() == files.keys():
+            if all(
+                self.is_unchanged(stat, previous_entries[arcname])
+                for arcname, stat in files.items()
+            ):
+                logger.info("archive %s is up to date", self.dest)
+                return False
+
+        entries = {}
+        tmp_dest = self.dest.with_name(f"{self.dest.name}.tmp")
+        previous_fp = self.dest.open("rb") if previous_entries else None
+        try:
+            previous_archive = zipfile.ZipFile(previous_fp) if previous_fp else None
+            with zipfile.ZipFile(tmp_dest, "w") as archive:
+                for arcname, stat in files.items():
+                    previous_entry = previous_entries.get(arcname)
+                    digest = self.get_digest(arcname, stat, previous_entry)
+                    zinfo = (
+                        previous_archive.NameToInfo.get(arcname)
+                        if previous_entry
+                        else None
+                    )
+                    if (
+                        zinfo is not None
+                        and previous_entry["sha256"] == digest
+                        and self.can_copy_raw(zinfo)
+                    ):
+                        if self.supports_raw_copy(archive):
+                            self.copy_raw_entry(previous_fp, archive, zinfo)
+                        else:
+                            self.copy_entry(previous_archive, archive, zinfo)
+                        self.reused += 1
+                    else:
+                        archive.write(
+                            str(self.src_dir.joinpath(arcname)),
+                            arcname=arcname,
+                            compress_type=self.get_compress_type(arcname),
+                        )
+                        self.written += 1
+                    entries[arcname] = {
+                        "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns,
+                        "sha256": digest,
+                    }
+        except Exception:
+            tmp_dest.unlink(missing_ok=True)
+            raise
+        finally:
+            if previous_fp:
+                previous_fp.close()
+        os.replace(tmp_dest, self.dest)
+        self.save_index(entries)
+        logger.info(
+            "built archive %s (%s entries reused, %s written)",
+            self.dest,
+            self.reused,
+            self.written,
+        )
+        return True
+
+
 class CodebaseReleaseFsApi:
     """
     Interface to maintain files associated with a codebase
@@ -353,6 +647,8 @@ class CodebaseReleaseFsApi:
     hold
     """
 
+    ARCHIVE_BUILD_STATUS_TIMEOUT = 60 * 60 * 24 * 7
+
     def __init__(
         self,
         codebase_release,
@@ -565,24 +861,305 @@ class CodebaseReleaseFsApi:
 
     def build_published_archive(self, force=False):
         """
-        FIXME: some of this should be moved to an async processing task.
+        Writes the metadata files into the sip and builds the published archive. Expensive for large releases,
+        callers handling a request should schedule library.tasks.build_release_archive instead.
         """
         self.create_or_update_codemeta(force=force)
         self.create_or_update_citation_cff(force=force)
         self.create_or_update_license(force=force)
+        self.update_file_index()
         bag = self.get_or_create_sip_bag(self.bagit_info)
         self.validate_bagit(bag)
         self.build_archive(force=force)
 
-    def build_review_archive(self):
+    def _archive_build_status_key(self, review_archive=False):
+        kind = "review" if review_archive else "published"
+        return f"library.release_archive_build:{self.release_id}:{kind}"
+
+    def get_archive_build_status(
+        self, review_archive=False
+    ) -> Optional[ArchiveBuildStatus]:
+        record = cache.get(self._archive_build_status_key(review_archive))
+        if record is None:
+            return None
+        return ArchiveBuildStatus(record["status"])
+
+    def request_archive_build(self, review_archive=False) -> Optional[str]:
+        """
+        Marks an archive build as pending and returns a token identifying this build request,
+        or None if a build of the same archive is already pending, in progress or complete
+        """
+        key = self._archive_build_status_key(review_archive)
+        token = uuid.uuid4().hex
+        record = {"status": ArchiveBuildStatus.pending.value, "token": token}
+        # cache.add is atomic so only one of several concurrent requests gets to schedule a build
+        if cache.add(key, record, self.ARCHIVE_BUILD_STATUS_TIMEOUT):
+            return token
+        current = cache.get(key)
+        if current is None or current["status"] == ArchiveBuildStatus.failed.value:
+            cache.set(key, record, self.ARCHIVE_BUILD_STATUS_TIMEOUT)
+            return token
+        return None
+
+    def set_archive_build_status(
+        self, status: ArchiveBuildStatus, token: str, review_archive=False
+    ) -> bool:
+        """
+        Updates the status of the build identified by token. Returns False without updating anything if the
+        build request was invalidated or superseded by a newer one in the meantime.
+        """
+        key = self._archive_build_status_key(review_archive)
+        current = cache.get(key)
+        if current is None or current["token"] != token:
+            return False
+        cache.set(
+            key,
+            {"status": status.value, "token": token},
+            self.ARCHIVE_BUILD_STATUS_TIMEOUT,
+        )
+        return True
+
+    def invalidate_archive_build(self, review_archive=False):
+        cache.delete(self._archive_build_status_key(review_archive))
+
+    def invalidate_review_archive(self):
+        """mark the review archive as stale so it gets rebuilt on the next review download"""
+        self.invalidate_archive_build(review_archive=True)
+
+    def files_changed(self, paths=None):
+        """
+        refreshes the file index and marks the review archive stale after files were added or removed, paths
+        limits the refresh to the given paths relative to the stage directories (see update_file_index)
+        """
+        self.update_file_index(paths)
+        self.invalidate_review_archive()
+
+    def get_stage_contents_dir(self, stage: StagingDirectories):
+        if stage == StagingDirectories.originals:
+            return self.originals_dir
+        elif stage == StagingDirectories.sip:
+            return self.sip_contents_dir
+        raise ValueError(f"{stage} files are not indexed")
+
+    @staticmethod
+    def _get_index_scope(paths):
+        """
+        :return: the directories above the given relative paths and a Q matching index entries for the paths,
+        their contents and these directories
+        """
+        ancestors = set()
+        scope = Q()
+        for path in paths:
+            ancestors.update(str(parent) for parent in list(path.parents)[:-1])
+            scope |= Q(path=str(path)) | Q(path__startswith=f"{path}/")
+        return ancestors, scope | Q(path__in=ancestors)
+
+    @staticmethod
+    def _walk_index_paths(contents_dir: Path, paths, ancestors):
+        if paths is None:
+            yield from contents_dir.rglob("*")
+            return
+        for ancestor in sorted(ancestors):
+            yield contents_dir.joinpath(ancestor)
+        for relpath in paths:
+            path = contents_dir.joinpath(relpath)
+            if path.is_dir():
+                yield path
+                yield from path.rglob("*")
+            elif path.exists():
+                yield path
+
+    def update_file_index(self, paths=None):
+        """
+        Synchronizes the release's file index with the originals and sip directories. Files whose size and
+        modification time match their index entry are not hashed again. Directories are indexed with the
+        DIRECTORY_MIMETYPE so that empty directories are listed too.
+        :param paths: only synchronize these paths relative to the stage directories (e.g., a file or category
+        directory that was just added or deleted), their contents and their parent directories
+        :return: the number of index entries created, updated or deleted
+        """
+        file_index = self.release.file_index
+        CodebaseReleaseFile = file_index.model
+        ancestors = set()
+        if paths is not None:
+            paths = [PurePosixPath(path) for path in paths]
+            ancestors, scope = self._get_index_scope(paths)
+            file_index = file_index.filter(scope)
+        existing = {(f.stage, f.path): f for f in file_index}
+        category_names = {c.name for c in FileCategoryDirectories}
+        created = []
+        updated = []
+        for stage in (StagingDirectories.originals, StagingDirectories.sip):
+            contents_dir = self.get_stage_contents_dir(stage)
+            seen = set()
+            for path in self._walk_index_paths(contents_dir, paths, ancestors):
+                is_dir = path.is_dir()
+                if (not is_dir and not path.is_file()) or path in seen:
+                    continue
+                seen.add(path)
+                relpath = path.relative_to(contents_dir)
+                stat = path.stat()
+                size = 0 if is_dir else stat.st_size
+                indexed_file = existing.pop((stage.name, str(relpath)), None)
+                if (
+                    indexed_file is not None
+                    and indexed_file.size == size
+                    and indexed_file.mtime_ns == stat.st_mtime_ns
+                ):
+                    continue
+                if indexed_file is None:
+                    indexed_file = CodebaseReleaseFile(
+                        release=self.release,
+                        stage=stage.name,
+                        path=str(relpath),
+                        category=(
+                            relpath.parts[0]
+                            if len(relpath.parts) > 1
+                            and relpath.parts[0] in category_names
+                            else ""
+                        ),
+                    )
+                    created.append(indexed_file)
+                else:
+                    updated.append(indexed_file)
+                indexed_file.size = size
+                indexed_file.mtime_ns = stat.st_mtime_ns
+                if is_dir:
+                    indexed_file.mimetype = CodebaseReleaseFile.DIRECTORY_MIMETYPE
+                    indexed_file.sha256 = ""
+                else:
+                    indexed_file.mimetype = mimetypes.guess_type(path.name)[0] or ""
+                    indexed_file.sha256 = hash_path(path)
+        if existing:
+            self.release.file_index.filter(
+                id__in=[f.id for f in existing.values()]
+            ).delete()
+        # concurrent updates of the same release (e.g., two uploads) may index the same new files
+        CodebaseReleaseFile.objects.bulk_create(
+            created,
+            update_conflicts=True,
+            unique_fields=["release", "stage", "path"],
+            update_fields=["category", "size", "mtime_ns", "mimetype", "sha256"],
+        )
+        CodebaseReleaseFile.objects.bulk_update(
+            updated, ["size", "mtime_ns", "mimetype", "sha256"]
+        )
+        return len(created) + len(updated) + len(existing)
+
+    def get_file_index(
+        self,
+        stage: StagingDirectories,
+        category: Optional[FileCategoryDirectories] = None,
+        include_directories=False,
+    ):
+        """
+        Returns a queryset over the indexed files in the given stage, indexing the release's files first if they
+        were never indexed (e.g., releases created before the index existed)
+        """
+        file_index = self.release.file_index
+        if not file_index.exists() and any(
+            path.is_file() for path in self.get_stage_contents_dir(stage).rglob("*")
+        ):
+            self.update_file_index()
+        queryset = file_index.filter(stage=stage.name)
+        if not include_directories:
+            queryset = queryset.exclude(mimetype=file_index.model.DIRECTORY_MIMETYPE)
+        if category is not None:
+            queryset = queryset.filter(category=category.name)
+        return queryset
+
+    def get_file_index_tree(self):
+        """
+        Returns the sip contents as the nested {label, contents} structure produced by list_sip_contents, built
+        from the file index
+        """
+        root = {"label": "archive-project-root", "contents": []}
+        directories = {(): root}
+        indexed_files = self.get_file_index(
+            StagingDirectories.sip, include_directories=True
+        ).only("path", "mimetype")
+        for indexed_file in indexed_files:
+            parts = Path(indexed_file.path).parts
+            is_dir = indexed_file.mimetype == indexed_file.DIRECTORY_MIMETYPE
+            parent = root
+            for depth in range(1, len(parts) + is_dir):
+                directory = directories.get(parts[:depth])
+                if directory is None:
+                    directory = {"label": parts[depth - 1], "contents": []}
+                    directories[parts[:depth]] = directory
+                    parent["contents"].append(directory)
+                parent = directory
+            if not is_dir:
+                parent["contents"].append({"label": parts[-1]})
+        return root
+
+    @property
+    def review_archive_digest_path(self):
+        return self.review_archivepath.with_suffix(".sha256")
+
+    def get_review_archive_digest(self) -> str:
+        """
+        Returns a digest identifying the contents of the review archive: the sip bagit manifest, the
+        inputs of the generated metadata files and the size and modification time of every other sip file (the
+        manifest is only refreshed on publish). Only needs a stat per file, file contents are never read.
+        """
+        digest = hashlib.sha256()
+        manifest_path = self.sip_dir.joinpath("manifest-sha256.txt")
+        if manifest_path.exists():
+            digest.update(manifest_path.read_bytes())
+        # CITATION.cff is derived solely from the stored codemeta snapshot and LICENSE from the license text, the
+        # current year and the citation authors (also part of the snapshot), so these stand in for the generated
+        # files without converting any metadata
+        release = self.release
+        for contents in (
+            json.dumps(release.codemeta_snapshot, sort_keys=True),
+            release.license.text if release.license_id else "",
+            str(timezone.now().year),
+        ):
+            digest.update(b"\0")
+            digest.update(contents.encode("utf-8"))
+        metadata_paths = {self.codemeta_path, self.cff_path, self.license_path}
+        if self.sip_contents_dir.exists():
+            for path in sorted(self.sip_contents_dir.rglob("*")):
+                if path in metadata_paths or not path.is_file():
+                    continue
+                stat = path.stat()
+                digest.update(
+                    "\0{}:{}:{}".format(
+                        path.relative_to(self.sip_contents_dir),
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    ).encode("utf-8")
+                )
+        return digest.hexdigest()
+
+    def has_current_review_archive(self, digest=None) -> bool:
+        """
+        Returns True if the review archive exists and was built from the current sip contents and metadata
+        """
+        if digest is None:
+            digest = self.get_review_archive_digest()
+        try:
+            built_digest = self.review_archive_digest_path.read_text().strip()
+        except FileNotFoundError:
+            return False
+        return built_digest == digest and self.review_archivepath.exists()
+
+    def build_review_archive(self, force=False):
+        """
+        Builds the review archive unless the existing one already matches the current review archive digest
+        """
+        # compute the digest before writing the archive so concurrent changes trigger another build
+        digest = self.get_review_archive_digest()
+        if not force and self.has_current_review_archive(digest):
+            logger.debug("review archive for release %s is current", self.release_id)
+            return self.review_archivepath
         self.create_or_update_codemeta(force=True)
         self.create_or_update_citation_cff(force=True)
         self.create_or_update_license(force=True)
-        shutil.make_archive(
-            str(self.review_archivepath.with_suffix("")),
-            format="zip",
-            root_dir=str(self.sip_contents_dir),
-        )
+        self.update_file_index()
+        ReleaseArchiveBuilder(self.sip_contents_dir, self.review_archivepath).build()
+        self.review_archive_digest_path.write_text(digest)
         return self.review_archivepath
 
     @property
@@ -608,10 +1185,13 @@ class CodebaseReleaseFsApi:
         return self.review_archivepath.stat().st_size
 
     def clear_category(self, category: FileCategoryDirectories):
-        originals_storage = self.get_originals_storage()
-        originals_storage.clear_category(category)
-        sip_storage = self.get_sip_storage()
-        sip_storage.clear_category(category)
+        self._clear_category_storage(category)
+        self.files_changed([category.name])
+
+    def _clear_category_storage(self, category: FileCategoryDirectories):
+        """removes the files of a category from the originals and sip directories without updating the file index"""
+        self.get_originals_storage().clear_category(category)
+        self.get_sip_storage().clear_category(category)
 
     def list(
         self, stage: StagingDirectories, category: Optional[FileCategoryDirectories]
@@ -649,7 +1229,9 @@ class CodebaseReleaseFsApi:
         relpath = Path(category.name, relpath)
         logs = MessageGroup()
         if originals_storage.is_archive_directory(category):
-            self.clear_category(category)
+            # deleting any file of an uploaded archive removes the whole archive and its extracted files
+            self._clear_category_storage(category)
+            relpath = Path(category.name)
         else:
             if not originals_storage.exists(str(relpath)):
                 logs.append(
@@ -662,6 +1244,7 @@ class CodebaseReleaseFsApi:
                 return logs
             logs.append(sip_storage.log_delete(str(relpath)))
             logs.append(originals_storage.log_delete(str(relpath)))
+        self.files_changed([relpath])
         return logs
 
     def _add_to_sip(self, name, content, category: FileCategoryDirectories):
@@ -700,11 +1283,19 @@ class CodebaseReleaseFsApi:
         msgs.append(self._add_to_sip(name=name, content=content, category=category))
         if msgs.has_errors:
             self.delete(category, Path(content.name))
+        # archives are extracted into the category directory of the sip
+        self.files_changed([category.name] if fs.is_archive(name) else [name])
 
         return msgs
 
     def copy_originals(self, source_release):
-        """copy all original files from a source CodebaseRelease to the calling release"""
+        """
+        copy all original files from a source CodebaseRelease to the calling release
+
+        Categories that are still empty in this release are cloned from the source release's originals and sip
+        (reflinked or hardlinked when possible) since their contents were already validated and extracted there.
+        Other files only go through validation and extraction via add when their content differs.
+        """
         logger.info(
             "copying files from source version %s to version %s for codebase %s",
             source_release.version_number,
@@ -712,13 +1303,37 @@ class CodebaseReleaseFsApi:
             self.identifier,
         )
         source_fs_api = source_release.get_fs_api()
+        msgs = self._create_msg_group()
         for category in FileCategoryDirectories:
             source_files = source_fs_api.list(StagingDirectories.originals, category)
+            if not source_files:
+                continue
+            source_originals_dir = source_fs_api.originals_dir.joinpath(category.name)
+            source_sip_dir = source_fs_api.sip_contents_dir.joinpath(category.name)
+            originals_dir = self.originals_dir.joinpath(category.name)
+            sip_dir = self.sip_contents_dir.joinpath(category.name)
+            # only clone into a category with neither originals nor extracted files so nothing is overwritten
+            if (
+                source_sip_dir.exists()
+                and not self.list(StagingDirectories.originals, category)
+                and not (sip_dir.exists() and any(sip_dir.iterdir()))
+            ):
+                cloned = fs.clone_directory(source_originals_dir, originals_dir)
+                cloned += fs.clone_directory(source_sip_dir, sip_dir)
+                logger.debug("cloned %s %s files", cloned, category.name)
+                continue
             for relpath in source_files:
+                path = originals_dir.joinpath(relpath)
+                if path.exists() and filecmp.cmp(
+                    source_originals_dir.joinpath(relpath), path, shallow=False
+                ):
+                    continue
                 with source_fs_api.retrieve(
                     StagingDirectories.originals, category, Path(relpath)
                 ) as file_content:
-                    self.add(category, file_content, name=relpath)
+                    msgs.append(self.add(category, file_content, name=relpath))
+        self.files_changed()
+        return msgs
 
     def get_or_create_sip_bag(self, bagit_info=None):
         sip_dir = str(self.sip_dir)
@@ -748,24 +1363,43 @@ class CodebaseReleaseFsApi:
         return msgs
 
     def build_aip(self, sip_dir: Optional[str] = None):
+        """synchronize the aip with the sip, only copying files that changed since the last build"""
         logger.info("building aip")
         if sip_dir is None:
             sip_dir = str(self.sip_dir)
-        shutil.rmtree(str(self.aip_dir), ignore_errors=True)
-        shutil.copytree(sip_dir, str(self.aip_dir))
+        changes = fs.sync_directory(sip_dir, str(self.aip_dir))
+        logger.debug("synchronized %s aip files", changes)
+        return changes
+
+    def get_sip_manifest_digests(self):
+        """
+        Returns a tuple of (dict of sha256 digests keyed by path relative to the sip contents dir,
+        modification time in nanoseconds of the bagit manifest they were read from)
+        """
+        manifest_path = self.sip_dir.joinpath("manifest-sha256.txt")
+        try:
+            manifest_mtime_ns = manifest_path.stat().st_mtime_ns
+            bag = bagit.Bag(str(self.sip_dir))
+        except (OSError, bagit.BagError):
+            return {}, 0
+        digests = {}
+        for path, fixity in bag.entries.items():
+            # bagit entries include the tag manifest files at the root of the bag, skip those
+            if "sha256" in fixity and path.startswith("data/"):
+                digests[str(Path(path).relative_to("data"))] = fixity["sha256"]
+        return digests, manifest_mtime_ns
 
     def build_archive_at_dest(self, dest):
         logger.info("building archive")
         self.build_aip()
         if self.aip_contents_dir.exists():
-            with zipfile.ZipFile(dest, "w") as archive:
-                for root_path, dirs, file_paths in os.walk(str(self.aip_contents_dir)):
-                    for file_path in file_paths:
-                        path = Path(root_path, file_path)
-                        archive.write(
-                            str(path),
-                            arcname=str(path.relative_to(self.aip_contents_dir)),
-                        )
+            known_digests, known_digests_as_of = self.get_sip_manifest_digests()
+            ReleaseArchiveBuilder(
+                self.aip_contents_dir,
+                dest,
+                known_digests=known_digests,
+                known_digests_as_of=known_digests_as_of,
+            ).build()
             logger.info("building archive succeeded")
             return True
         else:
@@ -788,15 +1422,217 @@ class CodebaseReleaseFsApi:
         self.create_or_update_codemeta(force=True)
         self.create_or_update_citation_cff(force=True)
         self.create_or_update_license(force=True)
+        self.files_changed()
         # only rebuild the archive package if it already exists
         if self.aip_dir.exists():
             self.build_archive(force=True)
         return msgs
 
 
+class ArchiveLimitExceeded(Exception):
+    """Raised when an archive being extracted exceeds the configured entry count or size limits"""
+
+
+class _ArchiveMemberReader:
+    """
+    Read-only file wrapper for an archive member that counts bytes read against the extraction size limit
+    """
+
+    def __init__(self, fileobj, extractor):
+        self.fileobj = fileobj
+        self.extractor = extractor
+
+    def read(self, size=-1):
+        # stop writing as soon as another member exceeded a limit
+        self.extractor.check_stopped()
+        data = self.fileobj.read(size)
+        self.extractor.consume(len(data))
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
 class ArchiveExtractor:
-    def __init__(self, sip_storage: CodebaseReleaseSipStorage):
+    """
+    Extracts uploaded archives into the sip.
+
+    Zip and tar archives are streamed member by member straight into sip storage (validating each member before
+    it is written) while rar archives are unpacked into a temporary directory first. Entry count and total
+    uncompressed size limits are checked against the archive index before anything is written and enforced on the
+    bytes actually written so a zip bomb cannot fill the disk. Once a limit is exceeded no further members are
+    opened and the files written so far are removed.
+    """
+
+    def __init__(
+        self,
+        sip_storage: CodebaseReleaseSipStorage,
+        max_entries=None,
+        max_size=None,
+        max_workers=None,
+    ):
         self.sip_storage = sip_storage
+        self.max_entries = (
+            settings.ARCHIVE_EXTRACT_MAX_ENTRIES if max_entries is None else max_entries
+        )
+        self.max_size = (
+            settings.ARCHIVE_EXTRACT_MAX_SIZE if max_size is None else max_size
+        )
+        self.max_workers = (
+            settings.ARCHIVE_EXTRACT_WORKERS if max_workers is None else max_workers
+        )
+        self.extracted_size = 0
+        self._size_lock = threading.Lock()
+        # set when extraction fails so that concurrent workers stop writing, with the first reason
+        self._stopped = threading.Event()
+        self._stop_reason = None
+        # sip paths created by this extraction, removed again if it fails
+        self.saved_paths = []
+
+    def stop(self, reason="Archive extraction was stopped"):
+        with self._size_lock:
+            if self._stop_reason is None:
+                self._stop_reason = reason
+            self._stopped.set()
+
+    def check_stopped(self):
+        if self._stopped.is_set():
+            raise ArchiveLimitExceeded(self._stop_reason)
+
+    def consume(self, size):
+        with self._size_lock:
+            self.extracted_size += size
+            exceeded = self.extracted_size > self.max_size
+        if exceeded:
+            self.stop(
+                f"Archive exceeds the maximum uncompressed size of {self.max_size} bytes"
+            )
+            self.check_stopped()
+
+    def remove_saved_files(self):
+        for path in self.saved_paths:
+            self.sip_storage.delete(path)
+        self.saved_paths = []
+
+    def check_entries(self, entries):
+        """checks the sizes declared in the archive index before anything is written"""
+        if len(entries) > self.max_entries:
+            raise ArchiveLimitExceeded(
+                f"Archive contains more than the maximum of {self.max_entries} files"
+            )
+        declared_size = sum(size for name, size in entries)
+        if declared_size > self.max_size:
+            raise ArchiveLimitExceeded(
+                f"Archive exceeds the maximum uncompressed size of {self.max_size} bytes"
+            )
+
+    @staticmethod
+    def find_root_prefix(names):
+        """
+        Returns the path prefix shared by all members when the archive wraps everything in a chain of single
+        directories, mirroring find_root_directory for extracted archives
+        """
+        paths = [PurePosixPath(name).parts for name in names]
+        root = ()
+        while True:
+            depth = len(root)
+            children = set()
+            for parts in paths:
+                if len(parts) == depth + 1:
+                    # a file at this level, stop descending
+                    return root
+                children.add(parts[depth])
+            if len(children) != 1:
+                return root
+            root += tuple(children)
+
+    def get_relpath(self, category: FileCategoryDirectories, name, root_prefix):
+        parts = PurePosixPath(name).parts
+        if not parts or PurePosixPath(name).is_absolute() or ".." in parts:
+            return None
+        return Path(category.name, *parts[len(root_prefix) :])
+
+    def save_content(self, relpath, content):
+        """save extracted content to the sip, recording the path so a failed extraction can remove it"""
+        self.check_stopped()
+        if not self.sip_storage.exists(str(relpath)):
+            self.saved_paths.append(str(relpath))
+        return self.sip_storage.log_save(name=str(relpath), content=content)
+
+    def save_member(self, category, name, root_prefix, open_member):
+        relpath = self.get_relpath(category, name, root_prefix)
+        if relpath is None:
+            return self.sip_storage.error(f"Ignored file '{name}': invalid path")
+        self.check_stopped()
+        with open_member() as member:
+            content = File(_ArchiveMemberReader(member, self), name=relpath.name)
+            return self.save_content(relpath, content)
+
+    def stream_zip(self, category: FileCategoryDirectories, filename: str):
+        msgs = MessageGroup()
+        with zipfile.ZipFile(filename, "r") as z:
+            members = [info for info in z.infolist() if not info.is_dir()]
+            self.check_entries([(info.filename, info.file_size) for info in members])
+            root_prefix = self.find_root_prefix(info.filename for info in members)
+            if self.max_workers > 1 and len(members) > 1:
+                # zlib releases the gil so members are inflated and written concurrently, every worker reads
+                # through its own ZipFile handle since they share a file position
+                local = threading.local()
+                archives = []
+
+                def save(info):
+                    if not hasattr(local, "archive"):
+                        local.archive = zipfile.ZipFile(filename, "r")
+                        archives.append(local.archive)
+                    return self.save_member(
+                        category,
+                        info.filename,
+                        root_prefix,
+                        lambda: local.archive.open(info),
+                    )
+
+                executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                try:
+                    futures = [executor.submit(save, info) for info in members]
+                    for future in futures:
+                        msgs.append(future.result())
+                except BaseException:
+                    # members that have not started are cancelled and running ones stop at their next read
+                    self.stop()
+                    raise
+                finally:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    for archive in archives:
+                        archive.close()
+            else:
+                for info in members:
+                    msgs.append(
+                        self.save_member(
+                            category,
+                            info.filename,
+                            root_prefix,
+                            lambda info=info: z.open(info),
+                        )
+                    )
+        return msgs
+
+    def stream_tar(self, category: FileCategoryDirectories, filename: str):
+        msgs = MessageGroup()
+        with tarfile.open(filename, "r") as t:
+            # links and device files are never extracted
+            members = [member for member in t.getmembers() if member.isfile()]
+            self.check_entries([(member.name, member.size) for member in members])
+            root_prefix = self.find_root_prefix(member.name for member in members)
+            for member in members:
+                msgs.append(
+                    self.save_member(
+                        category,
+                        member.name,
+                        root_prefix,
+                        lambda member=member: t.extractfile(member),
+                    )
+                )
+        return msgs
 
     def extractall(self, unpack_destination, filename):
         mimetype = mimetypes.guess_type(filename)[0]
@@ -825,46 +1661,64 @@ class ArchiveExtractor:
             if len(dirnames) != 1 or len(filenames) != 0:
                 return dirpath
 
-    def process(self, category: FileCategoryDirectories, filename: str):
+    def check_rar_entries(self, filename):
+        with rarfile.RarFile(filename, "r") as r:
+            self.check_entries(
+                [
+                    (info.filename, info.file_size)
+                    for info in r.infolist()
+                    if not info.is_dir()
+                ]
+            )
+
+    def extract_and_save(self, category: FileCategoryDirectories, filename: str):
         msgs = MessageGroup()
-        try:
-            with TemporaryDirectory() as d:
-                try:
-                    msg = self.extractall(unpack_destination=d, filename=filename)
-                except zipfile.BadZipFile as e:
-                    msg = create_fs_message(
-                        e, StagingDirectories.sip, MessageLevels.error
-                    )
-                except tarfile.TarError as e:
-                    msg = create_fs_message(
-                        e, StagingDirectories.sip, MessageLevels.error
-                    )
-                except Exception as e:
-                    logger.exception("Error unpacking archive")
-                    msg = create_fs_message(
-                        e, StagingDirectories.sip, MessageLevels.error
+        if mimetypes.guess_type(filename)[0] == "application/rar":
+            self.check_rar_entries(filename)
+        with TemporaryDirectory() as d:
+            msg = self.extractall(unpack_destination=d, filename=filename)
+            if msg is not None:
+                return msg
+
+            rootdir = self.find_root_directory(d)
+            unpacked_files = [
+                unpacked_file
+                for unpacked_file in Path(rootdir).rglob("*")
+                if unpacked_file.is_file()
+            ]
+            # the archive index may understate what was unpacked
+            self.check_entries([(str(f), f.stat().st_size) for f in unpacked_files])
+            for unpacked_file in unpacked_files:
+                relpath = Path(category.name, unpacked_file.relative_to(rootdir))
+                with unpacked_file.open("rb") as unpacked_fileobj:
+                    content = File(
+                        _ArchiveMemberReader(unpacked_fileobj, self),
+                        name=relpath.name,
                     )
+                    msgs.append(self.save_content(relpath, content))
+        return msgs
 
-                if msg is not None:
-                    return msg
-
-                rootdir = self.find_root_directory(d)
-                for unpacked_file in Path(rootdir).rglob("*"):
-                    if unpacked_file.is_file():
-                        with File(unpacked_file.open("rb")) as unpacked_fileobj:
-                            relpath = Path(
-                                category.name, unpacked_file.relative_to(rootdir)
-                            )
-                            msgs.append(
-                                self.sip_storage.log_save(
-                                    name=str(relpath), content=unpacked_fileobj
-                                )
-                            )
-                msgs.downgrade()
+    def process(self, category: FileCategoryDirectories, filename: str):
+        mimetype = mimetypes.guess_type(filename)[0]
+        try:
+            if mimetype == "application/zip":
+                msgs = self.stream_zip(category, filename)
+            elif mimetype == "application/x-tar":
+                msgs = self.stream_tar(category, filename)
+            else:
+                msgs = self.extract_and_save(category, filename)
+        except ArchiveLimitExceeded as e:
+            self.remove_saved_files()
+            return create_fs_message(e, StagingDirectories.sip, MessageLevels.error)
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            self.remove_saved_files()
+            return create_fs_message(e, StagingDirectories.sip, MessageLevels.error)
         except Exception as e:
-            msgs.append(
-                create_fs_message(str(e), StagingDirectories.sip, MessageLevels.error)
-            )
+            logger.exception("Error unpacking archive")
+            self.remove_saved_files()
+            return create_fs_message(e, StagingDirectories.sip, MessageLevels.error)
+        if isinstance(msgs, MessageGroup):
+            msgs.downgrade()
         return msgs
 
 
@@ -0,0 +1,125 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from library.metadata import CodeMetaConverter
+from library.models import (
+    CodebaseRelease,
+    DataCiteSchema,
+    ReleaseContributor,
+    ReleaseMetadataContext,
+    Role,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def convert_release_contributors_models(release):
+    """
+    Reference implementation of the release contributor conversions that reads ReleaseContributor model instances
+    and their contributors. The attribute access proxy ReleaseContributor used to have is not reproduced so the
+    timings understate the previous cost
+    """
+    release_contributors = list(
+        ReleaseContributor.objects.for_release(release)
+        .select_related("contributor__user__member_profile")
+        .prefetch_related("contributor__user__socialaccount_set")
+    )
+    authors = [
+        rc
+        for rc in release_contributors
+        if rc.include_in_citation or Role.AUTHOR in rc.roles
+    ]
+    citation_authors = ", ".join(
+        rc.contributor.get_full_name()
+        for rc in release_contributors
+        if rc.include_in_citation and rc.contributor.has_name
+    )
+    contributor_names = [
+        rc.contributor.get_full_name()
+        for rc in release_contributors
+        if rc.contributor.has_name
+    ]
+    codemeta_actors = []
+    codemeta_roles = []
+    for index, rc in enumerate(authors):
+        actor = CodeMetaConverter._convert_actor(rc.contributor, "author", index)
+        codemeta_actors.append(actor)
+        codemeta_roles.extend(CodeMetaConverter._convert_roles(actor.id_, rc.roles))
+    creators = DataCiteSchema.to_citable_authors([rc.contributor for rc in authors])
+    return (
+        citation_authors,
+        contributor_names,
+        codemeta_actors + codemeta_roles,
+        creators,
+    )
+
+
+def convert_release_contributors_views(release):
+    context = ReleaseMetadataContext(release)
+    authors = context.author_release_contributors
+    citation_authors = ", ".join(
+        c.name for c in context.citable_release_contributors if c.has_name
+    )
+    contributor_names = [c.name for c in context.contributors if c.has_name]
+    codemeta_actors = CodeMetaConverter.convert_contributors(authors, "author")
+    creators = DataCiteSchema.to_citable_authors(authors)
+    return citation_authors, contributor_names, codemeta_actors, creators
+
+
+class Command(BaseCommand):
+    help = """compare the latency and number of queries of citation, CodeMeta and DataCite contributor conversion
+    with precomputed ReleaseContributorViews and with ReleaseContributor model instances"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--release",
+            type=int,
+            help="id of the release to convert, defaults to the release with the most contributors",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="number of timed conversions"
+        )
+
+    def get_release(self, release_id):
+        releases = CodebaseRelease.objects.select_related("codebase", "submitter")
+        if release_id is not None:
+            return releases.get(id=release_id)
+        release = (
+            releases.annotate(contributor_count=Count("codebase_contributors"))
+            .order_by("-contributor_count")
+            .first()
+        )
+        if release is None:
+            raise CommandError("no releases to benchmark")
+        return release
+
+    def time_conversion(self, convert, release, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            result = convert(release)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            convert(release)
+        return (time.perf_counter() - start) / repeat * 1000, len(queries), result
+
+    def handle(self, *args, **options):
+        release = self.get_release(options["release"])
+        self.stdout.write(
+            f"{release}: {release.codebase_contributors.count()} contributors"
+        )
+        self.stdout.write("conversion\tqueries\tms per conversion")
+        results = {}
+        for name, convert in (
+            ("views", convert_release_contributors_views),
+            ("models", convert_release_contributors_models),
+        ):
+            latency, query_count, results[name] = self.time_conversion(
+                convert, release, options["repeat"]
+            )
+            self.stdout.write(f"{name}\t{query_count}\t{latency:.2f}")
+        if results["views"] != results["models"]:
+            logger.warning("conversions disagree for release %s", release.id)
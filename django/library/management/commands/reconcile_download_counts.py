@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from huey.exceptions import TaskLockedException
+
+from library.downloads import reconcile_download_counts
+
+
+class Command(BaseCommand):
+    """
+    Recompute the download totals stored on each CodebaseRelease and Codebase from the recorded
+    CodebaseReleaseDownloads, correcting counters that drifted, e.g., because buffered increments were lost.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="number of corrected rows to write per query",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=10,
+            help="number of retries while the download recording or flushing task is running",
+        )
+        parser.add_argument(
+            "--retry-delay",
+            type=int,
+            default=30,
+            help="seconds to wait between retries",
+        )
+
+    def reconcile(self, batch_size, retries, retry_delay):
+        for attempt in range(retries + 1):
+            try:
+                return reconcile_download_counts(batch_size=batch_size)
+            except TaskLockedException:
+                if attempt == retries:
+                    raise CommandError(
+                        "download recording or flushing is still running, try again later"
+                    )
+                self.stdout.write(
+                    f"download recording or flushing is running, retrying in {retry_delay}s"
+                )
+                time.sleep(retry_delay)
+
+    def handle(self, *args, **options):
+        releases, codebases = self.reconcile(
+            options["batch_size"], options["retries"], options["retry_delay"]
+        )
+        self.stdout.write(
+            f"Corrected download totals for {releases} releases and {codebases} codebases"
+        )
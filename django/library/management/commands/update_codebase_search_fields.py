@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from library.models import Codebase
+
+
+class Command(BaseCommand):
+    """
+    Recompute the denormalized search fields (contributor names and emails, release frameworks and programming
+    languages) stored on each Codebase.
+
+    These are kept up to date when codebases, releases and contributors are saved but changes to user accounts
+    are only picked up by this command, so it runs before the search index is updated.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="number of codebases to recompute per batch",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        codebase_ids = list(
+            Codebase.objects.order_by("id").values_list("id", flat=True)
+        )
+        updated = 0
+        for start in range(0, len(codebase_ids), batch_size):
+            batch = codebase_ids[start : start + batch_size]
+            updated += Codebase.objects.filter(id__in=batch).update_search_fields(
+                batch_size=batch_size
+            )
+        self.stdout.write(f"Updated search fields for {updated} codebases")
@@ -92,23 +92,17 @@ class CodeMetaConverter:
         contributors,
         actor_type: Literal["author", "contributor"],
     ) -> list[Person | Organization | Role]:
-        """converts a list of Contributor or ReleaseContributor objects to a list of codemeta actors.
-        If ReleaseContributors are given, the roles are also converted to codemeta/schema.org roles
+        """converts a list of Contributor or ReleaseContributorView objects to a list of codemeta actors.
+        If ReleaseContributorViews are given, the roles are also converted to codemeta/schema.org roles
         """
         codemeta_actors = []
         codemeta_roles = []
-        for index, contributor_or_rc in enumerate(contributors):
-            contributor = (
-                contributor_or_rc.contributor
-                if hasattr(contributor_or_rc, "contributor")
-                else contributor_or_rc
-            )
+        for index, contributor in enumerate(contributors):
             actor = cls._convert_actor(contributor, actor_type, index)
             codemeta_actors.append(actor)
-            if hasattr(contributor_or_rc, "roles"):
-                codemeta_roles.extend(
-                    cls._convert_roles(actor.id_, contributor_or_rc.roles)
-                )
+            roles = getattr(contributor, "roles", None)
+            if roles:
+                codemeta_roles.extend(cls._convert_roles(actor.id_, roles))
         return codemeta_actors + codemeta_roles
 
     @classmethod
@@ -216,11 +210,11 @@ class CodeMetaConverter:
             ),
             # FIXME: need better guidance on author vs contributor fields in CodeMeta
             author=cls.convert_contributors(
-                release.author_release_contributors, "author"
+                release.metadata_context.author_release_contributors, "author"
             )
             or None,
             contributor=cls.convert_contributors(
-                release.nonauthor_release_contributors, "contributor"
+                release.metadata_context.nonauthor_release_contributors, "contributor"
             )
             or None,
             copyrightYear=(
@@ -0,0 +1,82 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0032_license_text_codemeta_snapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CodebaseReleaseFile",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "stage",
+                    models.CharField(
+                        choices=[
+                            ("originals", "Original files"),
+                            ("sip", "Submission information package"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        blank=True,
+                        help_text="Category directory of the file, blank for top level files",
+                        max_length=16,
+                    ),
+                ),
+                (
+                    "path",
+                    models.TextField(help_text="Path relative to the stage directory"),
+                ),
+                ("size", models.BigIntegerField()),
+                ("mimetype", models.CharField(blank=True, max_length=255)),
+                ("sha256", models.CharField(max_length=64)),
+                (
+                    "mtime_ns",
+                    models.BigIntegerField(
+                        help_text="Modification time of the file when it was last hashed"
+                    ),
+                ),
+                (
+                    "release",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="file_index",
+                        to="library.codebaserelease",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["path"],
+                "indexes": [
+                    models.Index(
+                        fields=["release", "stage", "category"],
+                        name="library_cod_release_d45294_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="codebasereleasefile",
+            constraint=models.UniqueConstraint(
+                fields=("release", "stage", "path"), name="unique_release_file_path"
+            ),
+        ),
+    ]
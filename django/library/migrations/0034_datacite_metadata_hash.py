@@ -0,0 +1,47 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0033_codebasereleasefile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="codebase",
+            name="datacite_metadata_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Hash of the DataCite metadata for this DOI as of the last update",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="codebaserelease",
+            name="datacite_metadata_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Hash of the DataCite metadata for this DOI as of the last update",
+                max_length=64,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dataciteregistrationlog",
+            index=models.Index(
+                fields=["codebase", "http_status", "-timestamp"],
+                name="library_dat_codebas_dc43f9_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dataciteregistrationlog",
+            index=models.Index(
+                fields=["release", "http_status", "-timestamp"],
+                name="library_dat_release_ccb076_idx",
+            ),
+        ),
+    ]
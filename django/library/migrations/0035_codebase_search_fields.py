@@ -0,0 +1,45 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:40
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0034_datacite_metadata_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="codebase",
+            name="contributor_search_text",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="Names and emails of all contributors to published releases, used for search indexing",
+            ),
+        ),
+        migrations.AddField(
+            model_name="codebase",
+            name="release_frameworks",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=100),
+                blank=True,
+                default=list,
+                help_text="Frameworks used by any release, used for search indexing",
+                size=None,
+            ),
+        ),
+        migrations.AddField(
+            model_name="codebase",
+            name="release_programming_languages",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=100),
+                blank=True,
+                default=list,
+                help_text="Programming languages used by any release, used for search indexing",
+                size=None,
+            ),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_download_totals(apps, schema_editor):
+    Codebase = apps.get_model("library", "Codebase")
+    CodebaseRelease = apps.get_model("library", "CodebaseRelease")
+    CodebaseReleaseDownload = apps.get_model("library", "CodebaseReleaseDownload")
+    CodebaseRelease.objects.update(
+        download_total=Coalesce(
+            Subquery(
+                CodebaseReleaseDownload.objects.filter(release=OuterRef("pk"))
+                .order_by()
+                .values("release")
+                .annotate(count=Count("*"))
+                .values("count")
+            ),
+            0,
+        )
+    )
+    Codebase.objects.update(
+        download_total=Coalesce(
+            Subquery(
+                CodebaseRelease.objects.filter(codebase=OuterRef("pk"))
+                .order_by()
+                .values("codebase")
+                .annotate(total=Sum("download_total"))
+                .values("total")
+            ),
+            0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0035_codebase_search_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="codebase",
+            name="download_total",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of recorded downloads of all releases"
+            ),
+        ),
+        migrations.AddField(
+            model_name="codebaserelease",
+            name="download_total",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of recorded downloads of this release"
+            ),
+        ),
+        migrations.RunPython(
+            populate_download_totals, reverse_code=migrations.RunPython.noop
+        ),
+    ]
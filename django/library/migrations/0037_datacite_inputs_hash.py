@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0036_download_totals"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dataciteregistrationlog",
+            name="inputs_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="datacite_metadata_hash of the codebase or release when the metadata was sent",
+                max_length=64,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="codebase",
+            name="datacite_metadata_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Hash of the inputs of the DataCite metadata for this DOI, see Codebase.get_datacite_metadata_hashes",
+                max_length=64,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="codebaserelease",
+            name="datacite_metadata_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Hash of the inputs of the DataCite metadata for this DOI, see Codebase.get_datacite_metadata_hashes",
+                max_length=64,
+            ),
+        ),
+    ]
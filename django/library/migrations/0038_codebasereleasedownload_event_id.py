@@ -0,0 +1,24 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0037_datacite_inputs_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="codebasereleasedownload",
+            name="event_id",
+            field=models.CharField(
+                blank=True,
+                help_text="id of the download event stream entry this download was recorded from, see library.downloads",
+                max_length=64,
+                null=True,
+                unique=True,
+            ),
+        ),
+    ]
@@ -19,9 +19,19 @@ from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.core.cache import cache
 from django.core.files.images import ImageFile
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.files.storage import FileSystemStorage
 from django.db import models, transaction
-from django.db.models import Prefetch, Q, Count, Max
+from django.db.models import (
+    Prefetch,
+    Q,
+    Count,
+    Max,
+    F,
+    OuterRef,
+    Subquery,
+    prefetch_related_objects,
+)
 from django.utils.functional import cached_property
 from django.urls import reverse
 from django.utils import timezone
@@ -30,7 +40,11 @@ from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from modelcluster.contrib.taggit import ClusterTaggableManager
 from modelcluster.fields import ParentalKey
-from modelcluster.models import ClusterableModel
+from modelcluster.models import (
+    ClusterableModel,
+    get_all_child_m2m_relations,
+    get_all_child_relations,
+)
 from rest_framework.exceptions import ValidationError, UnsupportedMediaType
 from taggit.models import TaggedItemBase
 from wagtail.admin.panels import FieldPanel
@@ -46,13 +60,13 @@ from wagtail.images.models import (
 from wagtail.search import index
 from wagtail.snippets.models import register_snippet
 
-from core import fs
+from core import fs, search_indexing
 from core.backends import add_to_comses_permission_whitelist
 from core.fields import MarkdownField
 from core.models import Platform, MemberProfile, ModeratedContent
 from core.queryset import get_viewable_objects_for_user
 from core.utils import send_markdown_email
-from core.view_helpers import get_search_queryset
+from core.view_helpers import get_search_queryset, invalidate_search_results
 from .metadata import CodeMetaConverter, DataCiteConverter, CitationFileFormatConverter
 from .fs import (
     CodebaseReleaseFsApi,
@@ -328,6 +342,20 @@ class Contributor(index.Indexed, ClusterableModel):
                 + f" {self.family_name}".rstrip()
             )
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            # names and emails are denormalized into the search fields of the codebases this contributor worked on
+            codebases = Codebase.objects.filter(
+                releases__codebase_contributors__contributor=self
+            ).distinct()
+            codebases.update_search_fields()
+            from .release_page import invalidate_release_page_context_on_commit
+
+            for codebase_id in codebases.values_list("id", flat=True):
+                invalidate_release_page_context_on_commit(codebase_id)
+
     def __str__(self):
         if self.email:
             return f"{self.get_full_name()} ({self.email})"
@@ -378,6 +406,15 @@ class CodebaseReleaseDownload(models.Model):
     reason = models.CharField(max_length=500, choices=Reason.choices)
     affiliation = models.JSONField(default=None, null=True)
     industry = models.CharField(max_length=255, choices=MemberProfile.Industry.choices)
+    event_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        unique=True,
+        help_text=_(
+            "id of the download event stream entry this download was recorded from, see library.downloads"
+        ),
+    )
 
     def __str__(self):
         return f"[download] ip: {self.ip_address}, release: {self.release}"
@@ -386,6 +423,110 @@ class CodebaseReleaseDownload(models.Model):
         indexes = [models.Index(fields=["date_created"])]
 
 
+class CodebaseReleaseFile(models.Model):
+    """
+    Index of the files in a release's originals and submission package directories, kept in sync by
+    CodebaseReleaseFsApi so file listings and sizes don't require walking the filesystem
+    """
+
+    class Stage(models.TextChoices):
+        ORIGINALS = StagingDirectories.originals.name, _("Original files")
+        SIP = StagingDirectories.sip.name, _("Submission information package")
+
+    # mimetype of directory entries, these are indexed so that empty directories can be listed
+    DIRECTORY_MIMETYPE = "inode/directory"
+
+    release = models.ForeignKey(
+        "library.CodebaseRelease", related_name="file_index", on_delete=models.CASCADE
+    )
+    stage = models.CharField(max_length=16, choices=Stage.choices)
+    category = models.CharField(
+        max_length=16,
+        blank=True,
+        help_text=_("Category directory of the file, blank for top level files"),
+    )
+    path = models.TextField(help_text=_("Path relative to the stage directory"))
+    size = models.BigIntegerField()
+    mimetype = models.CharField(max_length=255, blank=True)
+    sha256 = models.CharField(max_length=64)
+    mtime_ns = models.BigIntegerField(
+        help_text=_("Modification time of the file when it was last hashed")
+    )
+
+    @property
+    def relpath(self):
+        """path relative to the category directory"""
+        if self.category:
+            return str(pathlib.PurePath(self.path).relative_to(self.category))
+        return self.path
+
+    def __str__(self):
+        return (
+            f"[{self.stage}] {self.path} ({self.size} bytes) release: {self.release_id}"
+        )
+
+    class Meta:
+        ordering = ["path"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["release", "stage", "path"], name="unique_release_file_path"
+            )
+        ]
+        indexes = [models.Index(fields=["release", "stage", "category"])]
+
+
+def filter_stale_datacite_metadata(queryset, log_field):
+    """
+    Filters a queryset of codebases or releases down to those with DOIs whose denormalized datacite_metadata_hash
+    differs from the inputs hash of their latest successful DataCite registration, in a single query
+    """
+    registered_metadata_hash = (
+        DataCiteRegistrationLog.objects.filter(
+            http_status=200, **{log_field: OuterRef("pk")}
+        )
+        .order_by("-timestamp")
+        .values("inputs_hash")[:1]
+    )
+    return (
+        queryset.with_doi()
+        .annotate(registered_metadata_hash=Subquery(registered_metadata_hash))
+        .filter(
+            Q(registered_metadata_hash__isnull=True)
+            | ~Q(registered_metadata_hash=F("datacite_metadata_hash"))
+        )
+    )
+
+
+def exclude_from_save(instance, save_kwargs, *field_names):
+    """
+    Limits an ordinary save of an existing ClusterableModel instance to every field and child relation except the
+    given fields, e.g., counters maintained with UPDATE queries that a stale instance would otherwise write back.
+    Only used by models with such counters. Since the save becomes an update_fields save, saving an instance whose
+    row was deleted meanwhile raises DatabaseError instead of inserting the row again
+    """
+    if (
+        instance._state.adding
+        or save_kwargs.get("update_fields") is not None
+        or save_kwargs.get("force_insert")
+    ):
+        return
+    save_kwargs["update_fields"] = (
+        [
+            field.name
+            for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in field_names
+        ]
+        + [rel.get_accessor_name() for rel in get_all_child_relations(instance)]
+        + [field.name for field in get_all_child_m2m_relations(instance)]
+    )
+
+
+def hash_datacite_inputs(*inputs):
+    return hashlib.sha256(
+        json.dumps(inputs, sort_keys=True, cls=DjangoJSONEncoder).encode("utf-8")
+    ).hexdigest()
+
+
 class CodebaseQuerySet(models.QuerySet):
     def update_publish_date(self):
         for codebase in self.all():
@@ -410,7 +551,8 @@ class CodebaseQuerySet(models.QuerySet):
         return self.prefetch_related(Prefetch("releases", queryset=queryset))
 
     def with_tags(self):
-        return self.prefetch_related("tagged_codebases__tag")
+        # codebase.tags.all() reads the prefetch cache of the tags manager, not the tagged items
+        return self.prefetch_related("tags")
 
     def with_featured_images(self):
         return self.prefetch_related("featured_images")
@@ -483,6 +625,94 @@ class CodebaseQuerySet(models.QuerySet):
     def with_doi(self, **kwargs):
         return self.exclude(Q(doi__isnull=True) | Q(doi=""), **kwargs)
 
+    def with_stale_datacite_metadata(self):
+        return filter_stale_datacite_metadata(self, "codebase")
+
+    def search_field_values(self):
+        """
+        Returns a dict mapping the ids of codebases in this queryset to the values of their denormalized search
+        fields, computed with a fixed number of queries regardless of the number of codebases
+        """
+        codebase_ids = list(self.values_list("id", flat=True))
+        contributor_fields = defaultdict(dict)
+        release_contributors = (
+            ReleaseContributor.objects.filter(
+                release__codebase_id__in=codebase_ids,
+                release__status=CodebaseRelease.Status.PUBLISHED,
+            )
+            .values_list(
+                "release__codebase_id",
+                "contributor_id",
+                "contributor__given_name",
+                "contributor__family_name",
+                "contributor__email",
+                "contributor__user__first_name",
+                "contributor__user__last_name",
+                "contributor__user__username",
+                "contributor__user__email",
+            )
+            .distinct()
+        )
+        for codebase_id, contributor_id, *fields in release_contributors:
+            # mirrors Contributor.get_aggregated_search_fields, user fields are null for contributors without a user
+            contributor_fields[codebase_id][contributor_id] = " ".join(
+                sorted({field for field in fields if field is not None})
+            )
+        frameworks = defaultdict(set)
+        for codebase_id, name in CodebaseRelease.objects.filter(
+            codebase_id__in=codebase_ids, platform_tags__isnull=False
+        ).values_list("codebase_id", "platform_tags__name"):
+            frameworks[codebase_id].add(name)
+        programming_languages = defaultdict(set)
+        for codebase_id, name in CodebaseRelease.objects.filter(
+            codebase_id__in=codebase_ids, programming_languages__isnull=False
+        ).values_list("codebase_id", "programming_languages__name"):
+            programming_languages[codebase_id].add(name)
+        return {
+            codebase_id: {
+                "contributor_search_text": " ".join(
+                    fields
+                    for _, fields in sorted(contributor_fields[codebase_id].items())
+                ),
+                "release_frameworks": sorted(frameworks[codebase_id]),
+                "release_programming_languages": sorted(
+                    programming_languages[codebase_id]
+                ),
+            }
+            for codebase_id in codebase_ids
+        }
+
+    def update_search_fields(self, batch_size=500):
+        """
+        Recomputes and stores the denormalized search fields of all codebases in this queryset and enqueues the
+        codebases whose fields changed for search indexing. Bypasses Codebase.save() so no metadata is rebuilt
+        :return: the number of codebases updated
+        """
+        current_values = {
+            values.pop("id"): values
+            for values in self.values("id", *self.model.SEARCH_FIELDS)
+        }
+        codebases = [
+            self.model(id=codebase_id, **values)
+            for codebase_id, values in self.search_field_values().items()
+            if current_values.get(codebase_id) != values
+        ]
+        self.model.objects.bulk_update(
+            codebases, self.model.SEARCH_FIELDS, batch_size=batch_size
+        )
+        search_indexing.enqueue_objects_on_commit(
+            self.model, [codebase.id for codebase in codebases]
+        )
+        return len(codebases)
+
+    def for_search_index(self):
+        """
+        Returns live, non-spam codebases with everything needed to build their search documents. Contributors,
+        frameworks and programming languages are read from denormalized columns so indexing runs a constant
+        number of queries instead of several per codebase
+        """
+        return self.filter(live=True).exclude_spam().with_tags()
+
     def public(self, **kwargs):
         """Returns a queryset of all live codebases and their live releases"""
         return self.with_contributors(**kwargs).exclude_spam()
@@ -574,6 +804,40 @@ class Codebase(index.Indexed, ModeratedContent, ClusterableModel):
 
     identifier = models.CharField(max_length=128, unique=True)
     doi = models.CharField(max_length=128, unique=True, null=True)
+    datacite_metadata_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        help_text=_(
+            "Hash of the inputs of the DataCite metadata for this DOI, see Codebase.get_datacite_metadata_hashes"
+        ),
+    )
+    # maintained by library.downloads, see flush_download_counts and reconcile_download_counts
+    download_total = models.PositiveIntegerField(
+        default=0, help_text=_("Number of recorded downloads of all releases")
+    )
+    # denormalized search fields maintained by refresh_search_fields, see CodebaseQuerySet.search_field_values
+    contributor_search_text = models.TextField(
+        blank=True,
+        default="",
+        help_text=_(
+            "Names and emails of all contributors to published releases, used for search indexing"
+        ),
+    )
+    release_frameworks = ArrayField(
+        models.CharField(max_length=100),
+        blank=True,
+        default=list,
+        help_text=_("Frameworks used by any release, used for search indexing"),
+    )
+    release_programming_languages = ArrayField(
+        models.CharField(max_length=100),
+        blank=True,
+        default=list,
+        help_text=_(
+            "Programming languages used by any release, used for search indexing"
+        ),
+    )
     uuid = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
 
     latest_version = models.ForeignKey(
@@ -647,6 +911,7 @@ class Codebase(index.Indexed, ModeratedContent, ClusterableModel):
         index.FilterField("id"),
         index.FilterField("all_release_frameworks"),
         index.FilterField("all_release_programming_languages"),
+        index.FilterField("tag_names"),
         index.FilterField("is_marked_spam"),
         index.FilterField("last_modified"),
         index.FilterField("peer_reviewed"),
@@ -668,6 +933,80 @@ class Codebase(index.Indexed, ModeratedContent, ClusterableModel):
     def datacite(self):
         return DataCiteSchema.from_codebase(self)
 
+    def get_datacite_metadata_hashes(self):
+        """
+        Hashes the inputs of the DataCite metadata of this codebase and of each of its releases without building
+        the metadata. Codebase metadata lists the authors and DOIs of every release and release metadata refers to
+        the DOIs of the codebase and sibling releases, so the hashes cover the codemeta snapshots (title,
+        description, tags, contributors, license, etc.), DOIs and publication dates of the codebase and all of its
+        releases. Items without a DOI get an empty hash.
+
+        :return: the codebase hash and a dict mapping release ids to release hashes
+        """
+        codebase = Codebase.objects.values(
+            "doi", "last_published_on", "codemeta_snapshot"
+        ).get(pk=self.pk)
+        releases = list(
+            self.releases.order_by("pk").values(
+                "id", "version_number", "doi", "last_published_on", "codemeta_snapshot"
+            )
+        )
+        for values in (codebase, *releases):
+            # dateModified changes on every save without affecting the DataCite metadata
+            values["codemeta_snapshot"] = {
+                key: value
+                for key, value in (values["codemeta_snapshot"] or {}).items()
+                if key != "dateModified"
+            }
+        release_dois = sorted((r["version_number"], r["doi"] or "") for r in releases)
+        codebase_hash = ""
+        if codebase["doi"]:
+            codebase_hash = hash_datacite_inputs(
+                codebase,
+                [
+                    (
+                        r["version_number"],
+                        r["doi"],
+                        r["codemeta_snapshot"].get("author"),
+                    )
+                    for r in releases
+                ],
+            )
+        release_hashes = {
+            r["id"]: (
+                hash_datacite_inputs(r, codebase["doi"], release_dois)
+                if r["doi"]
+                else ""
+            )
+            for r in releases
+        }
+        return codebase_hash, release_hashes
+
+    def get_datacite_metadata_hash(self):
+        return self.get_datacite_metadata_hashes()[0]
+
+    def update_datacite_metadata_hashes(self):
+        """
+        Recomputes the datacite_metadata_hash of this codebase and its releases and saves the ones that changed
+
+        :return: the codebase hash and a dict mapping release ids to release hashes
+        """
+        codebase_hash, release_hashes = self.get_datacite_metadata_hashes()
+        Codebase.objects.filter(pk=self.pk).exclude(
+            datacite_metadata_hash=codebase_hash
+        ).update(datacite_metadata_hash=codebase_hash)
+        self.datacite_metadata_hash = codebase_hash
+        stored_hashes = dict(self.releases.values_list("id", "datacite_metadata_hash"))
+        CodebaseRelease.objects.bulk_update(
+            [
+                CodebaseRelease(id=release_id, datacite_metadata_hash=release_hash)
+                for release_id, release_hash in release_hashes.items()
+                if stored_hashes.get(release_id) != release_hash
+            ],
+            ["datacite_metadata_hash"],
+        )
+        return codebase_hash, release_hashes
+
     # FIXME: this is currently unused, should replace the above datacite property
     @property
     def datacite_temp(self):
@@ -683,6 +1022,11 @@ class Codebase(index.Indexed, ModeratedContent, ClusterableModel):
     def concatenated_tags(self):
         return " ".join(self.tags.values_list("name", flat=True))
 
+    @property
+    def tag_names(self):
+        # reads the tags prefetched by CodebaseQuerySet.with_tags() (used by get_indexed_objects) without a query
+        return sorted(tag.name for tag in self.tags.all())
+
     @property
     def deletable(self):
         return not self.live
@@ -716,16 +1060,13 @@ class Codebase(index.Indexed, ModeratedContent, ClusterableModel):
         return urls
 
     def get_featured_rendition_url(self):
-        try:
-            featured_image = self.get_featured_image()
-            if featured_image:
-                return featured_image.get_rendition("max-900x600").url
-            return None
-        except Exception as e:
-            logger.error(
-                f"Failed to get featured image for codebase {self.pk}. Error{e}"
-            )
-            return None
+        """
+        :return: the url of the featured image's max-900x600 rendition or None if it has not been generated yet,
+        never processes images
+        """
+        from .featured_images import get_featured_rendition_url
+
+        return get_featured_rendition_url(self.pk)
 
     def subpath(self, *args):
         return pathlib.Path(self.base_library_dir, *args)
@@ -806,30 +1147,26 @@ class Codebase(index.Indexed, ModeratedContent, ClusterableModel):
         )
 
     def get_all_contributors_search_fields(self):
-        return " ".join(
-            [c.get_aggregated_search_fields() for c in self.all_contributors]
-        )
+        return self.contributor_search_text
 
     @property
     def all_release_frameworks(self):
-        return list(
-            self.releases.exclude(platform_tags__isnull=True).values_list(
-                "platform_tags__name", flat=True
-            )
-        )
+        return self.release_frameworks
 
     @property
     def all_release_programming_languages(self):
-        return list(
-            self.releases.exclude(programming_languages__isnull=True).values_list(
-                "programming_languages__name", flat=True
-            )
-        )
+        return self.release_programming_languages
+
+    def refresh_search_fields(self):
+        """recompute the denormalized search fields from the current releases and contributors without saving"""
+        if self.pk is None:
+            return
+        values = Codebase.objects.filter(pk=self.pk).search_field_values()
+        for field, value in values[self.pk].items():
+            setattr(self, field, value)
 
     def download_count(self):
-        return CodebaseReleaseDownload.objects.filter(
-            release__codebase__id=self.id
-        ).count()
+        return self.download_total
 
     def ordered_releases_list(self, has_change_perm=False, asc=True, **kwargs):
         """
@@ -999,6 +1336,8 @@ class Codebase(index.Indexed, ModeratedContent, ClusterableModel):
         source_release.platform_tags.add(*platform_tags)
         source_release.programming_languages.add(*programming_languages)
         contributors.copy_to(source_release)
+        # the metadata context cached by save() read the contributors before they were copied
+        source_release.clear_metadata_cache()
         return source_release
 
     @transaction.atomic
@@ -1048,23 +1387,99 @@ class Codebase(index.Indexed, ModeratedContent, ClusterableModel):
             self.save()
         return release
 
+    # denormalized search fields, see CodebaseQuerySet.search_field_values
+    SEARCH_FIELDS = (
+        "contributor_search_text",
+        "release_frameworks",
+        "release_programming_languages",
+    )
+
+    # codebase fields that are copied into the metadata of each of its releases (see
+    # CodeMetaConverter._common_codebase_fields and CommonMetadata)
+    RELEASE_METADATA_FIELDS = (
+        "title",
+        "summary",
+        "description",
+        "repository_url",
+        "references_text",
+        "replication_text",
+        "associated_publication_text",
+        "doi",
+        "live",
+        "peer_reviewed",
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_release_metadata = instance.get_release_metadata_values()
+        return instance
+
+    def get_release_metadata_values(self):
+        """
+        returns the current values of RELEASE_METADATA_FIELDS or None if any of them were deferred
+        """
+        if self.get_deferred_fields().intersection(self.RELEASE_METADATA_FIELDS):
+            return None
+        values = {}
+        for field_name in self.RELEASE_METADATA_FIELDS:
+            value = getattr(self, field_name)
+            # markdown fields hold a Markup object, compare their raw text
+            values[field_name] = getattr(value, "raw", value)
+        return values
+
+    def has_release_metadata_changed(self, previous_codemeta):
+        """
+        True if any codebase fields or tags that appear in release metadata changed since this codebase was loaded.
+        Tags are compared through the keywords of the previous and current codemeta snapshots as they are
+        assigned before the codebase is saved.
+        """
+        loaded_values = getattr(self, "_loaded_release_metadata", None)
+        if loaded_values is None or loaded_values != self.get_release_metadata_values():
+            return True
+        return previous_codemeta.get("keywords") != self.codemeta_snapshot.get(
+            "keywords"
+        )
+
     def save(self, rebuild_metadata=True, rebuild_release_metadata=True, **kwargs):
         """save the codebase and optionally rebuild metadata by updating codemeta_snapshot.
-        If rebuild_release_metadata is True, all releases will be saved to trigger metadata updates
+        If rebuild_release_metadata is True and codebase fields that appear in release metadata changed, the
+        metadata of all releases is rebuilt in a single background task once the transaction commits
         """
+        release_metadata_changed = False
         if rebuild_metadata:
             logger.debug("Building codemeta for codebase: %s", self)
+            previous_codemeta = self.codemeta_snapshot
             self.codemeta_snapshot = self.codemeta.dict(serialize=True)
+            release_metadata_changed = self.has_release_metadata_changed(
+                previous_codemeta
+            )
+        self.refresh_search_fields()
+        # download_total is maintained by library.downloads
+        exclude_from_save(self, kwargs, "download_total")
         super().save(**kwargs)
-        # saving releases will trigger metadata rebuilding and updating
-        # the fs and git mirror if one exists
-        if rebuild_metadata and rebuild_release_metadata:
-            for release in self.releases.all():
-                release.save(rebuild_metadata=True)
+        if rebuild_metadata:
+            self.update_datacite_metadata_hashes()
+        from .release_page import invalidate_release_page_context_on_commit
+
+        invalidate_release_page_context_on_commit(self.pk)
+        self._loaded_release_metadata = self.get_release_metadata_values()
+        if rebuild_release_metadata and release_metadata_changed:
+            Codebase.schedule_release_metadata_rebuild(self.pk)
+
+    @staticmethod
+    def schedule_release_metadata_rebuild(codebase_id):
+        """
+        rebuild the metadata of all releases of a codebase in a single background task once the transaction
+        commits. Rebuilding release metadata also updates the fs and git mirror if one exists
+        """
+        from .tasks import rebuild_codebase_release_metadata
+
+        transaction.on_commit(lambda: rebuild_codebase_release_metadata(codebase_id))
 
     @classmethod
     def get_indexed_objects(cls):
-        return cls.objects.public()
+        return cls.objects.for_search_index()
 
     def __str__(self):
         return f"[codebase] {self.title} {self.date_created} (identifier:{self.identifier}, live:{self.live})"
@@ -1176,6 +1591,9 @@ class CodebaseReleaseQuerySet(models.QuerySet):
     def without_doi(self, **kwargs):
         return self.filter(Q(doi__isnull=True) | Q(doi=""), **kwargs)
 
+    def with_stale_datacite_metadata(self):
+        return filter_stale_datacite_metadata(self, "release")
+
     def latest_for_feed(self, number=10, include_all=False):
         qs = (
             self.public()
@@ -1254,6 +1672,18 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
     share_uuid = models.UUIDField(default=None, blank=True, null=True, unique=True)
     identifier = models.CharField(max_length=128, unique=True, null=True)
     doi = models.CharField(max_length=128, unique=True, null=True)
+    datacite_metadata_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        help_text=_(
+            "Hash of the inputs of the DataCite metadata for this DOI, see Codebase.get_datacite_metadata_hashes"
+        ),
+    )
+    # maintained by library.downloads, see flush_download_counts and reconcile_download_counts
+    download_total = models.PositiveIntegerField(
+        default=0, help_text=_("Number of recorded downloads of this release")
+    )
     license = models.ForeignKey(License, null=True, on_delete=models.SET_NULL)
     release_notes = MarkdownField(
         blank=True,
@@ -1595,20 +2025,9 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
     def citable_release_contributors(self):
         return ReleaseContributor.objects.citable().for_release(self)
 
-    @cached_property
+    @property
     def citation_authors(self):
-        authors = self.submitter.member_profile.name
-        citable_contributors = self.citable_release_contributors
-        if citable_contributors:
-            authors = ", ".join(
-                [rc.get_full_name() for rc in citable_contributors if rc.has_name]
-            )
-        else:
-            logger.warning(
-                "No authors found for release when building citation text, using default submitter name: %s",
-                authors,
-            )
-        return authors
+        return self.metadata_context.citation_authors
 
     @cached_property
     def citation_text(self):
@@ -1624,7 +2043,7 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
         )
 
     def download_count(self):
-        return self.downloads.count()
+        return self.download_total
 
     def get_previous_release(self):
         return (
@@ -1655,11 +2074,7 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
     @property
     def contributor_names(self):
         """Returns the names for all contributors for just this CodebaseRelease"""
-        return [
-            rc.contributor.get_full_name()
-            for rc in self.release_contributors
-            if rc.contributor.has_name
-        ]
+        return [c.name for c in self.metadata_context.contributors if c.has_name]
 
     @property
     def index_ordered_release_contributors(self):
@@ -1679,11 +2094,33 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
             # FIXME: check codemeta for additional metadata
         }
 
+    @cached_property
+    def metadata_context(self):
+        return ReleaseMetadataContext(self)
+
+    def clear_metadata_cache(self):
+        """discard cached metadata and its conversion context so they are rebuilt from the current release state"""
+        for name in ("metadata_context", "common_metadata", "datacite"):
+            self.__dict__.pop(name, None)
+        self.clear_prefetched_tags()
+
+    def clear_prefetched_tags(self):
+        # committed tags are read through the prefetch cache, which goes stale once tag changes are saved
+        prefetched = [
+            (self, "programming_languages"),
+            (self, "platform_tags"),
+        ]
+        if CodebaseRelease.codebase.is_cached(self):
+            prefetched.append((self.codebase, "tags"))
+        for instance, name in prefetched:
+            getattr(instance, "_prefetched_objects_cache", {}).pop(name, None)
+
     @cached_property
     def common_metadata(self):
         """
         FIXME: remove when we fully migrate to codemeticulous
         """
+        self.metadata_context.prefetch()
         return CommonMetadata(self)
 
     @cached_property
@@ -1694,6 +2131,13 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
             )
         return DataCiteSchema.from_release(self)
 
+    def get_datacite_metadata_hash(self):
+        """
+        the current hash of the inputs of this release's DataCite metadata, see
+        Codebase.get_datacite_metadata_hashes
+        """
+        return self.codebase.get_datacite_metadata_hashes()[1].get(self.pk, "")
+
     # FIXME: this is currently unused, should replace the above datacite property
     @property
     def datacite_temp(self):
@@ -1708,6 +2152,7 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
     @property
     def codemeta(self):
         """a freshly generated CodeMeta object representing this release"""
+        self.metadata_context.prefetch()
         return CodeMetaConverter.convert_release(self)
 
     @property
@@ -1725,16 +2170,12 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
     @property
     def cff_yaml_str(self):
         """yaml-formatted string of the cff metadata"""
-        return yaml.dump(self.cff.dict(serialize=True), default_flow_style=False)
+        return self.metadata_context.cff_yaml_str
 
-    @cached_property
+    @property
     def license_text(self) -> str:
         """return the license text with the copyright notice filled in"""
-        return (
-            self.license.get_formatted_text(self.citation_authors)
-            if self.license
-            else ""
-        )
+        return self.metadata_context.license_text
 
     @property
     def is_draft(self):
@@ -1807,12 +2248,14 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
                 index=index,
                 include_in_citation=include_in_citation,
             )
+            self.clear_metadata_cache()
             return new_release_contributor
         else:
             if role not in existing_release_contributor.roles:
                 # Update the roles of the existing ReleaseContributor instance
                 existing_release_contributor.roles.append(role)
                 existing_release_contributor.save()
+                self.clear_metadata_cache()
 
             return existing_release_contributor
 
@@ -1827,7 +2270,6 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
             self.first_published_at = now
             self.last_published_on = now
             self.status = self.Status.PUBLISHED
-            self.get_fs_api().build_published_archive(force=True)
             codebase = self.codebase
             codebase.latest_version = self
             codebase.live = True
@@ -1839,6 +2281,11 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
             self.save(defer_fs=False)
             # and then rebuild the codebase metadata
             codebase.save(rebuild_metadata=True, rebuild_release_metadata=False)
+            invalidate_search_results(Codebase)
+            # the published archive is built asynchronously once the transaction commits
+            from .tasks import enqueue_archive_build
+
+            enqueue_archive_build(self)
 
     @transaction.atomic
     def unpublish(self):
@@ -1853,6 +2300,7 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
             codebase.last_published_on = None
             codebase.first_published_at = None
             codebase.save()
+        invalidate_search_results(Codebase)
 
     def possible_next_versions(self, minor_only=False):
         return SemanticVersion.possible_next_versions(self.version_number, minor_only)
@@ -1901,15 +2349,28 @@ class CodebaseRelease(index.Indexed, ClusterableModel):
         """save the release and optionally rebuild metadata by updating codemeta_snapshot
         and rebuilding the filesystem metadata. If defer_fs is True (default), the filesystem rebuild
         will be deferred to an async task"""
+        from .release_page import invalidate_release_page_context_on_commit
+
+        # related releases are listed on the page of every release
+        invalidate_release_page_context_on_commit(self.codebase_id)
+        # download_total is maintained by library.downloads
+        exclude_from_save(self, kwargs, "download_total")
         if not rebuild_metadata:
             super().save(**kwargs)
         else:
             logger.debug("Building codemeta for release: %s", self)
+            self.clear_metadata_cache()
             old_codemeta = self.codemeta_snapshot
             self.codemeta_snapshot = self.codemeta.dict(serialize=True)
             super().save(**kwargs)
+            self.clear_prefetched_tags()
+            # the metadata of the codebase and sibling releases refers to this release
+            release_hashes = self.codebase.update_datacite_metadata_hashes()[1]
+            self.datacite_metadata_hash = release_hashes.get(self.pk, "")
 
             if old_codemeta != self.codemeta_snapshot:
+                # contributors, frameworks and programming languages are denormalized onto the codebase
+                Codebase.objects.filter(pk=self.codebase_id).update_search_fields()
                 if defer_fs:
                     from .tasks import update_fs_release_metadata
 
@@ -1991,32 +2452,98 @@ class ReleaseContributor(models.Model):
 
     objects = ReleaseContributorQuerySet.as_manager()
 
-    def __getattribute__(self, attribute_name):
-        """
-        Proxy to the underlying Contributor object for the given properties.
-        """
-        if attribute_name in [
-            "family_name",
-            "given_name",
-            "has_name",
-            "get_full_name",
-            "get_profile_url",
-            "get_aggregated_search_fields",
-            "member_profile_url",
-            "name",
-            "email",
-            "affiliations",
-            "json_affiliations",
-            "type",
-            "user",
-        ]:
-            return getattr(self.contributor, attribute_name)
-        return object.__getattribute__(self, attribute_name)
-
     def __str__(self):
         return f"[release_contributor] (release:{self.release}, contributor:{self.contributor})"
 
 
+class ReleaseContributorView:
+    """
+    Read-only record of a release contributor with the contributor values read by citations and metadata
+    converters (names, affiliations, ORCID, profile url, roles) resolved once. Offers the subset of the Contributor
+    interface used by CodeMetaConverter and DataCiteSchema so converting a release with many contributors does not
+    go through model attribute access or lazily load users and member profiles.
+    """
+
+    __slots__ = (
+        "id",
+        "contributor_id",
+        "index",
+        "roles",
+        "include_in_citation",
+        "type",
+        "given_name",
+        "family_name",
+        "resolved_given_name",
+        "resolved_family_name",
+        "name",
+        "has_name",
+        "email",
+        "affiliations",
+        "orcid_url",
+        "profile_url",
+    )
+
+    def __init__(self, **kwargs):
+        for attribute_name in self.__slots__:
+            setattr(self, attribute_name, kwargs[attribute_name])
+
+    @classmethod
+    def from_release_contributor(cls, release_contributor: ReleaseContributor):
+        """
+        expects the contributor's user, member profile and social accounts to be loaded, see
+        ReleaseMetadataContext.release_contributors
+        """
+        contributor = release_contributor.contributor
+        member_profile = contributor.user.member_profile if contributor.user else None
+        return cls(
+            id=release_contributor.id,
+            contributor_id=contributor.id,
+            index=release_contributor.index,
+            roles=tuple(release_contributor.roles),
+            include_in_citation=release_contributor.include_in_citation,
+            type=contributor.type,
+            given_name=contributor.given_name,
+            family_name=contributor.family_name,
+            resolved_given_name=contributor.get_given_name(),
+            resolved_family_name=contributor.get_family_name(),
+            name=contributor.get_full_name(),
+            has_name=bool(contributor.has_name),
+            email=contributor.email,
+            affiliations=contributor.affiliations,
+            orcid_url=member_profile.orcid_url if member_profile else None,
+            profile_url=member_profile.get_absolute_url() if member_profile else None,
+        )
+
+    @property
+    def is_person(self):
+        return self.type == "person"
+
+    @property
+    def is_organization(self):
+        return not self.is_person
+
+    @property
+    def primary_affiliation(self):
+        return self.affiliations[0] if self.affiliations else {}
+
+    def get_full_name(self):
+        return self.name
+
+    def get_given_name(self):
+        return self.resolved_given_name
+
+    def get_family_name(self):
+        return self.resolved_family_name
+
+    def member_profile_url(self, include_base_url=False):
+        if self.profile_url and include_base_url:
+            return f"{settings.BASE_URL}{self.profile_url}"
+        return self.profile_url
+
+    def __repr__(self):
+        return f"<ReleaseContributorView {self.index}: {self.name}>"
+
+
 class ReviewerRecommendation(models.TextChoices):
     ACCEPT = (
         "accept",
@@ -2700,6 +3227,115 @@ class PeerReviewerFeedback(models.Model):
         return f"[peer review] {invitation.reviewer.member_profile} submitted? {self.reviewer_submitted}, recommendation: {self.get_recommendation_display()}"
 
 
+class ReleaseMetadataContext:
+    """
+    Conversion context shared by the CodeMeta, CITATION.cff, DataCite and LICENSE metadata of a single release.
+
+    Loads the objects that release metadata is derived from (parent codebase and its tags, license, programming
+    languages, platforms and contributors with their users and member profiles) once so that generating every
+    metadata format for a release takes a fixed number of queries. CITATION.cff is derived solely from the
+    codemeta snapshot and is cached by the snapshot's hash.
+    """
+
+    CFF_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+    def __init__(self, release: "CodebaseRelease"):
+        self.release = release
+        self.prefetched = False
+
+    def prefetch(self):
+        """
+        prefetch the related objects read by the metadata converters, only runs once per context
+        """
+        if not self.prefetched:
+            # tags managers without uncommitted changes read the prefetch cache of the manager itself
+            prefetch_related_objects(
+                [self.release],
+                "license",
+                "submitter__member_profile",
+                "codebase__tags",
+                "programming_languages",
+                "platform_tags",
+            )
+            self.prefetched = True
+        return self
+
+    @cached_property
+    def release_contributors(self):
+        return list(
+            ReleaseContributor.objects.for_release(self.release)
+            .select_related("contributor__user__member_profile")
+            .prefetch_related("contributor__user__socialaccount_set")
+        )
+
+    @cached_property
+    def contributors(self):
+        """ReleaseContributorViews of the release contributors ordered by index"""
+        return [
+            ReleaseContributorView.from_release_contributor(rc)
+            for rc in self.release_contributors
+        ]
+
+    @cached_property
+    def author_release_contributors(self):
+        """views of ReleaseContributor.objects.authors().for_release(release)"""
+        return [
+            c
+            for c in self.contributors
+            if c.include_in_citation or Role.AUTHOR in c.roles
+        ]
+
+    @cached_property
+    def nonauthor_release_contributors(self):
+        """views of ReleaseContributor.objects.nonauthors().for_release(release)"""
+        return [
+            c
+            for c in self.contributors
+            if not (c.include_in_citation or Role.AUTHOR in c.roles)
+        ]
+
+    @cached_property
+    def citable_release_contributors(self):
+        """views of ReleaseContributor.objects.citable().for_release(release)"""
+        return [c for c in self.contributors if c.include_in_citation]
+
+    @cached_property
+    def citation_authors(self):
+        authors = self.release.submitter.member_profile.name
+        citable_contributors = self.citable_release_contributors
+        if citable_contributors:
+            authors = ", ".join([c.name for c in citable_contributors if c.has_name])
+        else:
+            logger.warning(
+                "No authors found for release when building citation text, using default submitter name: %s",
+                authors,
+            )
+        return authors
+
+    @cached_property
+    def license_text(self) -> str:
+        license = self.release.license
+        return license.get_formatted_text(self.citation_authors) if license else ""
+
+    @property
+    def codemeta_snapshot_hash(self):
+        return hashlib.sha256(
+            json.dumps(self.release.codemeta_snapshot, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    @property
+    def cff_yaml_str(self):
+        # releases with empty or identical codemeta snapshots must not share an entry
+        cache_key = f"library.release_cff:{self.release.pk}:{self.release.version_number}:{self.codemeta_snapshot_hash}"
+        cff_yaml_str = cache.get(cache_key)
+        if cff_yaml_str is None:
+            cff_yaml_str = yaml.dump(
+                self.release.cff.dict(serialize=True), default_flow_style=False
+            )
+            cache.set(cache_key, cff_yaml_str, self.CFF_CACHE_TIMEOUT)
+        return cff_yaml_str
+
+
 class CommonMetadata:
     """
     This class serves as an object cache for metadata from a CodebaseRelease common to both CodeMeta and DataCite metadata.
@@ -2735,6 +3371,7 @@ class CommonMetadata:
         self.keywords = self.convert_keywords()
         self.runtime_platform = self.convert_platforms()
         self.download_url = release.get_download_url()
+        # read from the featured image rendition cache, metadata builds never render images
         self.get_featured_rendition_url = codebase.get_featured_rendition_url()
 
         self.citations = [
@@ -2807,15 +3444,13 @@ class CommonMetadata:
             },
         ]
 
-    @cached_property
+    @property
     def release_contributor_nonauthors(self):
-        return ReleaseContributor.objects.nonauthors().for_release(
-            self.codebase_release
-        )
+        return self.codebase_release.metadata_context.nonauthor_release_contributors
 
-    @cached_property
+    @property
     def release_contributor_authors(self):
-        return ReleaseContributor.objects.authors().for_release(self.codebase_release)
+        return self.codebase_release.metadata_context.author_release_contributors
 
 
 class DataCiteSchema(ABC):
@@ -2862,9 +3497,9 @@ class DataCiteSchema(ABC):
         return [{"subject": keyword} for keyword in unique_keywords]
 
     @classmethod
-    def convert_contributor(cls, contributor: Contributor):
+    def convert_contributor(cls, contributor: Contributor | ReleaseContributorView):
         """
-        Converts a ReleaseContributor to a DataCite creator dictionary
+        Converts a Contributor or ReleaseContributorView to a DataCite creator dictionary
         """
         creator = {}
         # check for ORCID name identifier first: https://datacite-metadata-schema.readthedocs.io/en/4.5/properties/creator/#nameidentifier
@@ -2918,7 +3553,7 @@ class DataCiteSchema(ABC):
     @classmethod
     def to_citable_authors(cls, contributors: Contributor):
         """
-        Maps a set of ReleaseContributors to a list of dictionaries representing DataCite creators
+        Maps a set of Contributors or ReleaseContributorViews to a list of dictionaries representing DataCite creators
 
         https://datacite-metadata-schema.readthedocs.io/en/4.5/properties/creator/
         """
@@ -2964,7 +3599,7 @@ class DataCiteSchema(ABC):
                             has_other_role_already = True
                     contributors.append(
                         {
-                            "name": release_contributor.contributor.name,
+                            "name": release_contributor.name,
                             "contributorType": contributor_type,
                         }
                     )
@@ -3015,7 +3650,7 @@ class ReleaseDataCiteSchema(DataCiteSchema):
         """
         metadata = {
             "creators": cls.to_citable_authors(
-                [rc.contributor for rc in common_metadata.release_contributor_authors]
+                common_metadata.release_contributor_authors
             ),
             "descriptions": common_metadata.descriptions,
             "publicationYear": str(cls.to_publication_year(common_metadata)),
@@ -3217,6 +3852,14 @@ class DataCiteRegistrationLog(models.Model):
     http_status = models.IntegerField(default=None, null=True)
     message = models.TextField(default=None, null=True)
     metadata_hash = models.CharField(max_length=255)
+    inputs_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        help_text=_(
+            "datacite_metadata_hash of the codebase or release when the metadata was sent"
+        ),
+    )
     doi = models.CharField(max_length=255, null=True, blank=True)
 
     objects = DataCiteRegistrationLogQuerySet.as_manager()
@@ -3235,3 +3878,10 @@ class DataCiteRegistrationLog(models.Model):
                    HTTP Status: {self.http_status}, Message: {self.message},
                    Hash: {self.metadata_hash}, DOI: {self.doi}
                    """
+
+    class Meta:
+        indexes = [
+            # latest successful registration per codebase / release
+            models.Index(fields=["codebase", "http_status", "-timestamp"]),
+            models.Index(fields=["release", "http_status", "-timestamp"]),
+        ]
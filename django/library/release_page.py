@@ -0,0 +1,157 @@
+"""
+Release detail page context
+
+load_release_page_context gathers everything library/codebases/releases/retrieve.jinja needs besides the release
+itself in a fixed number of batched queries, so rendering the page does not query per tag, contributor, image or
+related release. The context shown to anonymous visitors is cached per release and invalidated whenever the
+codebase, any of its releases, their contributors or featured images change, and when the user account or member
+profile of a submitter or contributor changes their displayed name.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from packaging.version import Version
+from wagtail.images.shortcuts import get_renditions_or_not_found
+
+from core.models import MemberProfile
+from core.view_helpers import add_user_retrieve_perms
+from .featured_images import FEATURED_IMAGE_SPECS, GALLERY_IMAGE_SPEC
+from .models import Codebase, Contributor, ReleaseContributor
+
+logger = logging.getLogger(__name__)
+
+
+def get_release_page_version_key(codebase_id):
+    return f"release_page:{codebase_id}:version"
+
+
+def invalidate_release_page_context(codebase_id):
+    """invalidate the cached release page context of every release of the given codebase"""
+    cache.set(get_release_page_version_key(codebase_id), time.time_ns(), None)
+
+
+def invalidate_release_page_context_on_commit(codebase_id):
+    transaction.on_commit(lambda: invalidate_release_page_context(codebase_id))
+
+
+def invalidate_user_release_page_contexts(user_id):
+    """
+    invalidate the cached release page context of the codebases the given user submitted or contributed to, their
+    names are shown through their user and member profile
+    """
+    codebase_ids = (
+        Codebase.objects.filter(
+            Q(submitter_id=user_id)
+            | Q(releases__submitter_id=user_id)
+            | Q(releases__codebase_contributors__contributor__user_id=user_id)
+        )
+        .values_list("id", flat=True)
+        .distinct()
+    )
+    for codebase_id in codebase_ids:
+        invalidate_release_page_context(codebase_id)
+
+
+def invalidate_user_release_page_contexts_on_commit(user_id):
+    transaction.on_commit(lambda: invalidate_user_release_page_contexts(user_id))
+
+
+def get_release_page_cache_key(release):
+    version = cache.get(get_release_page_version_key(release.codebase_id), 0)
+    return f"release_page:{release.codebase_id}:{version}:{release.id}"
+
+
+def get_image_urls(images, spec=GALLERY_IMAGE_SPEC):
+    """same as Codebase.get_image_urls for already loaded images"""
+    urls = []
+    for image in images:
+        try:
+            urls.append(image.get_rendition(spec).url)
+        except Exception:
+            logger.warning("Unable to find featured image %s", image)
+    return urls
+
+
+def load_release_page_context(release, has_change_perm=False):
+    """
+    :return: a dict with the codebase's featured image renditions, tags, contributors, submitter profile and
+    releases, and the release's programming languages and platforms
+    """
+    codebase = release.codebase
+    # with_codebase() prefetches tags and featured images, other querysets load them here
+    featured_images = sorted(codebase.featured_images.all(), key=lambda i: i.id)
+    featured_image = featured_images[0] if featured_images else None
+    published_contributor_ids = ReleaseContributor.objects.for_codebase(
+        codebase, ordered=False
+    ).values("contributor_id")
+    contributors = list(
+        Contributor.objects.filter(id__in=published_contributor_ids).select_related(
+            "user__member_profile"
+        )
+    )
+    citable_contributor_ids = set(
+        ReleaseContributor.objects.citable()
+        .for_codebase(codebase, ordered=False)
+        .values_list("contributor_id", flat=True)
+    )
+    if has_change_perm:
+        releases = codebase.releases.all()
+    else:
+        releases = codebase.public_releases()
+    related_releases = sorted(
+        releases.select_related("submitter__member_profile"),
+        key=lambda r: Version(r.version_number),
+        reverse=True,
+    )
+    for related_release in related_releases:
+        # release urls include the codebase identifier
+        related_release.codebase = codebase
+    latest_version = next(
+        (r for r in related_releases if r.id == codebase.latest_version_id), None
+    )
+    if latest_version is None and codebase.latest_version_id:
+        latest_version = codebase.latest_version
+    return {
+        "featured_image": featured_image,
+        "featured_image_renditions": (
+            get_renditions_or_not_found(featured_image, FEATURED_IMAGE_SPECS)
+            if featured_image
+            else {}
+        ),
+        "image_urls": get_image_urls(featured_images),
+        "tags": list(codebase.tags.all()),
+        "programming_languages": list(release.programming_languages.all()),
+        "platform_tags": list(release.platform_tags.all()),
+        "contributors": contributors,
+        "citable_contributors": [
+            c for c in contributors if c.id in citable_contributor_ids
+        ],
+        "submitter_profile": MemberProfile.objects.select_related("user")
+        .filter(user_id=codebase.submitter_id)
+        .first(),
+        "related_releases": related_releases,
+        "latest_version": latest_version,
+    }
+
+
+def get_release_page_context(release, user):
+    """
+    :return: the template context for the release detail page, the context of anonymous visitors without
+    permissions on the release is served from the cache
+    """
+    perms = add_user_retrieve_perms(release, {}, user)
+    has_change_perm = perms["has_change_perm"]
+    if user.is_authenticated or has_change_perm:
+        page_context = load_release_page_context(release, has_change_perm)
+    else:
+        cache_key = get_release_page_cache_key(release)
+        page_context = cache.get(cache_key)
+        if page_context is None:
+            page_context = load_release_page_context(release)
+            cache.set(cache_key, page_context, settings.RELEASE_PAGE_CACHE_TIMEOUT)
+    return {"release": release, **perms, **page_context}
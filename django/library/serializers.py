@@ -29,6 +29,7 @@ from core.serializers import (
     RelatedMemberProfileSerializer,
     RelatedUserSerializer,
 )
+from .downloads import add_affiliation, enqueue_download_event
 from .models import (
     PeerReviewer,
     ReleaseContributor,
@@ -492,39 +493,38 @@ class CodebaseImageSerializer(serializers.ModelSerializer):
 
 
 class DownloadRequestSerializer(serializers.ModelSerializer):
-    # customize save functionality to validate and record a new CodebaseReleaseDownload
+    # download requests are validated and queued with enqueue, see library.downloads
     save_to_profile = serializers.BooleanField()
 
-    def create(self, validated_data):
-        logger.debug("creating download request serializer from: %s", validated_data)
-        save_to_profile = validated_data.pop("save_to_profile")
-        industry = validated_data.get("industry")
+    def enqueue(self):
+        """
+        Queue the validated download request to be recorded in bulk, see library.downloads. Profile updates are
+        validated against the user's current affiliations now and applied when the download is recorded
+        """
+        validated_data = self.validated_data
+        user = validated_data.get("user")
         affiliation = validated_data.get("affiliation")
-        instance = CodebaseReleaseDownload(**validated_data)
-        instance.user = validated_data.get("user")
-        # update user's profile to reflect information provided
-        if instance.user and save_to_profile:
-            self.update_profile(instance, industry, affiliation)
-        instance.save()
-        return instance
-
-    def update_profile(self, instance, industry, affiliation):
-        member_profile = instance.user.member_profile
-        member_profile.industry = industry
-        if affiliation:
-            # check if affiliation with this name already exists in member_profile
-            if not any(
-                mem_aff["name"] == affiliation["name"]
-                for mem_aff in member_profile.affiliations
-            ):
-                member_profile.affiliations.append(affiliation)
-        # run validation on updated member_profile
-        try:
-            validate_affiliations(member_profile.affiliations)
-        except Exception as e:
-            raise ValidationError(e.messages)
-        else:
-            member_profile.save()
+        save_to_profile = bool(user and validated_data.get("save_to_profile"))
+        if save_to_profile:
+            # run validation on the affiliations the member profile will have
+            try:
+                validate_affiliations(
+                    add_affiliation(user.member_profile.affiliations, affiliation)
+                )
+            except Exception as e:
+                raise ValidationError(e.messages)
+        enqueue_download_event(
+            {
+                "release_id": validated_data["release"].id,
+                "user_id": user.id if user else None,
+                "ip_address": validated_data.get("ip_address"),
+                "referrer": validated_data.get("referrer", ""),
+                "reason": validated_data["reason"],
+                "industry": validated_data["industry"],
+                "affiliation": affiliation,
+                "save_to_profile": save_to_profile,
+            }
+        )
 
     class Meta:
         model = CodebaseReleaseDownload
@@ -662,6 +662,7 @@ class CodebaseReleaseEditSerializer(CodebaseReleaseSerializer):
         # Old contributors are not deleted from the database
         instance.contributors.clear()
         instance.codebase_contributors = release_contributors
+        instance.clear_metadata_cache()
 
     class Meta:
         model = CodebaseRelease
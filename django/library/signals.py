@@ -0,0 +1,52 @@
+import logging
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import MemberProfile
+from .featured_images import (
+    invalidate_featured_rendition_urls_on_commit,
+    schedule_featured_renditions,
+)
+from .models import Codebase, CodebaseImage
+from .release_page import invalidate_user_release_page_contexts_on_commit
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=CodebaseImage, dispatch_uid="codebase_image_save")
+def update_featured_image_on_save(sender, instance, **kwargs):
+    # release metadata is rebuilt by the rendition task once the renditions of the new image exist
+    logger.debug("featured image %s saved, generating renditions", instance)
+    invalidate_featured_rendition_urls_on_commit(instance.codebase_id)
+    schedule_featured_renditions(instance.codebase_id)
+
+
+@receiver(post_delete, sender=CodebaseImage, dispatch_uid="codebase_image_delete")
+def update_featured_image_on_delete(sender, instance, **kwargs):
+    # the featured image of a codebase appears in the metadata of its releases
+    logger.debug("featured image %s deleted, rebuilding release metadata", instance)
+    invalidate_featured_rendition_urls_on_commit(instance.codebase_id)
+    Codebase.schedule_release_metadata_rebuild(instance.codebase_id)
+
+
+@receiver(post_save, sender=MemberProfile, dispatch_uid="member_profile_release_page")
+def invalidate_release_pages_on_profile_save(
+    sender, instance, created=False, raw=False, **kwargs
+):
+    if raw or created:
+        return
+    invalidate_user_release_page_contexts_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid="user_release_page")
+def invalidate_release_pages_on_user_save(
+    sender, instance, created=False, raw=False, update_fields=None, **kwargs
+):
+    if raw or created:
+        return
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        # logins do not change displayed names
+        return
+    invalidate_user_release_page_contexts_on_commit(instance.pk)
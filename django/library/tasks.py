@@ -1,5 +1,9 @@
-from huey.contrib.djhuey import db_task
+from django.db import transaction
+from huey import crontab
+from huey.contrib.djhuey import db_periodic_task, db_task, lock_task
 
+from . import downloads, featured_images
+from .fs import ArchiveBuildStatus
 from .models import Codebase, CodebaseRelease
 
 import logging
@@ -9,7 +13,101 @@ logger = logging.getLogger(__name__)
 
 @db_task(retries=1, retry_delay=30)
 def update_fs_release_metadata(release_id: int):
-    release = CodebaseRelease.objects.get(id=release_id)
-    codebase = release.codebase
+    release = CodebaseRelease.objects.select_related("codebase").get(id=release_id)
     fs_api = release.get_fs_api()
     fs_api.rebuild(metadata_only=True)
+
+
+@db_task(retries=1, retry_delay=30)
+def rebuild_codebase_release_metadata(codebase_id: int):
+    """
+    Rebuilds the metadata of every release of a codebase after codebase fields included in release metadata
+    changed. Filesystem metadata is rebuilt inline so that the whole fan-out runs as this one task.
+    """
+    codebase = Codebase.objects.filter(id=codebase_id).first()
+    if codebase is None:
+        # deleted since the rebuild was scheduled
+        return
+    for release in codebase.releases.select_related("codebase"):
+        release.save(rebuild_metadata=True, defer_fs=False)
+
+
+@db_task(retries=1, retry_delay=30)
+def generate_featured_renditions(codebase_id: int):
+    featured_images.generate_featured_renditions(codebase_id)
+    # release metadata built before the renditions existed lacks the featured image
+    Codebase.schedule_release_metadata_rebuild(codebase_id)
+
+
+@db_task(retries=3, retry_delay=10)
+def build_release_archive(release_id: int, token: str, review_archive=False):
+    release = CodebaseRelease.objects.get(id=release_id)
+    fs_api = release.get_fs_api()
+    kind = "review" if review_archive else "published"
+    # only one build of a given archive may run at a time, a locked out build is retried after retry_delay
+    with lock_task(f"build-release-archive-{release_id}-{kind}"):
+        if not fs_api.set_archive_build_status(
+            ArchiveBuildStatus.building, token, review_archive=review_archive
+        ):
+            logger.info(
+                "skipping superseded %s archive build for release %s", kind, release_id
+            )
+            return
+        try:
+            if review_archive:
+                fs_api.build_review_archive()
+            else:
+                fs_api.build_published_archive(force=True)
+        except Exception:
+            fs_api.set_archive_build_status(
+                ArchiveBuildStatus.failed, token, review_archive=review_archive
+            )
+            raise
+        fs_api.set_archive_build_status(
+            ArchiveBuildStatus.complete, token, review_archive=review_archive
+        )
+
+
+def enqueue_archive_build(release: CodebaseRelease, review_archive=False):
+    """
+    Schedules an asynchronous build of a release's published or review archive unless one is already
+    pending or running and returns the current ArchiveBuildStatus of that archive. If the previous build
+    failed a new build is scheduled and ArchiveBuildStatus.failed is returned so callers can report the failure
+    """
+    fs_api = release.get_fs_api()
+    previous_status = fs_api.get_archive_build_status(review_archive=review_archive)
+    if previous_status == ArchiveBuildStatus.complete:
+        # callers only ask for a build when the existing archive is missing or stale
+        fs_api.invalidate_archive_build(review_archive=review_archive)
+    token = fs_api.request_archive_build(review_archive=review_archive)
+    if token is None:
+        return fs_api.get_archive_build_status(review_archive=review_archive)
+    # wait for any enclosing transaction to commit so the task sees the same release state we do
+    transaction.on_commit(
+        lambda: build_release_archive(release.id, token, review_archive=review_archive)
+    )
+    if previous_status == ArchiveBuildStatus.failed:
+        return ArchiveBuildStatus.failed
+    return ArchiveBuildStatus.pending
+
+
+@db_task(retries=3, retry_delay=30)
+def process_download_events():
+    # a run that is locked out is retried after retry_delay and finds whatever the running task left behind
+    with lock_task(downloads.PROCESS_DOWNLOAD_EVENTS_LOCK):
+        recorded = downloads.process_download_events()
+        logger.debug("recorded %s downloads", recorded)
+
+
+@db_periodic_task(crontab(minute="*/15"))
+def process_stale_download_events():
+    # picks up events whose scheduled run was lost, e.g., if the consumer restarted
+    if downloads.get_pending_download_event_count():
+        process_download_events()
+
+
+@db_periodic_task(crontab(minute="*/5"))
+def flush_download_counts():
+    with lock_task(downloads.FLUSH_DOWNLOAD_COUNTS_LOCK):
+        count = downloads.flush_download_counts()
+        logger.debug("applied %s buffered downloads to download totals", count)
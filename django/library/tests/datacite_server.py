@@ -0,0 +1,130 @@
+import json
+import re
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class DataCiteStubHandler(BaseHTTPRequestHandler):
+    DOI_PATH = re.compile(r"^/dois/(?P<doi>.+)$")
+
+    @property
+    def stub(self) -> "DataCiteStubServer":
+        return self.server.stub
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/vnd.api+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def handle_request(self, method):
+        failure = self.stub.record_request(method, self.path)
+        if failure:
+            self.send_json(failure, {"errors": [{"status": str(failure)}]})
+            return
+        if self.path == "/heartbeat":
+            body = b"OK"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if method == "POST" and self.path == "/dois":
+            data = self.read_json()["data"]
+            doi = self.stub.mint_doi()
+            attributes = {**data.get("attributes", {}), "doi": doi}
+            self.stub.dois[doi] = attributes
+            self.send_json(201, {"data": {"id": doi, "attributes": attributes}})
+            return
+        match = self.DOI_PATH.match(self.path)
+        if match is None:
+            self.send_json(404, {"errors": [{"status": "404"}]})
+            return
+        doi = match.group("doi")
+        if method == "PUT":
+            attributes = self.read_json()["data"].get("attributes", {})
+            self.stub.dois.setdefault(doi, {}).update(attributes)
+        elif doi not in self.stub.dois:
+            self.send_json(404, {"errors": [{"status": "404"}]})
+            return
+        self.send_json(200, {"data": {"id": doi, "attributes": self.stub.dois[doi]}})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+
+class DataCiteStubServer:
+    """
+    Minimal in-process stand-in for the DataCite REST API (heartbeat, mint, get and update DOI) that lets tests
+    exercise DataCiteApi over real HTTP without touching the DataCite sandbox. Point DATACITE_API_URL at `url`.
+
+    Queue status codes with fail_next() to make the next requests fail, e.g., to exercise retries.
+    """
+
+    def __init__(self, prefix="10.82853"):
+        self.prefix = prefix
+        self.dois = {}
+        self.requests = []
+        self.failures = deque()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), DataCiteStubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, *status_codes):
+        with self.lock:
+            self.failures.extend(status_codes)
+
+    def record_request(self, method, path):
+        """records the request and returns the status code of a queued failure, if any"""
+        with self.lock:
+            self.requests.append((method, path))
+            if path != "/heartbeat" and self.failures:
+                return self.failures.popleft()
+        return None
+
+    def mint_doi(self):
+        with self.lock:
+            return f"{self.prefix}/stub-{len(self.dois) + 1}"
+
+    def requests_for(self, method):
+        return [
+            path for request_method, path in self.requests if request_method == method
+        ]
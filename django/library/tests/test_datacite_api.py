@@ -1,10 +1,12 @@
 import logging
 
+from django.test import override_settings
 
 from core.tests.base import BaseModelTestCase
-from .base import ReleaseSetup
+from .base import ContributorFactory, ReleaseContributorFactory, ReleaseSetup
+from .datacite_server import DataCiteStubServer
 from ..doi import DataCiteApi
-from ..models import Codebase
+from ..models import Codebase, CodebaseRelease, DataCiteRegistrationLog
 
 logger = logging.getLogger(__name__)
 
@@ -178,3 +180,154 @@ class DataCiteApiTest(BaseModelTestCase):
         self.assertFalse(
             DataCiteApi.is_metadata_equivalent(comses_metadata, dc_metadata)
         )
+
+
+class DataCiteSyncTest(BaseModelTestCase):
+    """
+    Exercises the batched DataCite sync against a local stub of the DataCite REST API
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.server = DataCiteStubServer().start()
+        self.addCleanup(self.server.stop)
+        self.use_settings(
+            DATACITE_API_URL=self.server.url,
+            DATACITE_API_RATE_LIMIT=0,
+            DATACITE_API_RETRY_BACKOFF=0,
+        )
+        self.codebase = Codebase.objects.create(
+            title="Test codebase for DataCite sync",
+            description="Test codebase description",
+            identifier="test.cb.102",
+            submitter=self.user,
+        )
+        self.release = ReleaseSetup.setUpPublishableDraftRelease(self.codebase)
+        self.release.publish()
+        Codebase.objects.filter(pk=self.codebase.pk).update(doi="10.82853/stub-cb")
+        CodebaseRelease.objects.filter(pk=self.release.pk).update(
+            doi="10.82853/stub-release", peer_reviewed=True
+        )
+        self.codebase.refresh_from_db()
+        self.release.refresh_from_db()
+        self.api = DataCiteApi(dry_run=False)
+
+    def use_settings(self, **kwargs):
+        settings_override = override_settings(**kwargs)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def sync(self):
+        return list(self.api.sync_doi_metadata([self.codebase, self.release]))
+
+    def test_sync_updates_stale_metadata_once(self):
+        results = self.sync()
+        self.assertTrue(all(ok for _, _, ok in results))
+        self.assertCountEqual(
+            self.server.requests_for("PUT"),
+            ["/dois/10.82853/stub-cb", "/dois/10.82853/stub-release"],
+        )
+        self.assertEqual(
+            DataCiteRegistrationLog.objects.filter(http_status=200).count(), 2
+        )
+        self.assertFalse(DataCiteApi.is_metadata_stale(self.codebase))
+        self.assertFalse(DataCiteApi.is_metadata_stale(self.release))
+        # nothing changed so a second sync should not contact DataCite
+        results = self.sync()
+        self.assertTrue(all(ok for _, _, ok in results))
+        self.assertEqual(len(self.server.requests_for("PUT")), 2)
+        self.assertEqual(DataCiteRegistrationLog.objects.count(), 2)
+
+    def test_stale_metadata_scan(self):
+        self.assertEqual(
+            list(Codebase.objects.with_stale_datacite_metadata()), [self.codebase]
+        )
+        self.assertEqual(
+            list(CodebaseRelease.objects.with_stale_datacite_metadata()),
+            [self.release],
+        )
+        self.sync()
+        self.codebase.refresh_from_db()
+        self.assertEqual(
+            self.codebase.datacite_metadata_hash,
+            DataCiteRegistrationLog.objects.latest_entry(self.codebase).inputs_hash,
+        )
+        self.assertFalse(Codebase.objects.with_stale_datacite_metadata().exists())
+        self.assertFalse(
+            CodebaseRelease.objects.with_stale_datacite_metadata().exists()
+        )
+        self.codebase.title = "Updated title"
+        self.codebase.save(rebuild_release_metadata=False)
+        self.assertEqual(
+            list(Codebase.objects.with_stale_datacite_metadata()), [self.codebase]
+        )
+
+    def test_release_contributor_changes_mark_codebase_stale(self):
+        self.sync()
+        self.assertFalse(Codebase.objects.with_stale_datacite_metadata().exists())
+        contributor = ContributorFactory(self.user).create_unique_contributors(1)[0]
+        ReleaseContributorFactory(self.release).create(contributor, index=1)
+        self.release.save()
+        self.assertEqual(
+            list(Codebase.objects.with_stale_datacite_metadata()), [self.codebase]
+        )
+        self.assertEqual(
+            list(CodebaseRelease.objects.with_stale_datacite_metadata()),
+            [self.release],
+        )
+
+    def test_sync_retries_transient_errors(self):
+        self.server.fail_next(503, 429)
+        results = self.sync()
+        self.assertTrue(all(ok for _, _, ok in results))
+        self.assertEqual(len(self.server.requests_for("PUT")), 4)
+        self.assertEqual(
+            DataCiteRegistrationLog.objects.filter(http_status=200).count(), 2
+        )
+
+    def test_sync_logs_failures_after_retries(self):
+        self.use_settings(DATACITE_API_MAX_RETRIES=1)
+        self.api = DataCiteApi(dry_run=False)
+        self.server.fail_next(500, 500, 500, 500)
+        results = self.sync()
+        self.assertFalse(any(ok for _, _, ok in results))
+        self.assertEqual(len(self.server.requests_for("PUT")), 4)
+        self.assertEqual(
+            DataCiteRegistrationLog.objects.filter(http_status=500).count(), 2
+        )
+        self.assertTrue(DataCiteApi.is_metadata_stale(self.codebase))
+
+    def test_sync_does_not_retry_permanent_errors(self):
+        self.server.fail_next(422)
+        results = self.sync()
+        self.assertEqual([ok for _, _, ok in results].count(False), 1)
+        self.assertEqual(len(self.server.requests_for("PUT")), 2)
+        self.assertEqual(
+            DataCiteRegistrationLog.objects.filter(http_status=422).count(), 1
+        )
+
+    def test_update_and_sync_share_staleness_check(self):
+        self.sync()
+        self.codebase.title = "Updated title"
+        self.codebase.save(rebuild_release_metadata=False)
+        self.assertTrue(DataCiteApi.is_metadata_stale(self.codebase))
+        log, ok = self.api.update_doi_metadata(self.codebase)
+        self.assertTrue(ok)
+        self.assertFalse(DataCiteApi.is_metadata_stale(self.codebase))
+        self.assertEqual(len(self.server.requests_for("PUT")), 3)
+        # the batch sync agrees the codebase is current after the interactive update
+        self.sync()
+        self.assertEqual(len(self.server.requests_for("PUT")), 3)
+
+    def test_mint_public_doi(self):
+        codebase = Codebase.objects.create(
+            title="Test codebase without a DOI",
+            description="Test codebase description",
+            identifier="test.cb.103",
+            submitter=self.user,
+        )
+        log, ok = self.api.mint_public_doi(codebase)
+        self.assertTrue(ok)
+        codebase.refresh_from_db()
+        self.assertTrue(codebase.doi.startswith("10.82853/stub-"))
+        self.assertEqual(log.doi, codebase.doi)
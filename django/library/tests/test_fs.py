@@ -1,18 +1,32 @@
+import errno
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
 from pathlib import Path
+from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
+from core import fs
 from core.tests.base import (
     UserFactory,
     destroy_test_shared_folders,
     initialize_test_shared_folders,
 )
 from library.fs import (
+    ArchiveBuildStatus,
+    ArchiveExtractor,
+    CodebaseReleaseFsApi,
     FileCategoryDirectories,
     StagingDirectories,
     MessageLevels,
+    ReleaseArchiveBuilder,
+    hash_path,
     import_archive,
 )
+from library.tasks import build_release_archive, enqueue_archive_build
 from library.tests.base import CodebaseFactory
 
 
@@ -80,11 +94,456 @@ class ArchiveExtractorTestCase(TestCase):
         self.assertEqual(level, MessageLevels.error)
         self.assertEqual(len(logs), 1)
 
+    @override_settings(ARCHIVE_EXTRACT_MAX_ENTRIES=1)
+    def test_archive_limits(self):
+        fs_api = self.codebase_release.get_fs_api()
+        msgs = import_archive(
+            codebase_release=self.codebase_release,
+            nested_code_folder_name=str(self.nested_code_folder),
+            fs_api=fs_api,
+        )
+        logs, level = msgs.serialize()
+        self.assertEqual(level, MessageLevels.error)
+        self.assertEqual(
+            set(fs_api.list(StagingDirectories.sip, FileCategoryDirectories.code)),
+            set(),
+        )
+
+    def extract(self, filename, **limits):
+        sip_storage = self.codebase_release.get_fs_api().get_sip_storage()
+        extractor = ArchiveExtractor(sip_storage, **limits)
+        msgs = extractor.process(FileCategoryDirectories.code, str(filename))
+        extracted = set(sip_storage.list(FileCategoryDirectories.code))
+        return msgs, {str(path) for path in extracted}
+
+    def make_zip(self, directory, members):
+        filename = Path(directory, "archive.zip")
+        with zipfile.ZipFile(filename, "w") as z:
+            for name, content in members.items():
+                z.writestr(zipfile.ZipInfo(name), content)
+        return filename
+
+    def test_streamed_size_limit_stops_extraction(self):
+        members = {f"model/src/file{i}.py": "x" * 1000 for i in range(8)}
+        for max_workers in (1, 4):
+            with tempfile.TemporaryDirectory() as d, mock.patch.object(
+                ArchiveExtractor, "check_entries"
+            ):
+                # the archive index understates the sizes that are streamed
+                msgs, extracted = self.extract(
+                    self.make_zip(d, members), max_size=2500, max_workers=max_workers
+                )
+            self.assertEqual(msgs.level, MessageLevels.error)
+            self.assertIn("maximum uncompressed size", msgs.msg["detail"])
+            # partially written files are removed
+            self.assertEqual(extracted, set())
+
+    def test_threaded_zip_extraction(self):
+        members = {f"model/src/file{i}.py": f"print({i})" for i in range(8)}
+        with tempfile.TemporaryDirectory() as d:
+            msgs, extracted = self.extract(self.make_zip(d, members), max_workers=4)
+        self.assertFalse(msgs.has_errors)
+        # the chain of single directories wrapping every member is stripped
+        self.assertEqual(extracted, {f"file{i}.py" for i in range(8)})
+
+    def test_unsafe_member_paths_are_ignored(self):
+        members = {
+            "../escaped.py": "print(1)",
+            "/absolute.py": "print(2)",
+            "src/nested/../../escaped.py": "print(3)",
+            "src/model.py": "print(4)",
+        }
+        with tempfile.TemporaryDirectory() as d:
+            msgs, extracted = self.extract(self.make_zip(d, members))
+            self.assertFalse(Path(d).parent.joinpath("escaped.py").exists())
+        self.assertEqual(extracted, {"src/model.py"})
+        logs, level = msgs.serialize()
+        self.assertEqual(
+            sum("invalid path" in log["msg"]["detail"] for log in logs),
+            3,
+        )
+
+    def test_tar_extraction(self):
+        with tempfile.TemporaryDirectory() as d:
+            filename = Path(d, "archive.tar")
+            with tarfile.open(filename, "w") as t:
+                for name, content in (
+                    ("model/README.md", b"readme"),
+                    ("model/src/ex.py", b"print(1)"),
+                ):
+                    info = tarfile.TarInfo(name)
+                    info.size = len(content)
+                    t.addfile(info, io.BytesIO(content))
+                # links are never extracted
+                link = tarfile.TarInfo("model/passwd")
+                link.type = tarfile.SYMTYPE
+                link.linkname = "/etc/passwd"
+                t.addfile(link)
+            msgs, extracted = self.extract(filename)
+        self.assertFalse(msgs.has_errors)
+        self.assertEqual(extracted, {"README.md", "src/ex.py"})
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.nested_code_folder.with_suffix(".zip").unlink(missing_ok=True)
+
+
+class FileIndexTestCase(TestCase):
+    nested_code_folder = Path("library/tests/archives/nestedcode")
+
+    def setUp(self):
+        self.submitter = UserFactory().create()
+        self.codebase = CodebaseFactory(submitter=self.submitter).create()
+        self.codebase_release = self.codebase.create_release()
+        self.fs_api = self.codebase_release.get_fs_api()
+
+    def test_file_index_tracks_added_and_deleted_files(self):
+        import_archive(
+            codebase_release=self.codebase_release,
+            nested_code_folder_name=str(self.nested_code_folder),
+            fs_api=self.fs_api,
+        )
+        sip_files = self.fs_api.get_file_index(
+            StagingDirectories.sip, FileCategoryDirectories.code
+        )
+        self.assertEqual(
+            {f.relpath for f in sip_files},
+            set(self.fs_api.list(StagingDirectories.sip, FileCategoryDirectories.code)),
+        )
+        readme = sip_files.get(path="code/README.md")
+        self.assertEqual(readme.mimetype, "text/markdown")
+        self.assertEqual(
+            readme.size,
+            self.fs_api.sip_contents_dir.joinpath(readme.path).stat().st_size,
+        )
+        tree = self.fs_api.get_file_index_tree()
+        code_node = next(n for n in tree["contents"] if n["label"] == "code")
+        self.assertIn({"label": "README.md"}, code_node["contents"])
+
+        self.fs_api.clear_category(FileCategoryDirectories.code)
+        self.assertFalse(
+            self.fs_api.get_file_index(
+                StagingDirectories.originals, FileCategoryDirectories.code
+            ).exists()
+        )
+
+    def test_file_index_lists_empty_directories(self):
+        self.fs_api.sip_contents_dir.joinpath("docs", "empty").mkdir(parents=True)
+        self.fs_api.update_file_index()
+        self.assertFalse(
+            self.fs_api.get_file_index(StagingDirectories.sip)
+            .filter(path="docs/empty")
+            .exists()
+        )
+        tree = self.fs_api.get_file_index_tree()
+        docs_node = next(n for n in tree["contents"] if n["label"] == "docs")
+        self.assertEqual(docs_node["contents"], [{"label": "empty", "contents": []}])
+
+    def test_file_index_update_limited_to_changed_paths(self):
+        import_archive(
+            codebase_release=self.codebase_release,
+            nested_code_folder_name=str(self.nested_code_folder),
+            fs_api=self.fs_api,
+        )
+        code_dir = self.fs_api.sip_contents_dir.joinpath("code")
+        code_dir.joinpath("README.md").write_text("modified readme")
+        code_dir.joinpath("added.txt").write_text("added")
+        with mock.patch("library.fs.hash_path", wraps=hash_path) as hashed:
+            self.fs_api.update_file_index(["code/added.txt"])
+        hashed.assert_called_once_with(code_dir.joinpath("added.txt"))
+        sip_files = self.fs_api.get_file_index(StagingDirectories.sip)
+        self.assertTrue(sip_files.filter(path="code/added.txt").exists())
+        self.assertNotEqual(
+            sip_files.get(path="code/README.md").size,
+            code_dir.joinpath("README.md").stat().st_size,
+        )
+
+    def test_deleting_archive_file_updates_file_index_once(self):
+        import_archive(
+            codebase_release=self.codebase_release,
+            nested_code_folder_name=str(self.nested_code_folder),
+            fs_api=self.fs_api,
+        )
+        archive_name = self.fs_api.list(
+            StagingDirectories.originals, FileCategoryDirectories.code
+        )[0]
+        with mock.patch.object(
+            self.fs_api, "files_changed", wraps=self.fs_api.files_changed
+        ) as files_changed:
+            self.fs_api.delete(FileCategoryDirectories.code, archive_name)
+        files_changed.assert_called_once_with([Path("code")])
+        self.assertFalse(
+            self.fs_api.get_file_index(
+                StagingDirectories.sip, FileCategoryDirectories.code
+            ).exists()
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.nested_code_folder.with_suffix(".zip").unlink(missing_ok=True)
+
+
+class CloneFileTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        self.src = self.path.joinpath("src.txt")
+        self.src.write_text("source")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_existing_hardlink_is_replaced_not_written_through(self):
+        shared = self.path.joinpath("shared.txt")
+        shared.write_text("another release's original")
+        dst = self.path.joinpath("clone", "dst.txt")
+        dst.parent.mkdir()
+        os.link(shared, dst)
+        with mock.patch("core.fs.os.link", side_effect=OSError(errno.EXDEV, "")):
+            self.assertIn(fs.clone_file(self.src, dst), ("reflink", "copy"))
+        self.assertEqual(dst.read_text(), "source")
+        self.assertEqual(shared.read_text(), "another release's original")
+
+    def test_only_unsupported_link_errors_fall_back_to_copying(self):
+        dst = self.path.joinpath("dst.txt")
+        with mock.patch("core.fs.reflink", side_effect=OSError(errno.ENOTSUP, "")):
+            with mock.patch("core.fs.os.link", side_effect=OSError(errno.EIO, "")):
+                with self.assertRaises(OSError):
+                    fs.clone_file(self.src, dst)
+            self.assertFalse(dst.exists())
+            with mock.patch("core.fs.os.link", side_effect=OSError(errno.EXDEV, "")):
+                self.assertEqual(fs.clone_file(self.src, dst), "copy")
+        self.assertEqual(dst.read_text(), "source")
+
+
+class CopyOriginalsTestCase(TestCase):
+    nested_code_folder = Path("library/tests/archives/nestedcode")
+
+    def setUp(self):
+        self.submitter = UserFactory().create()
+        self.codebase = CodebaseFactory(submitter=self.submitter).create()
+        self.source_release = self.codebase.create_release()
+        import_archive(
+            codebase_release=self.source_release,
+            nested_code_folder_name=str(self.nested_code_folder),
+        )
+
+    def test_copy_originals(self):
+        source_fs_api = self.source_release.get_fs_api()
+        release = self.codebase.create_release()
+        fs_api = release.get_fs_api()
+        msgs = fs_api.copy_originals(self.source_release)
+        self.assertFalse(msgs.has_errors)
+        for stage in (StagingDirectories.originals, StagingDirectories.sip):
+            self.assertEqual(
+                set(fs_api.list(stage, FileCategoryDirectories.code)),
+                set(source_fs_api.list(stage, FileCategoryDirectories.code)),
+            )
+        # copying again is a no-op since the files are identical
+        msgs = fs_api.copy_originals(self.source_release)
+        self.assertFalse(msgs)
+        fs_api.clear_category(FileCategoryDirectories.code)
+        self.assertEqual(
+            set(
+                source_fs_api.list(StagingDirectories.sip, FileCategoryDirectories.code)
+            ),
+            {"src/ex.py", "README.md"},
+        )
+
+    def test_copy_originals_does_not_clone_into_extracted_files(self):
+        release = self.codebase.create_release()
+        fs_api = release.get_fs_api()
+        sip_dir = fs_api.sip_contents_dir.joinpath(FileCategoryDirectories.code.name)
+        sip_dir.mkdir(parents=True, exist_ok=True)
+        sip_dir.joinpath("README.md").write_text("extracted")
+        with mock.patch("library.fs.fs.clone_directory") as clone_directory:
+            msgs = fs_api.copy_originals(self.source_release)
+        self.assertFalse(msgs.has_errors)
+        clone_directory.assert_not_called()
+        self.assertEqual(
+            set(
+                fs_api.list(StagingDirectories.originals, FileCategoryDirectories.code)
+            ),
+            {"nestedcode.zip"},
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.nested_code_folder.with_suffix(".zip").unlink(missing_ok=True)
+
+
+class ReleaseArchiveBuilderTestCase(TestCase):
+    nested_code_folder = Path("library/tests/archives/nestedcode")
+
+    def setUp(self):
+        self.submitter = UserFactory().create()
+        self.codebase = CodebaseFactory(submitter=self.submitter).create()
+        self.codebase_release = self.codebase.create_release()
+        self.fs_api = self.codebase_release.get_fs_api()
+        import_archive(
+            codebase_release=self.codebase_release,
+            nested_code_folder_name=str(self.nested_code_folder),
+            fs_api=self.fs_api,
+        )
+        self.dest = self.fs_api.rootdir.joinpath("test_archive.zip")
+
+    def build(self):
+        builder = ReleaseArchiveBuilder(self.fs_api.sip_contents_dir, self.dest)
+        return builder, builder.build()
+
+    def test_unchanged_archive_is_not_rebuilt(self):
+        builder, built = self.build()
+        self.assertTrue(built)
+        self.assertEqual(builder.reused, 0)
+        self.assertGreaterEqual(builder.written, 2)
+        builder, built = self.build()
+        self.assertFalse(built)
+        self.assertEqual(builder.written, 0)
+
+    def test_modified_files_are_rewritten(self):
+        self.build()
+        readme = self.fs_api.sip_contents_dir.joinpath("code", "README.md")
+        readme.write_text("updated readme")
+        builder, built = self.build()
+        self.assertTrue(built)
+        self.assertGreaterEqual(builder.reused, 1)
+        self.assertEqual(builder.written, 1)
+        with zipfile.ZipFile(self.dest) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertTrue(
+                {"code/README.md", "code/src/ex.py"}.issubset(archive.namelist())
+            )
+            self.assertEqual(archive.read("code/README.md"), b"updated readme")
+
+    def test_unchanged_files_are_copied_without_raw_copy_support(self):
+        self.build()
+        readme = self.fs_api.sip_contents_dir.joinpath("code", "README.md")
+        readme.write_text("updated readme")
+        with mock.patch(
+            "library.fs._ZIP_RAW_COPY_MAX_VERSION", (3, 0)
+        ), mock.patch.object(ReleaseArchiveBuilder, "copy_raw_entry") as copy_raw_entry:
+            builder, built = self.build()
+        self.assertTrue(built)
+        self.assertFalse(copy_raw_entry.called)
+        self.assertGreaterEqual(builder.reused, 1)
+        with zipfile.ZipFile(self.dest) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read("code/README.md"), b"updated readme")
+
     @classmethod
     def tearDownClass(cls):
         super().tearDownClass()
         cls.nested_code_folder.with_suffix(".zip").unlink(missing_ok=True)
 
 
+class ReviewArchiveDigestTestCase(TestCase):
+    nested_code_folder = Path("library/tests/archives/nestedcode")
+
+    def setUp(self):
+        self.submitter = UserFactory().create()
+        self.codebase = CodebaseFactory(submitter=self.submitter).create()
+        self.codebase_release = self.codebase.create_release()
+        self.fs_api = self.codebase_release.get_fs_api()
+        import_archive(
+            codebase_release=self.codebase_release,
+            nested_code_folder_name=str(self.nested_code_folder),
+            fs_api=self.fs_api,
+        )
+
+    def test_review_archive_is_reused_until_files_change(self):
+        self.assertFalse(self.fs_api.has_current_review_archive())
+        review_archivepath = self.fs_api.build_review_archive()
+        self.assertTrue(self.fs_api.has_current_review_archive())
+        mtime_ns = review_archivepath.stat().st_mtime_ns
+        self.fs_api.build_review_archive()
+        self.assertEqual(review_archivepath.stat().st_mtime_ns, mtime_ns)
+
+        readme = self.fs_api.sip_contents_dir.joinpath("code", "README.md")
+        readme.write_text("updated readme")
+        self.assertFalse(self.fs_api.has_current_review_archive())
+        self.fs_api.build_review_archive()
+        self.assertTrue(self.fs_api.has_current_review_archive())
+        with zipfile.ZipFile(review_archivepath) as archive:
+            self.assertEqual(archive.read("code/README.md"), b"updated readme")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.nested_code_folder.with_suffix(".zip").unlink(missing_ok=True)
+
+
+class ArchiveBuildStatusTestCase(TestCase):
+    def setUp(self):
+        self.submitter = UserFactory().create()
+        self.codebase = CodebaseFactory(submitter=self.submitter).create()
+        self.codebase_release = self.codebase.create_release()
+        self.fs_api = self.codebase_release.get_fs_api()
+        self.fs_api.invalidate_archive_build()
+
+    def test_duplicate_build_requests_are_ignored(self):
+        token = self.fs_api.request_archive_build()
+        self.assertIsNotNone(token)
+        self.assertIsNone(self.fs_api.request_archive_build())
+        self.assertEqual(
+            self.fs_api.get_archive_build_status(), ArchiveBuildStatus.pending
+        )
+        self.fs_api.set_archive_build_status(ArchiveBuildStatus.failed, token)
+        self.assertIsNotNone(self.fs_api.request_archive_build())
+
+    def test_invalidated_builds_are_superseded(self):
+        token = self.fs_api.request_archive_build()
+        self.fs_api.invalidate_archive_build()
+        self.assertFalse(
+            self.fs_api.set_archive_build_status(ArchiveBuildStatus.complete, token)
+        )
+        self.assertIsNone(self.fs_api.get_archive_build_status())
+
+    def test_build_task_completes_build(self):
+        token = self.fs_api.request_archive_build()
+        with mock.patch.object(
+            CodebaseReleaseFsApi, "build_published_archive"
+        ) as build_published_archive:
+            build_release_archive.call_local(self.codebase_release.id, token)
+        build_published_archive.assert_called_once_with(force=True)
+        self.assertEqual(
+            self.fs_api.get_archive_build_status(), ArchiveBuildStatus.complete
+        )
+
+    def test_build_task_skips_superseded_build(self):
+        token = self.fs_api.request_archive_build()
+        self.fs_api.invalidate_archive_build()
+        with mock.patch.object(
+            CodebaseReleaseFsApi, "build_published_archive"
+        ) as build_published_archive:
+            build_release_archive.call_local(self.codebase_release.id, token)
+        self.assertFalse(build_published_archive.called)
+
+    def test_failed_build_is_reported_and_retried(self):
+        token = self.fs_api.request_archive_build()
+        with mock.patch.object(
+            CodebaseReleaseFsApi, "build_published_archive", side_effect=OSError
+        ):
+            with self.assertRaises(OSError):
+                build_release_archive.call_local(self.codebase_release.id, token)
+        self.assertEqual(
+            self.fs_api.get_archive_build_status(), ArchiveBuildStatus.failed
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(
+                enqueue_archive_build(self.codebase_release),
+                ArchiveBuildStatus.failed,
+            )
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            self.fs_api.get_archive_build_status(), ArchiveBuildStatus.pending
+        )
+
+    def tearDown(self):
+        self.fs_api.invalidate_archive_build()
+
+
 def tearDownModule():
     destroy_test_shared_folders()
@@ -1,11 +1,20 @@
 import logging
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from core.tests.base import BaseModelTestCase, UserFactory
 from .base import (
     CodebaseFactory,
+    ContributorFactory,
+    ReleaseContributorFactory,
     ReleaseSetup,
 )
 from library.metadata import CodeMeta
+from library.featured_images import get_featured_rendition_urls
+from library.models import Codebase, CodebaseRelease
+from library.tasks import rebuild_codebase_release_metadata
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +37,57 @@ class CodebaseMetadataTestCase(BaseModelTestCase):
         self.codebase.save()
         self.assertNotEqual(old_codemeta_snapshot, self.codebase.codemeta_snapshot)
 
+    def test_release_metadata_rebuilt_only_for_release_fields(self):
+        codebase = Codebase.objects.get(pk=self.codebase.pk)
+        # saves also schedule search indexing and cache invalidation, only count metadata rebuilds
+        with mock.patch(
+            "library.tasks.rebuild_codebase_release_metadata"
+        ) as rebuild, mock.patch(
+            "core.search_indexing.enqueue_objects"
+        ), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            codebase.featured = True
+            codebase.save()
+        rebuild.assert_not_called()
+
+        with mock.patch(
+            "library.tasks.rebuild_codebase_release_metadata"
+        ) as rebuild, mock.patch(
+            "core.search_indexing.enqueue_objects"
+        ), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            codebase.title = "Updated codebase title"
+            codebase.save()
+            # further saves without changes do not schedule another rebuild
+            codebase.save()
+        rebuild.assert_called_once_with(codebase.pk)
+
+        rebuild_codebase_release_metadata.call_local(codebase.pk)
+        self.release1.refresh_from_db()
+        self.assertEqual(
+            self.release1.codemeta_snapshot["name"], "Updated codebase title"
+        )
+
+    def test_release_metadata_rebuilt_when_review_status_changes(self):
+        codebase = Codebase.objects.get(pk=self.codebase.pk)
+        with mock.patch(
+            "library.tasks.rebuild_codebase_release_metadata"
+        ) as rebuild, self.captureOnCommitCallbacks(execute=True):
+            codebase.peer_reviewed = True
+            codebase.save()
+        rebuild.assert_called_once_with(codebase.pk)
+
+    def test_release_cff_is_cached_per_release(self):
+        release2 = self.codebase.create_release()
+        CodebaseRelease.objects.filter(pk__in=[self.release1.pk, release2.pk]).update(
+            codemeta_snapshot={}
+        )
+        cff1 = CodebaseRelease.objects.get(pk=self.release1.pk).cff_yaml_str
+        cff2 = CodebaseRelease.objects.get(pk=release2.pk).cff_yaml_str
+        self.assertNotEqual(cff1, cff2)
+
     def test_codebase_codemeta_snapshot_is_valid(self):
         CodeMeta(**self.codebase.codemeta_snapshot)
 
@@ -65,6 +125,25 @@ class CodebaseMetadataTestCase(BaseModelTestCase):
         self.assertIn("author", snapshot)
         self.assertIn("description", snapshot)
 
+    def count_release_metadata_queries(self):
+        release = CodebaseRelease.objects.get(pk=self.release1.pk)
+        # count with warm featured image urls so that every count does the same cache reads
+        get_featured_rendition_urls(release.codebase_id)
+        with CaptureQueriesContext(connection) as context:
+            release.codemeta
+            release.datacite
+            release.license_text
+        return len(context.captured_queries)
+
+    def test_release_metadata_queries_do_not_grow_with_contributors(self):
+        baseline = self.count_release_metadata_queries()
+        contributor_factory = ContributorFactory(user=self.submitter)
+        release_contributor_factory = ReleaseContributorFactory(self.release1)
+        release_contributor_factory.index = self.release1.codebase_contributors.count()
+        for contributor in contributor_factory.create_unique_contributors(4):
+            release_contributor_factory.create(contributor)
+        self.assertEqual(self.count_release_metadata_queries(), baseline)
+
     def test_release_datacite_generation(self):
         old_datacite_metadata = self.release1.datacite_temp.dict(serialize=True)
         self.release1.release_notes = "new release notes"
@@ -1,20 +1,50 @@
+import io
 import logging
 import pathlib
 import semver
 import uuid
+from unittest import mock
+
+import PIL.Image
 
 from django.conf import settings
-from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.images import ImageFile
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser, Group
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import assign_perm
+from huey.exceptions import TaskLockedException
 from rest_framework.exceptions import ValidationError
 
 from core.tests.base import UserFactory, BaseModelTestCase
+from ..downloads import (
+    flush_download_counts,
+    reconcile_download_counts,
+    record_download,
+)
+from ..featured_images import (
+    generate_featured_renditions,
+    get_generation_scheduled_key,
+    schedule_featured_renditions,
+)
 from .base import (
     CodebaseFactory,
     ContributorFactory,
     ReleaseContributorFactory,
     ReleaseSetup,
 )
-from ..models import Codebase, CodebaseRelease, License
+from ..metadata import CodeMetaConverter
+from ..models import (
+    Codebase,
+    CodebaseImage,
+    CodebaseRelease,
+    CodebaseReleaseDownload,
+    DataCiteSchema,
+    License,
+    ReleaseContributor,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -88,6 +118,157 @@ class CodebaseTest(BaseModelTestCase):
         review_draft_sip_contents = review_draft.get_fs_api().list_sip_contents()
         self.assertEqual(source_sip_contents, review_draft_sip_contents)
 
+    def test_search_fields(self):
+        release = ReleaseSetup.setUpPublishableDraftRelease(self.c1)
+        release.platform_tags.add("NetLogo")
+        release.save()
+        release.publish()
+        self.c1.refresh_from_db()
+        contributor = release.contributors.first()
+        self.assertIn(contributor.email, self.c1.get_all_contributors_search_fields())
+        self.assertEqual(self.c1.all_release_frameworks, ["NetLogo"])
+        self.assertEqual(self.c1.all_release_programming_languages, ["Python"])
+
+        contributor.family_name = "Renamed"
+        contributor.save()
+        self.c1.refresh_from_db()
+        self.assertIn("Renamed", self.c1.get_all_contributors_search_fields())
+
+        # building search documents should not query per codebase
+        ReleaseSetup.setUpPublishableDraftRelease(
+            Codebase.objects.create(
+                title="Another codebase", identifier="c2", submitter=self.user
+            )
+        ).publish()
+        with CaptureQueriesContext(connection) as context:
+            documents = [
+                (
+                    codebase.get_all_contributors_search_fields(),
+                    codebase.all_release_frameworks,
+                    codebase.all_release_programming_languages,
+                    list(codebase.tags.all()),
+                    codebase.tag_names,
+                )
+                for codebase in Codebase.get_indexed_objects()
+            ]
+        self.assertEqual(len(documents), 2)
+        self.assertLessEqual(len(context.captured_queries), 3)
+
+    def test_accessible(self):
+        def accessible_ids(user):
+            return set(Codebase.objects.accessible(user).values_list("id", flat=True))
+
+        other_user = self.user_factory.create(username="other_user")
+        self.assertEqual(accessible_ids(self.user), {self.c1.id})
+        self.assertEqual(accessible_ids(other_user), set())
+        self.assertEqual(accessible_ids(AnonymousUser()), set())
+        superuser = self.user_factory.create(username="superuser", is_superuser=True)
+        self.assertEqual(accessible_ids(superuser), {self.c1.id})
+
+        group = Group.objects.create(name="reviewers")
+        other_user.groups.add(group)
+        assign_perm("library.view_codebase", group, self.c1)
+        self.assertEqual(accessible_ids(other_user), {self.c1.id})
+
+    def test_download_counts(self):
+        release = self.c1.create_release()
+        flush_download_counts()
+        for _ in range(2):
+            CodebaseReleaseDownload.objects.create(
+                release=release, reason="research", industry="university"
+            )
+            record_download(release.id)
+        self.assertEqual(flush_download_counts(), 2)
+        release.refresh_from_db()
+        self.c1.refresh_from_db()
+        self.assertEqual(release.download_count(), 2)
+        self.assertEqual(self.c1.download_count(), 2)
+        self.assertEqual(reconcile_download_counts(), (0, 0))
+
+        CodebaseRelease.objects.filter(id=release.id).update(download_total=5)
+        Codebase.objects.filter(id=self.c1.id).update(download_total=5)
+        # buffered increments are already counted in the rows and are discarded
+        record_download(release.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reconcile_download_counts(), (1, 1))
+        self.assertEqual(flush_download_counts(), 0)
+        self.c1.refresh_from_db()
+        self.assertEqual(self.c1.download_count(), 2)
+
+    def test_reconcile_download_counts_command_retries_while_locked(self):
+        with mock.patch(
+            "library.management.commands.reconcile_download_counts.reconcile_download_counts",
+            side_effect=[TaskLockedException("locked"), (0, 0)],
+        ) as reconcile:
+            call_command(
+                "reconcile_download_counts", retry_delay=0, stdout=io.StringIO()
+            )
+        self.assertEqual(reconcile.call_count, 2)
+
+    def test_stale_save_keeps_download_total(self):
+        release = self.c1.create_release()
+        stale_release = CodebaseRelease.objects.get(id=release.id)
+        stale_codebase = Codebase.objects.get(id=self.c1.id)
+        CodebaseRelease.objects.filter(id=release.id).update(download_total=3)
+        Codebase.objects.filter(id=self.c1.id).update(download_total=3)
+        stale_release.release_notes = "updated"
+        stale_release.save()
+        stale_codebase.title = "updated"
+        stale_codebase.save()
+        release.refresh_from_db()
+        self.c1.refresh_from_db()
+        self.assertEqual(release.release_notes.raw, "updated")
+        self.assertEqual(release.download_total, 3)
+        self.assertEqual(self.c1.title, "updated")
+        self.assertEqual(self.c1.download_total, 3)
+
+    def test_featured_rendition_url(self):
+        image_file = io.BytesIO()
+        PIL.Image.new("RGB", (1200, 800)).save(image_file, "PNG")
+        # uploads schedule rendition generation once
+        with mock.patch(
+            "library.tasks.generate_featured_renditions"
+        ) as generate, self.captureOnCommitCallbacks(execute=True):
+            image = CodebaseImage.objects.create(
+                codebase=self.c1,
+                title="featured",
+                file=ImageFile(image_file, name="featured.png"),
+                uploaded_by_user=self.user,
+            )
+            with mock.patch.object(
+                CodebaseImage, "get_rendition"
+            ) as get_rendition, mock.patch.object(
+                CodebaseImage, "get_renditions"
+            ) as get_renditions:
+                self.assertIsNone(self.c1.get_featured_rendition_url())
+        self.assertFalse(get_rendition.called)
+        self.assertFalse(get_renditions.called)
+        generate.assert_called_once_with(self.c1.pk)
+
+        generate_featured_renditions(self.c1.pk)
+        self.assertEqual(
+            self.c1.get_featured_rendition_url(),
+            image.get_rendition("max-900x600").url,
+        )
+
+        with mock.patch(
+            "library.tasks.rebuild_codebase_release_metadata"
+        ) as rebuild, self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        rebuild.assert_called_once_with(self.c1.pk)
+        self.assertIsNone(self.c1.get_featured_rendition_url())
+
+    def test_rolled_back_rendition_scheduling_does_not_block_generation(self):
+        cache.delete(get_generation_scheduled_key(self.c1.pk))
+        with mock.patch("library.tasks.generate_featured_renditions") as generate:
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                schedule_featured_renditions(self.c1.pk)
+                raise DatabaseError("rolled back")
+            self.assertIsNone(cache.get(get_generation_scheduled_key(self.c1.pk)))
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_featured_renditions(self.c1.pk)
+        generate.assert_called_once_with(self.c1.pk)
+
 
 class CodebaseReleaseTest(BaseModelTestCase):
     def get_perm_str(self, perm_prefix):
@@ -227,6 +408,32 @@ class CodebaseReleaseTest(BaseModelTestCase):
             self.assertEqual(crc.index, rc.index)
             self.assertEqual(crc.roles, rc.roles)
 
+    def test_contributor_views(self):
+        release_contributor_factory = ReleaseContributorFactory(self.codebase_release)
+        contributor_factory = ContributorFactory(user=self.submitter)
+        for contributor in contributor_factory.create_unique_contributors(5):
+            release_contributor_factory.create(contributor, randomize_role=True)
+        context = self.codebase_release.metadata_context
+        contributors = context.contributors
+        self.assertFalse(hasattr(contributors[0], "__dict__"))
+        with self.assertNumQueries(0):
+            CodeMetaConverter.convert_contributors(
+                context.author_release_contributors, "author"
+            )
+            DataCiteSchema.to_citable_authors(context.author_release_contributors)
+            contributor_names = self.codebase_release.contributor_names
+        self.assertEqual(
+            contributor_names,
+            [
+                rc.contributor.get_full_name()
+                for rc in ReleaseContributor.objects.for_release(self.codebase_release)
+                if rc.contributor.has_name
+            ],
+        )
+        self.assertEqual(
+            [c.index for c in contributors], sorted(c.index for c in contributors)
+        )
+
     def test_metadata_completeness(self):
         # make sure release contributors are empty since we currently automatically add the submitter as an author
         self.codebase_release.contributors.all().delete()
@@ -1,8 +1,13 @@
+import json
+from unittest import mock
+
 from django.contrib.auth.models import User
+from django_redis import get_redis_connection
 import rest_framework.exceptions as rf
 
 from core.tests.base import BaseModelTestCase
-from ..models import Codebase
+from .. import downloads
+from ..models import Codebase, CodebaseReleaseDownload
 from ..serializers import (
     ContributorSerializer,
     ReleaseContributorSerializer,
@@ -126,10 +131,12 @@ class SerializerTestCase(BaseModelTestCase):
         self.assertEqual(release_contributors[0].index, 0)
         self.assertEqual(release_contributors[1].index, 1)
 
-    def test_download_request_create(self):
+    @mock.patch("library.tasks.process_download_events.schedule")
+    def test_download_request_records_download(self, schedule):
         codebase = self.create_codebase(title="Download Request Codebase")
         release = codebase.releases.last()
         user = self.user
+        get_redis_connection("default").delete(downloads.DOWNLOAD_EVENTS_KEY)
         data = {
             "ip_address": "127.0.0.1",
             "referrer": "https://comses.net",
@@ -141,8 +148,11 @@ class SerializerTestCase(BaseModelTestCase):
             "save_to_profile": True,
         }
         download_request = DownloadRequestSerializer(data=data)
-        download_request.is_valid()
-        crs = download_request.save()
+        download_request.is_valid(raise_exception=True)
+        download_request.enqueue()
+        with self.captureOnCommitCallbacks(execute=False):
+            self.assertEqual(downloads.process_download_events(), 1)
+        crs = CodebaseReleaseDownload.objects.get(release=release)
         user.refresh_from_db()
         self.assertEqual(data["industry"], user.member_profile.industry)
         self.assertTrue(data["affiliation"] in user.member_profile.affiliations)
@@ -151,7 +161,8 @@ class SerializerTestCase(BaseModelTestCase):
         self.assertEqual(user, crs.user)
         self.assertEqual(release, crs.release)
 
-    def test_invalid_download_request_raises_validation_error(self):
+    @mock.patch("library.tasks.process_download_events.schedule")
+    def test_invalid_download_request_raises_validation_error(self, schedule):
         codebase = self.create_codebase(title="Download Request Codebase 2")
         release = codebase.releases.last()
         user = self.user
@@ -162,13 +173,111 @@ class SerializerTestCase(BaseModelTestCase):
             "release": release.id,
             "reason": "policy",
             "industry": "university",
-            "affiliation": {"name": "ASU", "url": "www.foo.org", "ror_id": "foo8j8sd"},
+            "affiliation": {"name": "ASU", "url": "https://asu.edu/"},
             "save_to_profile": True,
         }
+        # the profile update is validated with the affiliations the profile already has
+        member_profile = user.member_profile
+        member_profile.affiliations = [
+            {"name": "Foo", "url": "www.foo.org", "ror_id": "foo8j8sd"}
+        ]
+        member_profile.save()
         download_request = DownloadRequestSerializer(data=data)
-        download_request.is_valid()
+        download_request.is_valid(raise_exception=True)
         with self.assertRaises(rf.ValidationError):
-            download_request.save()
+            download_request.enqueue()
+        schedule.assert_not_called()
+
+    @mock.patch("library.tasks.process_download_events.schedule")
+    def test_download_request_enqueue(self, schedule):
+        codebase = self.create_codebase(title="Queued Download Request Codebase")
+        release = codebase.releases.last()
+        get_redis_connection("default").delete(
+            downloads.DOWNLOAD_EVENTS_KEY, downloads.DOWNLOAD_EVENTS_SCHEDULED_KEY
+        )
+        data = {
+            "ip_address": "127.0.0.1",
+            "referrer": "https://comses.net",
+            "user": self.user.id,
+            "release": release.id,
+            "reason": "education",
+            "industry": "university",
+            "affiliation": {"name": "ASU", "url": "https://asu.edu/"},
+            "save_to_profile": True,
+        }
+        for _ in range(3):
+            download_request = DownloadRequestSerializer(data=data)
+            download_request.is_valid(raise_exception=True)
+            download_request.enqueue()
+        schedule.assert_called_once()
+        self.assertFalse(
+            CodebaseReleaseDownload.objects.filter(release=release).exists()
+        )
+
+        with self.captureOnCommitCallbacks(execute=False):
+            self.assertEqual(downloads.process_download_events(), 3)
+        self.assertEqual(downloads.get_pending_download_event_count(), 0)
+        self.assertEqual(
+            CodebaseReleaseDownload.objects.filter(
+                release=release, user=self.user, reason="education"
+            ).count(),
+            3,
+        )
+        self.user.member_profile.refresh_from_db()
+        self.assertEqual(
+            [a["name"] for a in self.user.member_profile.affiliations].count("ASU"), 1
+        )
+
+        data["affiliation"] = {
+            "name": "ASU",
+            "url": "www.foo.org",
+            "ror_id": "foo8j8sd",
+        }
+        download_request = DownloadRequestSerializer(data=data)
+        download_request.is_valid(raise_exception=True)
+        with self.assertRaises(rf.ValidationError):
+            download_request.enqueue()
+
+    @mock.patch("library.tasks.process_download_events.schedule")
+    def test_download_events_are_recorded_once(self, schedule):
+        codebase = self.create_codebase(title="Redelivered Download Codebase")
+        release = codebase.releases.last()
+        connection = get_redis_connection("default")
+        connection.delete(
+            downloads.DOWNLOAD_EVENTS_KEY,
+            downloads.DOWNLOAD_EVENTS_SCHEDULED_KEY,
+            downloads.DOWNLOAD_EVENTS_DEAD_LETTER_KEY,
+        )
+        event = {
+            "release_id": release.id,
+            "reason": "education",
+            "industry": "university",
+        }
+        downloads.enqueue_download_event(event)
+        # malformed events and events the database rejects are dead lettered
+        for invalid_event in ({"reason": "education"}, {**event, "reason": "x" * 600}):
+            connection.xadd(
+                downloads.DOWNLOAD_EVENTS_KEY, {"event": json.dumps(invalid_event)}
+            )
+        with self.captureOnCommitCallbacks(execute=False):
+            self.assertEqual(downloads.process_download_events(), 1)
+        self.assertEqual(connection.xlen(downloads.DOWNLOAD_EVENTS_DEAD_LETTER_KEY), 2)
+        self.assertEqual(downloads.get_pending_download_event_count(), 0)
+
+        # an entry that was recorded but not acknowledged is skipped when delivered again
+        connection.xadd(downloads.DOWNLOAD_EVENTS_KEY, {"event": json.dumps(event)})
+        with self.captureOnCommitCallbacks(execute=False):
+            self.assertEqual(
+                downloads.record_entries(
+                    connection, connection.xrange(downloads.DOWNLOAD_EVENTS_KEY)
+                ),
+                1,
+            )
+            self.assertEqual(downloads.process_download_events(), 0)
+        self.assertEqual(
+            CodebaseReleaseDownload.objects.filter(release=release).count(), 2
+        )
+        connection.delete(downloads.DOWNLOAD_EVENTS_DEAD_LETTER_KEY)
 
     def test_multiple_release_contributor_same_user_raises_validation_error(self):
         codebase = Codebase.objects.create(
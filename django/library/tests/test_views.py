@@ -1,15 +1,21 @@
 import io
 import pathlib
 import shutil
+from unittest import mock
 
 from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from guardian.shortcuts import assign_perm
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
+from wagtail.search.backends.elasticsearch7 import Elasticsearch7SearchResults
 
+from core.search_backends import FacetedSearchResults
 from core.tests.base import UserFactory
 from core.tests.permissions_base import (
     BaseViewSetTestCase,
@@ -17,9 +23,11 @@ from core.tests.permissions_base import (
     ResponseStatusCodesMixin,
     ApiAccountMixin,
 )
+from core.view_helpers import invalidate_search_results
 from library.forms import PeerReviewerFeedbackReviewerForm
-from library.fs import FileCategoryDirectories
+from library.fs import ArchiveBuildStatus, FileCategoryDirectories
 from library.models import Codebase, CodebaseRelease, License, PeerReview
+from library.release_page import load_release_page_context
 from library.tests.base import ReviewSetup
 from .base import (
     CodebaseFactory,
@@ -626,6 +634,112 @@ class CodebaseReleaseRenderPageTestCase(TestCase):
         )
         self.assertTrue(response.status_code, True)
 
+    def test_detail_context_cached_for_anonymous_visitors(self):
+        release = CodebaseFactory(submitter=self.submitter).create_published_release(
+            codebase=self.codebase
+        )
+        url = release.get_absolute_url()
+        with mock.patch(
+            "library.release_page.load_release_page_context",
+            side_effect=load_release_page_context,
+        ) as load:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(load.call_count, 1)
+            self.codebase.title = "Updated title"
+            with self.captureOnCommitCallbacks(execute=True):
+                self.codebase.save()
+            response = self.client.get(url)
+            self.assertEqual(load.call_count, 2)
+            self.client.force_login(self.submitter)
+            self.client.get(url)
+            self.assertEqual(load.call_count, 3)
+        self.assertContains(response, "Updated title")
+
+    def test_detail_context_invalidated_when_submitter_name_changes(self):
+        release = CodebaseFactory(submitter=self.submitter).create_published_release(
+            codebase=self.codebase
+        )
+        url = release.get_absolute_url()
+        with mock.patch(
+            "library.release_page.load_release_page_context",
+            side_effect=load_release_page_context,
+        ) as load:
+            self.client.get(url)
+            self.submitter.first_name = "Renamed"
+            with self.captureOnCommitCallbacks(execute=True):
+                self.submitter.save()
+            self.client.get(url)
+            self.assertEqual(load.call_count, 2)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.submitter.member_profile.save()
+            self.client.get(url)
+            self.assertEqual(load.call_count, 3)
+
+    def test_release_page_context_loaded_in_fixed_number_of_queries(self):
+        release = CodebaseFactory(submitter=self.submitter).create_published_release(
+            codebase=self.codebase
+        )
+
+        def get_release():
+            return CodebaseRelease.objects.with_codebase().get(pk=release.pk)
+
+        load_release_page_context(get_release())
+        baseline_release = get_release()
+        with CaptureQueriesContext(connection) as queries:
+            load_release_page_context(baseline_release)
+        # more contributors and releases should not add queries
+        contributors = ContributorFactory(self.submitter).create_unique_contributors(3)
+        for index, contributor in enumerate(contributors, start=1):
+            ReleaseContributorFactory(release).create(contributor, index=index)
+        CodebaseFactory(submitter=self.submitter).create_published_release(
+            codebase=self.codebase
+        )
+        release = get_release()
+        with self.assertNumQueries(len(queries)):
+            load_release_page_context(release)
+
+
+class CodebaseReleaseDownloadTestCase(TestCase):
+    def setUp(self):
+        self.submitter = UserFactory().create()
+        self.codebase_release = CodebaseFactory(
+            submitter=self.submitter
+        ).create_published_release()
+        self.fs_api = self.codebase_release.get_fs_api()
+        self.fs_api.archivepath.unlink(missing_ok=True)
+        self.fs_api.invalidate_archive_build()
+        self.url = reverse(
+            "library:codebaserelease-download",
+            kwargs={
+                "identifier": self.codebase_release.codebase.identifier,
+                "version_number": self.codebase_release.version_number,
+            },
+        )
+
+    def test_download_pending_until_archive_is_built(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response["X-Archive-Build-Status"], "pending")
+        self.assertIn("Retry-After", response)
+        self.assertEqual(len(callbacks), 1)
+
+        self.fs_api.build_published_archive(force=True)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(str(self.fs_api.archive_uri), response["X-Accel-Redirect"])
+
+    def test_download_reports_failed_build(self):
+        token = self.fs_api.request_archive_build()
+        self.fs_api.set_archive_build_status(ArchiveBuildStatus.failed, token)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["X-Archive-Build-Status"], "failed")
+
+    def tearDown(self):
+        self.fs_api.invalidate_archive_build()
+
 
 class CodebaseSearchTestCase(TestCase):
     def setUp(self):
@@ -641,6 +755,36 @@ class CodebaseSearchTestCase(TestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_list_facets_single_request(self):
+        CodebaseFactory(submitter=self.submitter).create_published_release(
+            codebase=self.codebase
+        )
+        self.codebase.tags.add("predation")
+        self.codebase.save()
+        call_command("update_index", verbosity=0)
+        invalidate_search_results(Codebase)
+        with mock.patch.object(
+            FacetedSearchResults,
+            "_backend_do_search",
+            autospec=True,
+            side_effect=FacetedSearchResults._backend_do_search,
+        ) as do_search, mock.patch.object(
+            Elasticsearch7SearchResults,
+            "_do_count",
+            autospec=True,
+            side_effect=Elasticsearch7SearchResults._do_count,
+        ) as do_count:
+            response = self.client.get(
+                reverse("library:codebase-list"), HTTP_ACCEPT="text/html"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(do_search.call_count, 1)
+        self.assertFalse(do_count.called)
+        content = response.content.decode()
+        self.assertIn("data-language-facets", content)
+        self.assertIn("data-tag-facets", content)
+        self.assertIn("data-peer-review-facets", content)
+
 
 class PeerReviewInvitationTestCase(ReviewSetup, ResponseStatusCodesMixin, TestCase):
     @classmethod
@@ -53,7 +53,12 @@ from .forms import (
     PeerReviewerFeedbackEditorForm,
     PeerReviewFilterForm,
 )
-from .fs import FileCategoryDirectories, StagingDirectories, MessageLevels
+from .fs import (
+    ArchiveBuildStatus,
+    FileCategoryDirectories,
+    StagingDirectories,
+    MessageLevels,
+)
 from .models import (
     Codebase,
     CodebaseRelease,
@@ -67,6 +72,8 @@ from .models import (
     ReviewStatus,
 )
 from .permissions import CodebaseReleaseUnpublishedFilePermissions
+from .release_page import get_release_page_context, invalidate_release_page_context
+from .tasks import enqueue_archive_build
 from .serializers import (
     CodebaseSerializer,
     CodebaseReleaseSerializer,
@@ -385,6 +392,26 @@ def list_review_event_log(request, slug):
 
 
 class CodebaseFilter(filters.BaseFilterBackend):
+    # facets computed for html list pages alongside the requested page of results
+    FACET_FIELDS = ("all_release_programming_languages", "tag_names", "peer_reviewed")
+
+    def get_page_limits(self, request, view):
+        """
+        :return: (start, stop) of the page of results the view's paginator will request, if any
+        """
+        paginator = getattr(view, "paginator", None)
+        if paginator is None:
+            return None
+        page_size = paginator.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            page = max(1, int(request.query_params.get(paginator.page_query_param, 1)))
+        except ValueError:
+            page = 1
+        start = (page - 1) * page_size
+        return start, start + page_size
+
     def filter_queryset(self, request, queryset, view):
         if view.action != "list":
             return queryset
@@ -432,11 +459,19 @@ class CodebaseFilter(filters.BaseFilterBackend):
             )
             criteria.update(id__in=codebases.values_list("id", flat=True))
 
+        facet_fields = None
+        if request.accepted_renderer.format == "html":
+            facet_fields = self.FACET_FIELDS
+
+        # the list queryset only includes public codebases so results can be shared between users
         return get_search_queryset(
             query_params,
             queryset,
             tags=tags,
             criteria=criteria,
+            cache_results=True,
+            facet_fields=facet_fields,
+            page_limits=self.get_page_limits(request, view),
         )
 
 
@@ -471,12 +506,25 @@ class CodebaseViewSet(SpamCatcherViewSetMixin, CommonViewSetMixin, HtmlNoDeleteV
         if request.accepted_renderer.format == "html":
             context = self.get_list_context(page or queryset)
 
-            language_facets = queryset.facet("all_release_programming_languages")
+            # facets are fetched along with the page of results, see CodebaseFilter
+            facets = queryset.facets()
+            language_facets = facets.get("all_release_programming_languages")
             if language_facets:
                 logger.debug(
                     "Appending language_facets to response: %s", language_facets
                 )
                 context["language_facets"] = json.dumps(language_facets)
+            tag_facets = facets.get("tag_names")
+            if tag_facets:
+                context["tag_facets"] = json.dumps(tag_facets)
+            peer_review_facets = facets.get("peer_reviewed")
+            if peer_review_facets:
+                context["peer_review_facets"] = json.dumps(
+                    {
+                        "reviewed": peer_review_facets.get("true", 0),
+                        "not_reviewed": peer_review_facets.get("false", 0),
+                    }
+                )
 
             return Response(context)
 
@@ -605,6 +653,7 @@ class CodebaseImageViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
         codebaseimage = self.get_object()
         codebaseimage.file.storage.delete(codebaseimage.file.path)
         codebaseimage.delete()
+        invalidate_release_page_context(codebaseimage.codebase_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=["delete"])
@@ -613,6 +662,7 @@ class CodebaseImageViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
         for codebase_image in codebase.featured_images.all():
             codebase_image.file.storage.delete(codebase_image.file.path)
             codebase_image.delete()
+        invalidate_release_page_context(codebase.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -670,32 +720,68 @@ class NestedCodebaseReleaseUnpublishedFilesPermission(permissions.BasePermission
         return True
 
 
+ARCHIVE_BUILD_RETRY_AFTER = 5
+
+
+def build_archive_pending_response(build_status: ArchiveBuildStatus):
+    """
+    Returns a 202 Accepted response for an archive that is still being built, or a 503 Service Unavailable
+    response if the last build failed and is being retried. Clients should retry the same download URL after
+    Retry-After seconds, browsers do so automatically via the Refresh header.
+    """
+    if build_status == ArchiveBuildStatus.failed:
+        response = HttpResponse(
+            "This archive could not be prepared for download, we are trying again. Please try again shortly.",
+            content_type="text/plain",
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    else:
+        response = HttpResponse(
+            "This archive is being prepared for download, please try again in a few seconds.",
+            content_type="text/plain",
+            status=status.HTTP_202_ACCEPTED,
+        )
+    response["Retry-After"] = ARCHIVE_BUILD_RETRY_AFTER
+    response["Refresh"] = ARCHIVE_BUILD_RETRY_AFTER
+    response["X-Archive-Build-Status"] = build_status.value if build_status else ""
+    return response
+
+
 def build_archive_download_response(codebase_release, review_archive=False):
     """
     Returns an HttpResponse object that uses nginx to serve our codebase archive zipfiles.
     (https://www.nginx.com/resources/wiki/start/topics/examples/x-accel/)
+
+    Archives are never built inside the request: if the requested archive is missing (or the review archive digest
+    no longer matches the release's files and metadata) an asynchronous build is scheduled and a 202 response is
+    returned until the archive is ready.
     :param codebase_release: The specific CodebaseRelease instance archive to download
-    :param review_archive: when true we force a rebuild of the CodebaseRelease archive and use the review archive URI
-    which is basically just review_archive.zip instead of archive.zip
+    :param review_archive: when true we serve the review archive (review_archive.zip) instead of archive.zip
     :return:
     """
     fs_api = codebase_release.get_fs_api()
+    if review_archive:
+        archive_uri = fs_api.review_archive_uri
+        # the review archive is reused as long as its digest matches the current sip and metadata
+        is_ready = fs_api.has_current_review_archive()
+    else:
+        archive_uri = fs_api.archive_uri
+        is_ready = fs_api.archivepath.exists()
+        if not is_ready and not codebase_release.live:
+            # only published releases get a published archive built on demand
+            raise FileNotFoundError
+
+    if not is_ready:
+        build_status = enqueue_archive_build(
+            codebase_release, review_archive=review_archive
+        )
+        return build_archive_pending_response(build_status)
+
     response = HttpResponse()
     response["Content-Type"] = ""
     response["Content-Disposition"] = "attachment; filename={}".format(
         codebase_release.archive_filename
     )
-    # response['Content-Length'] = fs_api.archive_size
-    archive_uri = fs_api.archive_uri
-    archive_absolute_path = fs_api.archivepath
-    if review_archive:
-        fs_api.build_review_archive()
-        archive_absolute_path = fs_api.review_archivepath
-        archive_uri = fs_api.review_archive_uri
-    #    response['Content-Length'] = fs_api.review_archive_size
-
-    if not archive_absolute_path.exists():
-        raise FileNotFoundError
     response["X-Accel-Redirect"] = "/library/internal/{0}".format(archive_uri)
     return response
 
@@ -792,9 +878,7 @@ class CodebaseReleaseViewSet(CommonViewSetMixin, NoDeleteViewSet):
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         if request.accepted_renderer.format == "html":
-            perms = {}
-            add_user_retrieve_perms(instance, perms, request.user)
-            return Response({"release": instance, **perms})
+            return Response(get_release_page_context(instance, request.user))
         serializer = self.get_serializer(instance)
         data = add_user_retrieve_perms(instance, serializer.data, request.user)
         return Response(data)
@@ -810,6 +894,7 @@ class CodebaseReleaseViewSet(CommonViewSetMixin, NoDeleteViewSet):
                 queryset.accessible(user=self.request.user)
                 .with_submitter()
                 .with_codebase()
+                .select_related("review")
             )
 
     @action(detail=True, methods=["put"])
@@ -824,6 +909,7 @@ class CodebaseReleaseViewSet(CommonViewSetMixin, NoDeleteViewSet):
         )
         crs.is_valid(raise_exception=True)
         crs.save()
+        codebase_release.clear_metadata_cache()
         # re-generate codemeta for the parent codebase and only this release
         codebase_release.codebase.save(rebuild_release_metadata=False)
         codebase_release.save()
@@ -942,10 +1028,9 @@ class CodebaseReleaseViewSet(CommonViewSetMixin, NoDeleteViewSet):
             )
 
     @action(detail=True, methods=["post"], permission_classes=[AllowAny])
-    @transaction.atomic
     def request_download(self, request, **kwargs):
         """
-        Save a download request form and redirect to the download URL
+        Validate a download request form and queue it to be recorded, see library.downloads
         """
         user = request.user if request.user.is_authenticated else None
         download_request = request.data
@@ -965,7 +1050,7 @@ class CodebaseReleaseViewSet(CommonViewSetMixin, NoDeleteViewSet):
 
         try:
             response = Response(status=status.HTTP_201_CREATED)
-            serializer.save()  # records the download + metadata
+            serializer.enqueue()  # records the download + metadata in the background
         except FileNotFoundError:
             logger.error(
                 "Unable to find archive for codebase release %s (%s)",
@@ -998,7 +1083,7 @@ class CodebaseReleaseViewSet(CommonViewSetMixin, NoDeleteViewSet):
     def download_preview(self, request, **kwargs):
         codebase_release = self.get_object()
         fs_api = codebase_release.get_fs_api()
-        contents = fs_api.list_sip_contents()
+        contents = fs_api.get_file_index_tree()
         return Response(data=contents, status=status.HTTP_200_OK)
 
 
@@ -1051,7 +1136,15 @@ class BaseCodebaseReleaseFilesViewSet(viewsets.GenericViewSet):
         codebase_release = self.get_object()
         api = codebase_release.get_fs_api()
         category = self.get_category()
-        data = api.list(stage=self.stage, category=category)
+        indexed_files = api.get_file_index(stage=self.stage, category=category)
+        # only paginate when explicitly requested to keep the unpaginated response format for existing clients
+        page = None
+        if self.paginator.page_query_param in request.query_params:
+            page = self.paginate_queryset(indexed_files)
+        data = [
+            indexed_file.relpath
+            for indexed_file in (indexed_files if page is None else page)
+        ]
         if self.stage == StagingDirectories.originals:
             data = [
                 {
@@ -1060,6 +1153,8 @@ class BaseCodebaseReleaseFilesViewSet(viewsets.GenericViewSet):
                 }
                 for path in data
             ]
+        if page is not None:
+            return self.get_paginated_response(data)
         return Response(data=data, status=status.HTTP_200_OK)
 
     def get_object(self, queryset=None):
@@ -6,7 +6,7 @@ import CodebaseListSidebar from "@/components/CodebaseListSidebar.vue";
 import SortBy from "@/components/ListSortBy.vue";
 import { extractDataParams } from "@/util";
 
-const props = extractDataParams("sidebar", ["languageFacets"]);
+const props = extractDataParams("sidebar", ["languageFacets", "tagFacets", "peerReviewFacets"]);
 createApp(CodebaseListSidebar, props).mount("#sidebar");
 
 // Function to check if 'query' exists and is not empty